@@ -0,0 +1,183 @@
+"""Per-collar rate limiting and load shedding for ingest.
+
+Every ingest request costs one token from each of its collars' buckets
+(COLLAR_RATE_PER_SECOND, up to COLLAR_RATE_BURST), so a collar stuck
+posting in a loop is cut off while a backlog flushed as one batch is not.
+Buckets live in this process or, with RATE_LIMIT_BACKEND=redis, in Redis
+so all workers share them.
+
+AdmissionController watches event-loop lag, smoothed so one slow tick
+(e.g. at startup) doesn't count, and in-flight ingest requests. Past
+ADMISSION_LAG_MS or ADMISSION_MAX_INFLIGHT it sheds low-priority work (the
+Redis latest cache, analytics). New ingest carries the interventions, so it
+is only turned away past twice those and with the in-flight count at its
+bound too: lag alone may be a stall of this process, not a backlog. Levels
+drop again once the load has stayed under the lower bound for
+ADMISSION_HOLD_SECONDS.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import (
+    ADMISSION_HOLD_SECONDS, ADMISSION_LAG_MS, ADMISSION_LAG_SMOOTHING, ADMISSION_MAX_INFLIGHT, COLLAR_RATE_BURST,
+    COLLAR_RATE_PER_SECOND
+)
+from metrics import ADMISSION_SHED, ADMISSION_SHED_LEVEL, COLLAR_RATE_LIMITED, EVENT_LOOP_LAG_SECONDS
+
+# Shed levels
+NORMAL = 0
+SHED_LOW = 1
+SHED_ALL = 2
+
+# Work priorities: work is shed once the level reaches its priority
+LOW = SHED_LOW
+HIGH = SHED_ALL
+
+# Token bucket as a Redis script: KEYS[1] bucket; ARGV rate, burst, now, cost.
+# Returns 1 if admitted, else 0.
+TOKEN_BUCKET_LUA = """
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local admitted = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    admitted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return admitted
+"""
+
+
+class MemoryRateLimiter:
+    def __init__(self, rate: float = COLLAR_RATE_PER_SECOND, burst: float = COLLAR_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        # collar_id -> (tokens, updated at)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._next_sweep = time.monotonic() + 60
+
+    async def allow_many(self, collar_ids: List[str]) -> np.ndarray:
+        """One token per collar; returns which collars were admitted."""
+        now = time.monotonic()
+        admitted = np.ones(len(collar_ids), dtype=bool)
+        for i, collar_id in enumerate(collar_ids):
+            tokens, at = self._buckets.get(collar_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                admitted[i] = False
+            self._buckets[collar_id] = (tokens, now)
+
+        if now >= self._next_sweep:
+            # Buckets that have refilled are the same as no bucket
+            full_after = self.burst / self.rate
+            for collar_id in [key for key, (_, at) in self._buckets.items() if now - at > full_after]:
+                del self._buckets[collar_id]
+            self._next_sweep = now + 60
+        COLLAR_RATE_LIMITED.inc(int((~admitted).sum()))
+        return admitted
+
+
+class RedisRateLimiter:
+    def __init__(self, redis_client, rate: float = COLLAR_RATE_PER_SECOND, burst: float = COLLAR_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.script = redis_client.register_script(TOKEN_BUCKET_LUA)
+
+    async def allow_many(self, collar_ids: List[str]) -> np.ndarray:
+        now = time.time()
+        results = await asyncio.gather(*(
+            self.script(keys=[f"collar:{collar_id}:rate"], args=[self.rate, self.burst, now, 1])
+            for collar_id in collar_ids
+        ))
+        admitted = np.array([bool(result) for result in results], dtype=bool)
+        COLLAR_RATE_LIMITED.inc(int((~admitted).sum()))
+        return admitted
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        lag_ms: float = ADMISSION_LAG_MS,
+        max_inflight: int = ADMISSION_MAX_INFLIGHT,
+        hold_seconds: float = ADMISSION_HOLD_SECONDS,
+        lag_smoothing: float = ADMISSION_LAG_SMOOTHING,
+        sample_seconds: float = 0.1
+    ):
+        self.lag_ms = lag_ms
+        self.max_inflight = max_inflight
+        self.hold_seconds = hold_seconds
+        self.lag_smoothing = lag_smoothing
+        self.sample_seconds = sample_seconds
+        self.level = NORMAL
+        # Last sample and its EWMA; levels follow the EWMA
+        self.lag = 0.0
+        self.smoothed_lag = 0.0
+        self.inflight = 0
+        self._raised_at = 0.0
+        ADMISSION_SHED_LEVEL.set(NORMAL)
+
+    def _pressure_level(self) -> int:
+        inflight_load = self.inflight / self.max_inflight
+        load = max(self.smoothed_lag * 1000 / self.lag_ms, inflight_load)
+        if load >= 2 and inflight_load >= 1:
+            return SHED_ALL
+        if load >= 1:
+            return SHED_LOW
+        return NORMAL
+
+    def update(self):
+        level = self._pressure_level()
+        now = time.monotonic()
+        if level >= self.level:
+            if level > NORMAL:
+                self._raised_at = now
+            self._set_level(level)
+        elif now - self._raised_at >= self.hold_seconds:
+            self._set_level(level)
+
+    def _set_level(self, level: int):
+        if level != self.level:
+            print(
+                f"Admission level {self.level} -> {level} "
+                f"(loop lag {self.smoothed_lag * 1000:.0f} ms, {self.inflight} in flight)"
+            )
+            self.level = level
+            ADMISSION_SHED_LEVEL.set(level)
+
+    def admit(self, priority: int, work: str) -> bool:
+        """Whether to do `work` now; counts it as shed if not."""
+        if self.level < priority:
+            return True
+        ADMISSION_SHED.labels(work).inc()
+        return False
+
+    @contextmanager
+    def track(self):
+        """Count an ingest request as in flight."""
+        self.inflight += 1
+        self.update()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+
+    async def run(self):
+        """Sample event-loop lag: how late a short sleep wakes up."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.sample_seconds)
+            self.lag = max(0.0, loop.time() - started - self.sample_seconds)
+            self.smoothed_lag += self.lag_smoothing * (self.lag - self.smoothed_lag)
+            EVENT_LOOP_LAG_SECONDS.set(self.lag)
+            self.update()
@@ -0,0 +1,715 @@
+"""Offline benchmark suite for inference, ingest, analytics, websocket fan-out, list serialization, startup and worker memory.
+
+    python benchmarks.py run [--only inference,ingest,websocket,analytics,serialization,startup,workers] [--quick]
+    python benchmarks.py compare BASELINE.json CANDIDATE.json [--threshold 0.1]
+
+Runs against a throwaway SQLite file unless --database-url points at a local
+Postgres, with an in-process Redis stand-in and the CSVs in ../ml. Inputs are
+drawn from the dataset with a fixed seed, so runs are comparable across
+commits. Results are JSON keyed by benchmark and metric. `compare` flags
+metrics that got worse by more than the threshold. Metrics ending in
+_per_second are higher-is-better and metrics ending in _ms lower-is-better.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from prefork import memory_mb
+
+ML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml")
+DATASET_CSV = os.path.join(ML_DIR, "dog_aggression_dataset.csv")
+SEED = 42
+
+BENCHMARKS = ("inference", "ingest", "websocket", "analytics", "serialization", "startup", "workers")
+
+
+class InMemoryRedis:
+    """Just enough of redis.asyncio.Redis for the API paths under benchmark."""
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key):
+        return self._data.get(key)
+
+    async def mget(self, keys):
+        return [self._data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, **kwargs):
+        self._data[key] = value
+        return True
+
+    async def setex(self, key, ttl, value):
+        self._data[key] = value
+        return True
+
+    async def delete(self, *keys):
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def ping(self):
+        return True
+
+
+def summarize(samples: List[float]) -> dict:
+    """Latency percentiles in milliseconds from samples in seconds."""
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+    }
+
+
+def load_dataset() -> pd.DataFrame:
+    return pd.read_csv(DATASET_CSV)
+
+
+def sample_rows(df: pd.DataFrame, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    return df.iloc[rng.integers(0, len(df), n)].reset_index(drop=True)
+
+
+def reading_columns(sample: pd.DataFrame) -> Dict[str, np.ndarray]:
+    # Same layout as wire_format.to_columns: float columns, NaN for missing
+    from wire_format import ENUM_FIELDS, FLOAT_FIELDS
+
+    columns = {
+        name: sample[name].to_numpy(np.float64) if name in sample else np.full(len(sample), np.nan)
+        for name in FLOAT_FIELDS
+    }
+    for name in (*ENUM_FIELDS, "other_dogs_nearby"):
+        columns[name] = sample[name].to_numpy(np.float64)
+    return columns
+
+
+def reading_payloads(sample: pd.DataFrame, dogs: List[Tuple[str, str]], rng: np.random.Generator) -> List[dict]:
+    """/sensor-data request bodies (enum names, None for codes outside the enums)."""
+    from wire_format import ENUM_FIELDS, FLOAT_FIELDS, enum_names
+
+    tables = {name: enum_names(enum_cls) for name, enum_cls in ENUM_FIELDS.items()}
+    picks = rng.integers(0, len(dogs), len(sample))
+    payloads = []
+    for i, row in enumerate(sample.itertuples(index=False)):
+        dog_id, collar_id = dogs[picks[i]]
+        payload = {"dog_id": dog_id, "collar_id": collar_id}
+        for name in FLOAT_FIELDS:
+            value = getattr(row, name, None)
+            payload[name] = None if value is None or pd.isna(value) else float(value)
+        for name, table in tables.items():
+            payload[name] = table[int(getattr(row, name))]
+        payload["other_dogs_nearby"] = int(row.other_dogs_nearby)
+        payloads.append(payload)
+    return payloads
+
+
+def create_dogs(db, count: int, rng: np.random.Generator) -> List[Tuple[str, str]]:
+    from models import Collar, Dog, Sex, SterilizationStatus
+
+    dogs = []
+    for i in range(count):
+        dog = Dog(
+            id=str(uuid.uuid4()),
+            name=f"bench-{i}",
+            age_years=int(rng.integers(1, 9)),
+            sex=Sex(int(rng.integers(0, 2))),
+            sterilization_status=SterilizationStatus(int(rng.integers(0, 2)))
+        )
+        collar = Collar(id=str(uuid.uuid4()), device_id=f"bench-{uuid.uuid4().hex}", dog_id=dog.id)
+        db.add_all([dog, collar])
+        dogs.append((dog.id, collar.id))
+    db.commit()
+    return dogs
+
+
+# Benchmarks
+
+def bench_inference(ml_service, df: pd.DataFrame, rows: int, rng: np.random.Generator) -> dict:
+    from collar_registry import DogProfile
+    from schemas import SensorDataCreate
+
+    if not ml_service.sess:
+        return {"skipped": "model not loaded"}
+
+    sample = sample_rows(df, rows, rng)
+    readings = [
+        SensorDataCreate(**payload)
+        for payload in reading_payloads(sample, [("bench-dog", "bench-collar")], rng)
+    ]
+    profiles = [
+        DogProfile(int(row.age_years), int(row.sex), int(row.sterilization_status))
+        for row in sample.itertuples(index=False)
+    ]
+
+    async def per_row():
+        latencies = []
+        for reading, profile in zip(readings, profiles):
+            started = time.perf_counter()
+            await ml_service.predict_aggression(reading, profile)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    latencies = asyncio.run(per_row())
+    result = {
+        "rows": rows,
+        "per_row_rows_per_second": round(len(latencies) / sum(latencies), 1),
+        **{f"per_row_{key}": value for key, value in summarize(latencies).items()}
+    }
+
+    columns = reading_columns(sample)
+    columns.update({
+        "age_years": sample["age_years"].to_numpy(np.float64),
+        "sex": sample["sex"].to_numpy(np.float64),
+        "sterilization_status": sample["sterilization_status"].to_numpy(np.float64)
+    })
+    for batch_size in (100, 1000, 10000):
+        started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            ml_service.predict_batch({name: values[start:start + batch_size] for name, values in columns.items()})
+        elapsed = time.perf_counter() - started
+        result[f"batch_{batch_size}_rows_per_second"] = round(rows / elapsed, 1)
+    return result
+
+
+def bench_ingest(dogs: List[Tuple[str, str]], df: pd.DataFrame, requests: int, concurrency: int, rng: np.random.Generator) -> dict:
+    import httpx
+    import main
+    from wire_format import encode_batch
+
+    main.redis_client = InMemoryRedis()
+    payloads = reading_payloads(sample_rows(df, requests, rng), dogs, rng)
+    batch_size = 500
+    batches = [encode_batch(payloads[i:i + batch_size]) for i in range(0, len(payloads), batch_size)]
+
+    async def run():
+        # ASGITransport doesn't send lifespan events, so run the startup handler directly
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Warm the collar registry and the model outside the timed section
+            db = main.SessionLocal()
+            for dog_id, collar_id in dogs:
+                main.collar_registry.resolve(db, collar_id)
+            db.close()
+            await client.post("/sensor-data", json=payloads[0])
+
+            queue = asyncio.Queue()
+            for payload in payloads:
+                queue.put_nowait(payload)
+            latencies = []
+
+            async def worker():
+                while not queue.empty():
+                    payload = queue.get_nowait()
+                    started = time.perf_counter()
+                    response = await client.post("/sensor-data", json=payload)
+                    latencies.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            single_elapsed = time.perf_counter() - started
+
+            batch_latencies = []
+            started = time.perf_counter()
+            for payload in batches:
+                batch_started = time.perf_counter()
+                response = await client.post(
+                    "/sensor-data/batch", content=payload, headers={"content-type": "application/octet-stream"}
+                )
+                batch_latencies.append(time.perf_counter() - batch_started)
+                response.raise_for_status()
+            batch_elapsed = time.perf_counter() - started
+            return latencies, single_elapsed, batch_latencies, batch_elapsed
+
+    latencies, single_elapsed, batch_latencies, batch_elapsed = asyncio.run(run())
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / single_elapsed, 1),
+        **summarize(latencies),
+        "batch_size": batch_size,
+        "batch_readings_per_second": round(requests / batch_elapsed, 1),
+        **{f"batch_{key}": value for key, value in summarize(batch_latencies).items()}
+    }
+
+
+class FakeWebSocket:
+    """Records when each message would have been written to the client."""
+
+    def __init__(self):
+        self.received: List[float] = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received.append(time.perf_counter())
+
+
+def bench_websocket(client_counts: List[int], repeats: int = 5) -> dict:
+    from websocket_manager import ConnectionManager
+
+    result = {}
+    for count in client_counts:
+        manager = ConnectionManager()
+        sockets = [FakeWebSocket() for _ in range(count)]
+
+        async def run():
+            # connect() logs every client; keep the output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i, websocket in enumerate(sockets):
+                    await manager.connect(websocket, f"client-{i}")
+            fan_out, deliveries = [], []
+            message = {"type": "intervention_alert", "dog_id": "bench", "data": {"intervention_type": "CRITICAL"}}
+            for _ in range(repeats):
+                for websocket in sockets:
+                    websocket.received.clear()
+                started = time.perf_counter()
+                await manager.broadcast_to_all(message)
+                fan_out.append(time.perf_counter() - started)
+                deliveries.extend(websocket.received[-1] - started for websocket in sockets if websocket.received)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(count):
+                    manager.disconnect(f"client-{i}")
+            return fan_out, deliveries
+
+        fan_out, deliveries = asyncio.run(run())
+        result[f"clients_{count}_broadcast_mean_ms"] = summarize(fan_out)["mean_ms"]
+        for key, value in summarize(deliveries).items():
+            result[f"clients_{count}_delivery_{key}"] = value
+    return result
+
+
+def seed_readings(db, dogs: List[Tuple[str, str]], df: pd.DataFrame, n: int, rng: np.random.Generator, chunk: int = 100_000):
+    """Insert n scored-looking readings spread over the last 30 days."""
+    from models import SensorData
+    from services import copy_rows, sensor_data_columns
+
+    postgres = db.get_bind().dialect.name == "postgresql"
+    end = datetime.utcnow()
+    span_us = int(timedelta(days=30).total_seconds() * 1e6)
+    dog_ids = np.array([dog_id for dog_id, _ in dogs], dtype=object)
+    collar_ids = np.array([collar_id for _, collar_id in dogs], dtype=object)
+
+    for start in range(0, n, chunk):
+        m = min(chunk, n - start)
+        sample = sample_rows(df, m, rng)
+        picks = rng.integers(0, len(dogs), m)
+        levels = sample["aggression_level"].to_numpy(np.int64)
+        prediction = {
+            "aggression_level": levels,
+            "probability": rng.random(m),
+            "intervention": np.where(levels >= 3, "HIGH", "LOW")
+        }
+        offsets = rng.integers(0, span_us, m).astype("timedelta64[us]")
+        recorded_at = (np.datetime64(end - timedelta(days=30), "us") + offsets).astype(object)
+        row_columns = sensor_data_columns(
+            reading_columns(sample), dog_ids[picks], collar_ids[picks], prediction, recorded_at, end
+        )
+
+        if postgres:
+            copy_rows(db, SensorData, row_columns)
+        else:
+            # Straight to the driver; the ORM executemany would dominate seeding at 10M rows
+            names = ["id", *row_columns]
+            ids = [str(uuid.uuid4()) for _ in range(m)]
+            values = [column.tolist() if isinstance(column, np.ndarray) else column for column in row_columns.values()]
+            db.connection().exec_driver_sql(
+                f"INSERT INTO sensor_data ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                list(zip(ids, *values))
+            )
+        db.commit()
+
+
+def bench_analytics(db, dogs: List[Tuple[str, str]], df: pd.DataFrame, row_counts: List[int], rng: np.random.Generator, repeats: int = 20) -> dict:
+    from models import SensorData
+    from services import SensorDataService
+
+    service = SensorDataService()
+    result = {}
+    seeded = db.query(SensorData).count()
+    for target in sorted(row_counts):
+        if target > seeded:
+            started = time.perf_counter()
+            seed_readings(db, dogs, df, target - seeded, rng)
+            print(f"Seeded {target - seeded} readings in {time.perf_counter() - started:.1f}s")
+            seeded = target
+
+        queries = {
+            "sensor_history": lambda dog_id: service.get_sensor_data_by_dog(db, dog_id, limit=1000),
+            "aggression_trends": lambda dog_id: service.get_aggression_trends(db, dog_id, days=7),
+            "health_metrics": lambda dog_id: service.get_health_metrics(db, dog_id, days=7),
+            "dashboard": lambda dog_id: service.get_dashboard_analytics(db),
+        }
+        label = f"rows_{target}"
+        for name, query in queries.items():
+            latencies = []
+            for i in range(repeats):
+                dog_id = dogs[int(rng.integers(0, len(dogs)))][0]
+                started = time.perf_counter()
+                asyncio.run(query(dog_id))
+                latencies.append(time.perf_counter() - started)
+            for key, value in summarize(latencies).items():
+                result[f"{label}_{name}_{key}"] = value
+    return result
+
+
+def seed_interventions(db, dogs: List[Tuple[str, str]], n: int, rng: np.random.Generator):
+    from models import AggressionLevel, Intervention, InterventionType
+
+    now = datetime.utcnow()
+    types = list(InterventionType)
+    db.add_all([
+        Intervention(
+            id=str(uuid.uuid4()),
+            dog_id=dog_id,
+            collar_id=collar_id,
+            intervention_type=types[int(rng.integers(0, len(types)))],
+            aggression_level=AggressionLevel(int(rng.integers(2, 5))),
+            confidence=float(rng.random()),
+            ultrasonic_frequency=25000,
+            duration_seconds=5,
+            triggered_at=now - timedelta(minutes=int(rng.integers(0, 60 * 24 * 30)))
+        )
+        for dog_id, collar_id in (dogs[int(rng.integers(0, len(dogs)))] for _ in range(n))
+    ])
+    db.commit()
+
+
+def bench_serialization(db, dogs: List[Tuple[str, str]], df: pd.DataFrame, rng: np.random.Generator, page: int = 1000, repeats: int = 30) -> dict:
+    """List endpoints end to end minus HTTP: the old per-row pydantic path against RowSet + orjson."""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from sqlalchemy import desc
+
+    from models import Collar, Dog, Intervention, SensorData
+    from schemas import CollarResponse, DogResponse, InterventionResponse, SensorDataResponse
+    from serialization import encode
+    from services import CollarService, DogService, InterventionService, SensorDataService
+
+    dog_id = dogs[0][0]
+    seed_readings(db, dogs[:1], df, page, rng)
+    seed_interventions(db, dogs, page, rng)
+
+    # What the endpoints did before: ORM objects -> *Response.from_orm -> response_model validation -> json
+    def pydantic_path(schema, query):
+        field = create_response_field(name=f"bench_{schema.__name__}", type_=List[schema])
+        models = [schema.from_orm(row) for row in query.all()]
+        content = asyncio.run(serialize_response(field=field, response_content=models))
+        return JSONResponse(content).body
+
+    endpoints = {
+        "dogs": (
+            DogResponse, lambda: db.query(Dog).limit(page),
+            lambda: DogService().get_dogs(db, limit=page)
+        ),
+        "collars": (
+            CollarResponse, lambda: db.query(Collar).limit(page),
+            lambda: CollarService().get_collars(db, limit=page)
+        ),
+        "sensor_history": (
+            SensorDataResponse,
+            lambda: db.query(SensorData).filter(SensorData.dog_id == dog_id).order_by(desc(SensorData.recorded_at)).limit(page),
+            lambda: SensorDataService().get_sensor_data_by_dog(db, dog_id, limit=page)
+        ),
+        "interventions": (
+            InterventionResponse, lambda: db.query(Intervention).order_by(desc(Intervention.triggered_at)).limit(page),
+            lambda: InterventionService().get_interventions(db, limit=page)
+        ),
+    }
+    result = {}
+    for name, (schema, query, rowset) in endpoints.items():
+        paths = {
+            "pydantic": lambda: pydantic_path(schema, query()),
+            "orjson": lambda: encode(asyncio.run(rowset()), "objects"),
+            "columnar": lambda: encode(asyncio.run(rowset()), "columnar"),
+        }
+        for path, serialize in paths.items():
+            latencies = []
+            for _ in range(repeats):
+                db.expunge_all()
+                started = time.perf_counter()
+                body = serialize()
+                latencies.append(time.perf_counter() - started)
+            for key, value in summarize(latencies).items():
+                result[f"{name}_{path}_{key}"] = value
+            result[f"{name}_{path}_bytes"] = len(body)
+        result[f"{name}_rows"] = len(asyncio.run(rowset()).rows)
+    return result
+
+
+# Runner
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(port: int, path: str = "/") -> int:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+        return response.status
+
+
+def _wait_until_serving(server: subprocess.Popen, port: int, timeout: float):
+    started = time.perf_counter()
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode} before serving")
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError(f"no response from server within {timeout}s")
+        try:
+            if _get(port) == 200:
+                return
+        except OSError:
+            time.sleep(0.01)
+
+
+def _worker_pids(parent: int) -> List[int]:
+    # Children of the server process, minus multiprocessing's resource tracker
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == parent and b"resource_tracker" not in cmdline:
+            pids.append(int(entry))
+    return pids
+
+
+def bench_startup(database_url: str, repeats: int = 5, timeout: float = 60.0) -> dict:
+    """Cold `import main` time, and time from spawning a uvicorn worker to its first 200 response."""
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    import_times, first_response_times, rss = [], [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], env=env, check=True, stdout=subprocess.DEVNULL)
+        import_times.append(time.perf_counter() - started)
+
+        port = _free_port()
+        started = time.perf_counter()
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL
+        )
+        try:
+            _wait_until_serving(worker, port, timeout)
+            first_response_times.append(time.perf_counter() - started)
+            rss.append(memory_mb(worker.pid)["rss_mb"])
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    return {
+        "repeats": repeats,
+        **{f"import_{key}": value for key, value in summarize(import_times).items()},
+        **{f"first_response_{key}": value for key, value in summarize(first_response_times).items()},
+        "worker_rss_mb": max(rss) if None not in rss else None
+    }
+
+
+def bench_workers(database_url: str, workers: int = 4, requests: int = 200, timeout: float = 120.0) -> dict:
+    """Per-worker RSS/PSS under `uvicorn --workers` versus prefork.py, after serving some requests.
+
+    PSS splits shared pages between the processes mapping them, so the
+    PSS total is what the workers actually cost the node.
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": backend_dir}
+    commands = {
+        "uvicorn": [sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers), "--log-level", "warning"],
+        "prefork": [sys.executable, os.path.join(backend_dir, "prefork.py"), "--workers", str(workers),
+                    "--log-level", "warning", "--report-memory", "0"],
+    }
+    results = {"workers": workers}
+    for mode, command in commands.items():
+        port = _free_port()
+        server = subprocess.Popen(command + ["--host", "127.0.0.1", "--port", str(port)], env=env, stdout=subprocess.DEVNULL)
+        try:
+            _wait_until_serving(server, port, timeout)
+            started = time.perf_counter()
+            while len(_worker_pids(server.pid)) < workers and time.perf_counter() - started < timeout:
+                time.sleep(0.1)
+            # Spread over the workers so each has imported and touched its request path
+            for i in range(requests):
+                _get(port, "/dogs?limit=50" if i % 2 else "/")
+            usage = [memory_mb(pid) for pid in _worker_pids(server.pid)]
+            parent = memory_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        if any(u["pss_mb"] is None for u in usage):
+            results[mode] = None
+            continue
+        results[f"{mode}_worker_rss_mb"] = round(float(np.mean([u["rss_mb"] for u in usage])), 1)
+        results[f"{mode}_worker_pss_mb"] = round(float(np.mean([u["pss_mb"] for u in usage])), 1)
+        results[f"{mode}_total_pss_mb"] = round(sum(u["pss_mb"] for u in usage) + parent["pss_mb"], 1)
+    return results
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run(args) -> dict:
+    # DATABASE_URL has to be set before database.py creates the engine
+    database_url = args.database_url
+    if not database_url:
+        tmp_dir = tempfile.mkdtemp(prefix="bench-")
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ["DATABASE_URL"] = database_url
+
+    from database import SessionLocal, engine
+    from models import Base
+    from services import MLService
+
+    Base.metadata.create_all(bind=engine)
+    only = args.only.split(",") if args.only else BENCHMARKS
+    rng = np.random.default_rng(SEED)
+    df = load_dataset()
+    db = SessionLocal()
+    dogs = create_dogs(db, args.dogs, rng)
+
+    results = {}
+    if "inference" in only:
+        print("Running inference benchmark")
+        results["inference"] = bench_inference(MLService().load(), df, args.inference_rows, rng)
+    if "ingest" in only:
+        print("Running ingest benchmark")
+        results["ingest"] = bench_ingest(dogs, df, args.requests, args.concurrency, rng)
+    if "websocket" in only:
+        print("Running websocket benchmark")
+        results["websocket"] = bench_websocket([int(c) for c in args.clients.split(",")])
+    if "analytics" in only:
+        print("Running analytics benchmark")
+        results["analytics"] = bench_analytics(db, dogs, df, [int(r) for r in args.rows.split(",")], rng)
+    if "serialization" in only:
+        print("Running serialization benchmark")
+        results["serialization"] = bench_serialization(db, dogs, df, rng)
+    if "startup" in only:
+        print("Running startup benchmark")
+        results["startup"] = bench_startup(database_url, args.startup_repeats)
+    if "workers" in only:
+        print("Running worker memory benchmark")
+        results["workers"] = bench_workers(database_url, args.workers)
+    db.close()
+
+    return {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "args": {key: value for key, value in vars(args).items() if key not in ("func", "database_url")}
+        },
+        "results": results
+    }
+
+
+def flatten(report: dict) -> Dict[str, float]:
+    return {
+        f"{bench}.{metric}": value
+        for bench, metrics in report["results"].items()
+        for metric, value in metrics.items()
+        if isinstance(value, (int, float)) and (metric.endswith("_per_second") or metric.endswith("_ms"))
+    }
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> List[str]:
+    """Print per-metric changes and return the metrics that regressed beyond the threshold."""
+    before, after = flatten(baseline), flatten(candidate)
+    regressions = []
+    print(f"{'metric':<60} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for metric in sorted(before.keys() & after.keys()):
+        old, new = before[metric], after[metric]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if metric.endswith("_per_second") else change
+        flag = " !" if worse > threshold else ""
+        print(f"{metric:<60} {old:>12.4g} {new:>12.4g} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(metric)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ingest, inference, analytics and fan-out")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks and write a JSON report")
+    run_parser.add_argument("--only", help=f"comma-separated subset of {','.join(BENCHMARKS)}")
+    run_parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    run_parser.add_argument("--dogs", type=int, default=200)
+    run_parser.add_argument("--inference-rows", type=int, default=2000)
+    run_parser.add_argument("--requests", type=int, default=2000, help="/sensor-data requests for the ingest benchmark")
+    # Endpoints do sync DB work on the event loop, so keep this under the pool size (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--rows", default="1000000,10000000", help="sensor_data sizes for the analytics benchmark")
+    run_parser.add_argument("--clients", default="1000,10000", help="websocket client counts")
+    run_parser.add_argument("--startup-repeats", type=int, default=5, help="worker cold starts to time")
+    run_parser.add_argument("--workers", type=int, default=4, help="worker processes for the memory benchmark")
+    run_parser.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    run_parser.add_argument("--output", help="defaults to bench-<commit>.json")
+
+    compare_parser = commands.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        return
+
+    if args.quick:
+        args.inference_rows, args.requests, args.rows, args.clients = 500, 300, "100000", "1000"
+        args.startup_repeats = 2
+    report = run(args)
+    output = args.output or f"bench-{report['meta']['commit'] or 'unknown'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
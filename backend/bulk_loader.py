@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import BULK_LOAD_CHUNK_ROWS, DB_PARTITIONING
+from collar_registry import CollarRegistry
+from database import SessionLocal, engine
+from models import BulkLoadJob, SensorData
+from partitions import ensure_partitions
+from retention import to_naive_utc
+from services import MLService, copy_rows, sensor_data_columns, vitals_in_range
+from wire_format import ENUM_FIELDS, FLOAT_FIELDS
+
+# pandas is imported on first load, so the API doesn't pay for it at startup
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def job_id_for(path: str) -> str:
+    """Stable id for a source file, so re-running the same import resumes it."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _float_column(chunk: "pd.DataFrame", name: str) -> np.ndarray:
+    import pandas as pd
+
+    if name not in chunk:
+        return np.full(len(chunk), np.nan)
+    return pd.to_numeric(chunk[name], errors="coerce").to_numpy(np.float64)
+
+
+def _code_column(chunk: "pd.DataFrame", name: str, enum_cls) -> np.ndarray:
+    import pandas as pd
+
+    # Accepts integer codes (dataset exports) or enum names (API exports)
+    if name in chunk and not pd.api.types.is_numeric_dtype(chunk[name]):
+        codes = {member.name: float(member.value) for member in enum_cls}
+        return chunk[name].map(codes).to_numpy(np.float64)
+    return _float_column(chunk, name)
+
+
+class BulkLoader:
+    """Loads CSV telemetry exports into sensor_data in scored chunks.
+
+    Files are shaped like ml/dog_aggression_dataset.csv plus dog_id/collar_id
+    (or defaults for single-collar files) and an optional recorded_at. Each
+    chunk is scored with MLService.predict_batch, loaded with COPY and
+    committed together with the job's progress, so an interrupted load resumes
+    after the last committed chunk. Historical readings keep their
+    intervention_required flag but create no Intervention rows, since no
+    command was ever sent to the collar.
+    """
+
+    def __init__(self, ml_service: MLService, registry: CollarRegistry, chunk_rows: int = BULK_LOAD_CHUNK_ROWS):
+        self.ml_service = ml_service
+        self.registry = registry
+        self.chunk_rows = chunk_rows
+        self.active = set()
+        self._lock = threading.Lock()
+
+    def run(
+        self,
+        path: str,
+        job_id: Optional[str] = None,
+        dog_id: Optional[str] = None,
+        collar_id: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        interval_seconds: float = 60.0,
+        from_scratch: bool = False
+    ) -> dict:
+        job_id = job_id or job_id_for(path)
+        with self._lock:
+            if job_id in self.active:
+                raise ValueError(f"Bulk load {job_id} is already running")
+            self.active.add(job_id)
+
+        db = SessionLocal()
+        try:
+            job = db.get(BulkLoadJob, job_id)
+            if job is None:
+                job = BulkLoadJob(id=job_id, source=os.path.abspath(path))
+                db.add(job)
+            elif job.status == "completed" and not from_scratch:
+                print(f"[{job_id}] already completed ({job.rows_loaded} rows)")
+                return self._stats(job, 0, 0.0)
+            if from_scratch:
+                job.rows_read = job.rows_loaded = job.rows_rejected = 0
+            job.status = "running"
+            job.error = None
+            job.finished_at = None
+            db.commit()
+            loaded_before = job.rows_loaded
+
+            try:
+                elapsed = self._load(db, job, path, dog_id, collar_id, start_time, interval_seconds)
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(e)
+                db.commit()
+                print(f"[{job_id}] failed after {job.rows_read} rows: {e}")
+                raise
+
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            stats = self._stats(job, job.rows_loaded - loaded_before, elapsed)
+            print(f"[{job_id}] done: {stats}")
+            return stats
+        finally:
+            db.close()
+            with self._lock:
+                self.active.discard(job_id)
+
+    def _stats(self, job: BulkLoadJob, loaded: int, elapsed: float) -> dict:
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "rows_read": job.rows_read,
+            "rows_loaded": job.rows_loaded,
+            "rows_rejected": job.rows_rejected,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(loaded / elapsed) if elapsed else None
+        }
+
+    def _load(
+        self,
+        db: Session,
+        job: BulkLoadJob,
+        path: str,
+        dog_id: Optional[str],
+        collar_id: Optional[str],
+        start_time: Optional[datetime],
+        interval_seconds: float
+    ) -> float:
+        import pandas as pd
+
+        header = pd.read_csv(path, nrows=0).columns
+        if collar_id is None and "collar_id" not in header:
+            raise ValueError("File has no collar_id column and no default collar was given")
+        if "recorded_at" not in header and start_time is None:
+            raise ValueError("File has no recorded_at column and no start time was given")
+        start_time = to_naive_utc(start_time)
+
+        # Skipping resumes after the last committed chunk; the header line stays
+        chunks = pd.read_csv(
+            path,
+            chunksize=self.chunk_rows,
+            skiprows=range(1, job.rows_read + 1),
+            dtype={"dog_id": str, "collar_id": str}
+        )
+        started = time.perf_counter()
+        loaded_before = job.rows_loaded
+        for chunk in chunks:
+            chunk_started = time.perf_counter()
+            loaded, rejected = self._load_chunk(db, chunk, job.rows_read, dog_id, collar_id, start_time, interval_seconds)
+            job.rows_read += len(chunk)
+            job.rows_loaded += loaded
+            job.rows_rejected += rejected
+            db.commit()
+
+            chunk_seconds = time.perf_counter() - chunk_started
+            total_seconds = time.perf_counter() - started
+            print(
+                f"[{job.id}] {job.rows_read} rows read, {job.rows_loaded} loaded, {job.rows_rejected} rejected "
+                f"({loaded / chunk_seconds:,.0f} rows/s chunk, "
+                f"{(job.rows_loaded - loaded_before) / total_seconds:,.0f} rows/s overall)"
+            )
+        return time.perf_counter() - started
+
+    def _load_chunk(
+        self,
+        db: Session,
+        chunk: "pd.DataFrame",
+        offset: int,
+        dog_id: Optional[str],
+        collar_id: Optional[str],
+        start_time: Optional[datetime],
+        interval_seconds: float
+    ):
+        import pandas as pd
+
+        n = len(chunk)
+        columns = {name: _float_column(chunk, name) for name in FLOAT_FIELDS}
+        for name, enum_cls in ENUM_FIELDS.items():
+            columns[name] = _code_column(chunk, name, enum_cls)
+        columns["other_dogs_nearby"] = _float_column(chunk, "other_dogs_nearby")
+
+        collar_ids = chunk["collar_id"].fillna(collar_id or "") if "collar_id" in chunk else pd.Series([collar_id] * n)
+        resolved = self.registry.resolve_ids(db, collar_ids.to_numpy(dtype=object))
+        valid = resolved["known"] & vitals_in_range(columns)
+        if "dog_id" in chunk or dog_id:
+            expected = chunk["dog_id"].fillna(dog_id or "") if "dog_id" in chunk else pd.Series([dog_id] * n)
+            valid &= resolved["dog_id"] == expected.to_numpy(dtype=object)
+
+        if "recorded_at" in chunk:
+            timestamps = pd.to_datetime(chunk["recorded_at"], utc=True, errors="coerce").dt.tz_localize(None)
+            valid &= timestamps.notna().to_numpy()
+            recorded_at = timestamps.dt.to_pydatetime()
+        else:
+            # Synthesized from the row number, so a resumed load reproduces the same times
+            seconds = (offset + np.arange(n)) * interval_seconds
+            recorded_at = (np.datetime64(start_time, "us") + (seconds * 1e6).astype("timedelta64[us]")).astype(object)
+        recorded_at = np.asarray(recorded_at, dtype=object)
+
+        index = np.flatnonzero(valid)
+        if len(index) == 0:
+            return 0, n
+        columns = {name: values[index] for name, values in columns.items()}
+        resolved = {name: values[index] for name, values in resolved.items()}
+        recorded_at = recorded_at[index]
+
+        # Historical rows would swamp the drift monitor's view of live traffic
+        prediction = self.ml_service.predict_batch({
+            **columns,
+            "age_years": resolved["age_years"],
+            "sex": resolved["sex"],
+            "sterilization_status": resolved["sterilization_status"]
+        }, observe=False)
+        row_columns = sensor_data_columns(
+            columns, resolved["dog_id"], resolved["collar_id"], prediction, recorded_at, datetime.utcnow()
+        )
+
+        if DB_PARTITIONING:
+            ensure_partitions(engine, start=min(recorded_at), end=max(recorded_at))
+        copy_rows(db, SensorData, row_columns)
+        return len(index), n - len(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load CSV telemetry exports into sensor_data")
+    parser.add_argument("path", help="CSV shaped like ml/dog_aggression_dataset.csv, plus dog_id/collar_id")
+    parser.add_argument("--job-id", help="progress key; defaults to one derived from the file")
+    parser.add_argument("--dog-id", help="dog for files without a dog_id column")
+    parser.add_argument("--collar-id", help="collar for files without a collar_id column")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="recorded_at of the first row, for files without a recorded_at column")
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between synthesized recorded_at values")
+    parser.add_argument("--chunk-rows", type=int, default=BULK_LOAD_CHUNK_ROWS)
+    parser.add_argument("--from-scratch", action="store_true", help="ignore saved progress and read the file from the start")
+    args = parser.parse_args()
+
+    loader = BulkLoader(MLService().load(), CollarRegistry(), chunk_rows=args.chunk_rows)
+    try:
+        loader.run(
+            args.path,
+            job_id=args.job_id,
+            dog_id=args.dog_id,
+            collar_id=args.collar_id,
+            start_time=args.start,
+            interval_seconds=args.interval,
+            from_scratch=args.from_scratch
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Change log behind GET /sync.
+
+Every insert or update of a dog, collar or intervention appends
+(entity, entity_id) to change_log in the same transaction, so its
+autoincrementing seq orders the changes. ORM writes are logged by an
+after_flush listener; Core bulk writes (interventions copied in by the
+intervention engine, bulk completed_at updates, collar acks) call
+record_changes() themselves.
+
+/sync?since=<cursor> returns the current rows of the entities changed after
+the cursor, each once, and the next cursor. A transaction can commit after
+one holding a higher seq, so the cursor only moves past changes older than
+SYNC_SETTLE_SECONDS; newer ones are sent again next time, which is harmless
+since clients upsert by id. Without a cursor, or with one older than the
+pruned log, the response has "reset": true and the client reloads its lists.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import Session
+
+from config import SYNC_LOG_RETENTION_HOURS, SYNC_SETTLE_SECONDS
+from models import ChangeLog, Collar, Dog, Intervention
+
+MODEL_ENTITIES = {Dog: "dog", Collar: "collar", Intervention: "intervention"}
+
+CHANGE_LOG_INSERT = insert(ChangeLog.__table__)
+
+
+def _rows(entity: str, ids: Iterable[str], now: datetime) -> List[dict]:
+    return [{"entity": entity, "entity_id": entity_id, "changed_at": now} for entity_id in dict.fromkeys(ids)]
+
+
+def record_changes(db: Session, entity: str, ids: Iterable[str]):
+    """Log changes made by Core statements, in the caller's transaction."""
+    rows = _rows(entity, ids, datetime.utcnow())
+    if rows:
+        db.execute(CHANGE_LOG_INSERT, rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _log_flushed_changes(session: Session, flush_context):
+    changed: Dict[str, List[str]] = {}
+    for obj in (*session.new, *session.deleted):
+        entity = MODEL_ENTITIES.get(type(obj))
+        if entity:
+            changed.setdefault(entity, []).append(obj.id)
+    for obj in session.dirty:
+        entity = MODEL_ENTITIES.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            changed.setdefault(entity, []).append(obj.id)
+    if changed:
+        now = datetime.utcnow()
+        session.connection().execute(
+            CHANGE_LOG_INSERT, [row for entity, ids in changed.items() for row in _rows(entity, ids, now)]
+        )
+
+
+def changes_since(db: Session, since: Optional[int], limit: int) -> dict:
+    """Ids changed after the cursor ({"dog": [...], ...}), oldest change first, and the next cursor."""
+    now = datetime.utcnow()
+    settled = db.query(func.max(ChangeLog.seq)).filter(
+        ChangeLog.changed_at < now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    ).scalar() or 0
+    oldest = db.query(func.min(ChangeLog.seq)).scalar()
+    # Pruning only removes entries below the oldest one kept, so a cursor just below it missed nothing
+    if since is None or (oldest is not None and since < oldest - 1):
+        return {"reset": True, "cursor": settled, "has_more": False, "ids": {}}
+
+    # Each entity once, at its latest change
+    latest = func.max(ChangeLog.seq).label("seq")
+    groups = db.query(ChangeLog.entity, ChangeLog.entity_id, latest).filter(
+        ChangeLog.seq > since
+    ).group_by(ChangeLog.entity, ChangeLog.entity_id).order_by(latest).limit(limit + 1).all()
+
+    has_more = len(groups) > limit
+    groups = groups[:limit]
+    ids: Dict[str, List[str]] = {}
+    for entity, entity_id, _ in groups:
+        ids.setdefault(entity, []).append(entity_id)
+    page_end = groups[-1].seq if groups else since
+    cursor = max(since, min(page_end, settled))
+    return {"reset": False, "cursor": cursor, "has_more": has_more and cursor > since, "ids": ids}
+
+
+def prune(db: Session, retention_hours: int = SYNC_LOG_RETENTION_HOURS) -> int:
+    """Delete entries older than the retention window, keeping the newest of them as the reset boundary."""
+    boundary = db.query(func.max(ChangeLog.seq)).filter(
+        ChangeLog.changed_at < datetime.utcnow() - timedelta(hours=retention_hours)
+    ).scalar()
+    if boundary is None:
+        return 0
+    deleted = db.query(ChangeLog).filter(ChangeLog.seq < boundary).delete(synchronize_session=False)
+    db.commit()
+    return deleted
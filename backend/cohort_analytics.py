@@ -0,0 +1,463 @@
+"""Fleet-wide cohort analytics over an in-memory columnar snapshot.
+
+Cohort questions ("young unsterilized males at night", "isolated dogs near
+people") group every recent reading by dog attributes and reading context.
+Instead of a SQL scan per request, the last COHORT_WINDOW_HOURS of readings
+are held as NumPy columns sorted by recorded_at, each carrying the dog's
+slot and a context code packing the reading dimensions (time of day,
+aggression level, pack isolation, close human). Dog attributes live in
+per-dog arrays and are joined through the slot.
+
+Alongside the readings the snapshot keeps per-cell totals (a dense cube of
+dogs x contexts), updated on refresh with the rows added and evicted. A query
+over the whole window aggregates the non-empty cells of the cube, so its cost
+is bounded by dogs x contexts however many readings there are. With ?hours=
+it aggregates the readings after the binary-searched start instead, or, when
+that is most of the window, the cube minus the readings before the start.
+Dimension codes are gathered from per-dog and per-context lookup tables and
+each aggregate is one bincount.
+
+refresh() appends readings processed since the last watermark (up to
+COHORT_SETTLE_SECONDS ago, so transactions still committing aren't skipped)
+and evicts those that fell out of the window; every COHORT_REBUILD_MINUTES the
+snapshot is rebuilt from scratch, picking up backfilled or late rows.
+Snapshots are immutable and swapped whole, so queries run without locks.
+The snapshot is per process.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from config import (
+    COHORT_FETCH_ROWS, COHORT_REBUILD_MINUTES, COHORT_REFRESH_SECONDS, COHORT_SETTLE_SECONDS, COHORT_WINDOW_HOURS
+)
+from database import ReadSessionLocal
+from models import AggressionLevel, Dog, SensorData, Sex, SterilizationStatus, TimeOfDay
+from serialization import select_columns
+
+READING_COLUMNS = (
+    "dog_id", "recorded_at", "aggression_level", "aggression_probability", "intervention_required",
+    "time_of_day", "human_proximity_meters", "other_dogs_nearby"
+)
+DOG_COLUMNS = ("id", "age_years", "sex", "sterilization_status")
+
+# Readings at or above this level count towards high_risk_rate
+HIGH_RISK_LEVEL = AggressionLevel.AGGRESSIVE.value
+
+# Per-cell totals kept in the cube
+CUBE_METRICS = ("readings", "interventions", "probability_sum", "probability_count")
+
+
+class CohortDimension(NamedTuple):
+    name: str
+    # Label per code; code -1 (unknown) is reported as None
+    labels: tuple
+    # Codes from the dog arrays (one per dog) or from reading columns (one per reading)
+    codes: Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+    @property
+    def size(self) -> int:
+        return len(self.labels) + 1
+
+
+def _flag(condition: np.ndarray, known: np.ndarray) -> np.ndarray:
+    return np.where(known, condition.astype(np.int8), -1)
+
+
+def _age_band(dogs: Dict[str, np.ndarray]) -> np.ndarray:
+    age = dogs["age_years"]
+    return np.where(np.isnan(age), -1, np.searchsorted([1, 3, 8], age, side="right"))
+
+
+def _young_male_risk(dogs: Dict[str, np.ndarray]) -> np.ndarray:
+    # Same rule as the model's young_male_risk feature
+    age, sex, sterilized = dogs["age_years"], dogs["sex"], dogs["sterilization_status"]
+    return _flag(
+        (age < 3) & (sex == Sex.MALE.value) & (sterilized == SterilizationStatus.NOT_STERILIZED.value),
+        ~np.isnan(age) & (sex >= 0) & (sterilized >= 0)
+    )
+
+
+def _enum_labels(enum_cls) -> tuple:
+    return tuple(member.name for member in enum_cls)
+
+
+DOG_DIMENSIONS = {dimension.name: dimension for dimension in (
+    CohortDimension("sex", _enum_labels(Sex), lambda dogs: dogs["sex"]),
+    CohortDimension("sterilization_status", _enum_labels(SterilizationStatus), lambda dogs: dogs["sterilization_status"]),
+    CohortDimension("age_band", ("PUPPY", "YOUNG", "ADULT", "SENIOR"), _age_band),
+    CohortDimension("young_male_risk", (False, True), _young_male_risk),
+)}
+
+# Packed into the context code in this order, the first varying slowest
+CONTEXT_DIMENSIONS = {dimension.name: dimension for dimension in (
+    CohortDimension("time_of_day", _enum_labels(TimeOfDay), lambda columns: columns["time_of_day"]),
+    CohortDimension("aggression_level", _enum_labels(AggressionLevel), lambda columns: columns["aggression_level"]),
+    CohortDimension("pack_isolation", (False, True), lambda columns: _flag(
+        columns["other_dogs_nearby"] == 0, ~np.isnan(columns["other_dogs_nearby"]))),
+    CohortDimension("close_human", (False, True), lambda columns: _flag(
+        columns["human_proximity_meters"] < 5, ~np.isnan(columns["human_proximity_meters"]))),
+)}
+
+DIMENSIONS = {**DOG_DIMENSIONS, **CONTEXT_DIMENSIONS}
+CONTEXT_SHAPE = tuple(dimension.size for dimension in CONTEXT_DIMENSIONS.values())
+CONTEXTS = int(np.prod(CONTEXT_SHAPE))
+# Per context code: each context dimension's code + 1 (0 = unknown), and whether it is high risk
+CONTEXT_CODES = dict(zip(CONTEXT_DIMENSIONS, np.unravel_index(np.arange(CONTEXTS), CONTEXT_SHAPE)))
+HIGH_RISK_CONTEXTS = CONTEXT_CODES["aggression_level"] - 1 >= HIGH_RISK_LEVEL
+
+
+class CohortSnapshot(NamedTuple):
+    # recorded_at (epoch seconds, ascending), dog (slot), context, aggression_probability,
+    # intervention_required
+    readings: Dict[str, np.ndarray]
+    # CUBE_METRICS totals per cell over the whole window
+    cube: Dict[str, np.ndarray]
+    # Dog attribute arrays indexed by slot
+    dogs: Dict[str, np.ndarray]
+    # processed_at up to which readings have been loaded
+    watermark: datetime
+    built_at: datetime
+    refreshed_at: datetime
+
+
+def parse_filters(where: Optional[str]) -> Dict[str, int]:
+    """"dimension:LABEL,..." -> {dimension: code}. Raises ValueError for unknown dimensions or labels."""
+    filters = {}
+    for clause in filter(None, (where or "").split(",")):
+        name, _, value = clause.partition(":")
+        dimension = DIMENSIONS.get(name.strip())
+        if dimension is None:
+            raise ValueError(f"Unknown cohort dimension {name!r}; expected one of {', '.join(DIMENSIONS)}")
+        labels = [str(label).lower() for label in dimension.labels]
+        if value.strip().lower() not in labels:
+            raise ValueError(f"Unknown {dimension.name} value {value!r}; expected one of {', '.join(labels)}")
+        filters[dimension.name] = labels.index(value.strip().lower())
+    return filters
+
+
+def parse_group_by(group_by: Optional[str]) -> List[str]:
+    names = [name.strip() for name in (group_by or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown cohort dimension {unknown[0]!r}; expected one of {', '.join(DIMENSIONS)}")
+    return list(dict.fromkeys(names))
+
+
+def _enum_codes(names: Sequence[Optional[str]], enum_cls) -> np.ndarray:
+    """Enum names as int8 codes (-1 for None), mapping each distinct name once."""
+    values = np.array([name or "" for name in names], dtype=object)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int8)
+    distinct, inverse = np.unique(values, return_inverse=True)
+    table = np.array([enum_cls[name].value if name else -1 for name in distinct], dtype=np.int8)
+    return table[inverse]
+
+
+def _epoch_seconds(values: Sequence[datetime]) -> np.ndarray:
+    # Naive timestamps are UTC, as written by the ingest paths
+    return np.array([
+        (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp() for value in values
+    ], dtype=np.int64)
+
+
+def _utc_seconds(value: datetime) -> np.int64:
+    # Same dtype as recorded_at; a float would make searchsorted convert the whole column
+    return np.int64(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _float(values: Sequence) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float32)
+
+
+def _context_codes(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    codes = np.zeros(len(columns["time_of_day"]), dtype=np.int32)
+    for dimension in CONTEXT_DIMENSIONS.values():
+        codes = codes * dimension.size + (dimension.codes(columns).astype(np.int32) + 1)
+    return codes
+
+
+def _empty_readings() -> Dict[str, np.ndarray]:
+    return {
+        "recorded_at": np.empty(0, dtype=np.int64),
+        "dog": np.empty(0, dtype=np.int32),
+        "context": np.empty(0, dtype=np.int16),
+        "aggression_probability": np.empty(0, dtype=np.float32),
+        "intervention_required": np.empty(0, dtype=bool)
+    }
+
+
+def build_cube(readings: Dict[str, np.ndarray], dog_count: int) -> Dict[str, np.ndarray]:
+    """CUBE_METRICS totals per cell for the given readings."""
+    cells = readings["dog"].astype(np.intp) * CONTEXTS + readings["context"]
+    size = dog_count * CONTEXTS
+    probability = readings["aggression_probability"]
+    scored = ~np.isnan(probability)
+    return {
+        "readings": np.bincount(cells, minlength=size).astype(np.int32),
+        "interventions": np.bincount(cells[readings["intervention_required"]], minlength=size).astype(np.int32),
+        "probability_sum": np.bincount(cells[scored], weights=probability[scored], minlength=size),
+        "probability_count": np.bincount(cells[scored], minlength=size).astype(np.int32)
+    }
+
+
+def _reading_weights(readings: Dict[str, np.ndarray], sign: int = 1) -> tuple:
+    """(dog, context, CUBE_METRICS weights) for readings, to aggregate like cube cells."""
+    probability = readings["aggression_probability"]
+    scored = ~np.isnan(probability)
+    return readings["dog"], readings["context"], {
+        "readings": np.full(len(probability), sign, dtype=np.int8),
+        "interventions": readings["intervention_required"] * np.int8(sign),
+        "probability_sum": np.where(scored, probability, 0) * sign,
+        "probability_count": scored * np.int8(sign)
+    }
+
+
+def _grow_cube(cube: Dict[str, np.ndarray], dog_count: int) -> Dict[str, np.ndarray]:
+    size = dog_count * CONTEXTS
+    return {name: np.concatenate([values, np.zeros(size - len(values), dtype=values.dtype)]) for name, values in cube.items()}
+
+
+class CohortAnalytics:
+    def __init__(
+        self,
+        session_factory=ReadSessionLocal,
+        window_hours: float = COHORT_WINDOW_HOURS,
+        refresh_seconds: float = COHORT_REFRESH_SECONDS,
+        rebuild_minutes: float = COHORT_REBUILD_MINUTES,
+        settle_seconds: float = COHORT_SETTLE_SECONDS,
+        fetch_rows: int = COHORT_FETCH_ROWS
+    ):
+        self.session_factory = session_factory
+        self.window_hours = window_hours
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_minutes = rebuild_minutes
+        self.settle_seconds = settle_seconds
+        self.fetch_rows = fetch_rows
+        self.snapshot: Optional[CohortSnapshot] = None
+        # dog_id -> slot in the dog arrays; slots are never reused, so cube cells stay valid as dogs are added
+        self._slots: Dict[str, int] = {}
+
+    def _dog_slots(self, dog_ids: Sequence[str]) -> np.ndarray:
+        if len(dog_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        distinct, inverse = np.unique(np.array(dog_ids, dtype=object), return_inverse=True)
+        for dog_id in distinct.tolist():
+            self._slots.setdefault(dog_id, len(self._slots))
+        table = np.array([self._slots[dog_id] for dog_id in distinct.tolist()], dtype=np.int32)
+        return table[inverse]
+
+    def _load_dogs(self, db) -> Dict[str, np.ndarray]:
+        rows = db.query(*select_columns(Dog, DOG_COLUMNS)).all()
+        dog_ids, ages, sexes, sterilized = zip(*rows) if rows else ((), (), (), ())
+        slots = self._dog_slots(dog_ids)
+        n = len(self._slots)
+        dogs = {
+            "age_years": np.full(n, np.nan, dtype=np.float32),
+            "sex": np.full(n, -1, dtype=np.int8),
+            "sterilization_status": np.full(n, -1, dtype=np.int8)
+        }
+        dogs["age_years"][slots] = _float(ages)
+        dogs["sex"][slots] = _enum_codes(sexes, Sex)
+        dogs["sterilization_status"][slots] = _enum_codes(sterilized, SterilizationStatus)
+        return dogs
+
+    def _load_readings(self, db, window_start: datetime, since: Optional[datetime], until: datetime) -> Dict[str, np.ndarray]:
+        """Readings in the window processed in [since, until), sorted by recorded_at."""
+        query = db.query(*select_columns(SensorData, READING_COLUMNS)).filter(SensorData.recorded_at >= window_start)
+        if since is None:
+            # Rows without processed_at are only seen by full rebuilds
+            query = query.filter((SensorData.processed_at < until) | (SensorData.processed_at == None))
+        else:
+            query = query.filter(SensorData.processed_at >= since, SensorData.processed_at < until)
+
+        chunks = [_empty_readings()]
+        result = db.execute(query.statement.execution_options(yield_per=self.fetch_rows))
+        for rows in result.partitions():
+            dog_ids, recorded_at, levels, probabilities, interventions, times, proximity, others = zip(*rows)
+            context = _context_codes({
+                "time_of_day": _enum_codes(times, TimeOfDay),
+                "aggression_level": _enum_codes(levels, AggressionLevel),
+                "other_dogs_nearby": _float(others),
+                "human_proximity_meters": _float(proximity)
+            })
+            chunks.append({
+                "recorded_at": _epoch_seconds(recorded_at),
+                "dog": self._dog_slots(dog_ids),
+                "context": context.astype(np.int16),
+                "aggression_probability": _float(probabilities),
+                "intervention_required": np.array([bool(value) for value in interventions], dtype=bool)
+            })
+        readings = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        order = np.argsort(readings["recorded_at"], kind="stable")
+        return {name: values[order] for name, values in readings.items()}
+
+    def refresh(self, full: bool = False) -> CohortSnapshot:
+        """Load new readings into a fresh snapshot (all of them if full or there is none yet)."""
+        now = datetime.utcnow()
+        until = now - timedelta(seconds=self.settle_seconds)
+        window_start = now - timedelta(hours=self.window_hours)
+        previous = self.snapshot if not full else None
+
+        db = self.session_factory()
+        try:
+            loaded = self._load_readings(db, window_start, previous.watermark if previous else None, until)
+            # After the readings, so dogs first seen in them get their attributes
+            dogs = self._load_dogs(db)
+        finally:
+            db.close()
+        dog_count = len(dogs["sex"])
+
+        if previous is None:
+            readings, cube = loaded, build_cube(loaded, dog_count)
+        else:
+            kept = int(np.searchsorted(previous.readings["recorded_at"], _utc_seconds(window_start)))
+            evicted = {name: values[:kept] for name, values in previous.readings.items()}
+            added, removed = build_cube(loaded, dog_count), build_cube(evicted, dog_count)
+            cube = {
+                name: values + added[name] - removed[name]
+                for name, values in _grow_cube(previous.cube, dog_count).items()
+            }
+            readings = {name: np.concatenate([values[kept:], loaded[name]]) for name, values in previous.readings.items()}
+            if len(loaded["recorded_at"]) and kept < len(previous.readings["recorded_at"]) and \
+                    loaded["recorded_at"][0] < previous.readings["recorded_at"][-1]:
+                # Some new rows were recorded before older ones already held
+                order = np.argsort(readings["recorded_at"], kind="stable")
+                readings = {name: values[order] for name, values in readings.items()}
+
+        self.snapshot = CohortSnapshot(
+            readings=readings,
+            cube=cube,
+            dogs=dogs,
+            watermark=until,
+            built_at=previous.built_at if previous else now,
+            refreshed_at=now
+        )
+        return self.snapshot
+
+    def query(self, group_by: Sequence[str] = (), filters: Optional[Dict[str, int]] = None,
+              hours: Optional[float] = None) -> dict:
+        """Aggregates per cohort over the snapshot; group_by and filters name DIMENSIONS."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Cohort snapshot is not built yet")
+        started = time.perf_counter()
+        filters = filters or {}
+
+        readings, cube = snapshot.readings, snapshot.cube
+        start = 0
+        if hours is not None and hours < self.window_hours:
+            start = int(np.searchsorted(
+                readings["recorded_at"], _utc_seconds(snapshot.refreshed_at - timedelta(hours=hours))
+            ))
+        in_range = len(readings["dog"]) - start
+        cells = None if start and in_range <= start else np.flatnonzero(cube["readings"])
+        if start and (cells is None or in_range <= start + len(cells)):
+            parts = [_reading_weights({name: values[start:] for name, values in readings.items()})]
+        else:
+            dog, context = np.divmod(cells, CONTEXTS)
+            parts = [(dog, context, {name: values[cells] for name, values in cube.items()})]
+            if start:
+                # Most of the window: the whole window minus the readings before the start
+                parts.append(_reading_weights({name: values[:start] for name, values in readings.items()}, sign=-1))
+
+        totals = self._aggregate(parts, snapshot.dogs, group_by, filters)
+        results = []
+        for group in np.flatnonzero(totals["readings"]).tolist():
+            labels, rest = {}, group
+            for name in reversed(group_by):
+                rest, code = divmod(rest, DIMENSIONS[name].size)
+                labels[name] = DIMENSIONS[name].labels[code - 1] if code else None
+            n = int(totals["readings"][group])
+            scored = totals["probability_count"][group]
+            results.append({
+                **{name: labels[name] for name in group_by},
+                "readings": n,
+                "dogs": int(totals["dogs"][group]),
+                "avg_probability": round(float(totals["probability_sum"][group] / scored), 4) if scored else None,
+                "high_risk_rate": round(float(totals["high_risk"][group]) / n, 4),
+                "interventions": int(totals["interventions"][group]),
+                "intervention_rate": round(float(totals["interventions"][group]) / n, 4)
+            })
+
+        return {
+            "group_by": list(group_by),
+            "filters": {name: DIMENSIONS[name].labels[code] for name, code in filters.items()},
+            "hours": hours,
+            "readings": int(totals["readings"].sum()),
+            "groups": results,
+            "snapshot": {
+                "readings": int(len(snapshot.readings["recorded_at"])),
+                "dogs": len(snapshot.dogs["sex"]),
+                "window_hours": self.window_hours,
+                "built_at": snapshot.built_at.isoformat(),
+                "refreshed_at": snapshot.refreshed_at.isoformat()
+            },
+            "query_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    @staticmethod
+    def _aggregate(parts: list, dogs: Dict[str, np.ndarray], group_by: Sequence[str],
+                   filters: Dict[str, int]) -> Dict[str, np.ndarray]:
+        """Totals per group key over (dog, context, CUBE_METRICS weights) parts.
+
+        Dimension codes are gathered from per-dog and per-context lookup
+        tables, so each step is a gather or a bincount.
+        """
+        if len(parts) == 1:
+            dog, context, weights = parts[0]
+        else:
+            dog, context = np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+            weights = {name: np.concatenate([part[2][name] for part in parts]) for name in CUBE_METRICS}
+        dog, context = dog.astype(np.intp), context.astype(np.intp)
+        dog_count = len(dogs["sex"])
+
+        def codes(name: str) -> np.ndarray:
+            if name in DOG_DIMENSIONS:
+                return (DOG_DIMENSIONS[name].codes(dogs).astype(np.intp) + 1)[dog]
+            return CONTEXT_CODES[name][context]
+
+        if filters:
+            keep = np.ones(len(dog), dtype=bool)
+            for name, code in filters.items():
+                keep &= codes(name) == code + 1
+            dog, context = dog[keep], context[keep]
+            weights = {name: values[keep] for name, values in weights.items()}
+
+        group = np.zeros(len(dog), dtype=np.intp)
+        for name in group_by:
+            group = group * DIMENSIONS[name].size + codes(name)
+        group_count = int(np.prod([DIMENSIONS[name].size for name in group_by]))
+
+        totals = {name: np.bincount(group, weights=values, minlength=group_count) for name, values in weights.items()}
+        high_risk = HIGH_RISK_CONTEXTS[context]
+        totals["high_risk"] = np.bincount(group[high_risk], weights=weights["readings"][high_risk], minlength=group_count)
+        # A dog is in a group if it has readings there (net of subtracted ones)
+        if len(parts) == 1:
+            seen = np.zeros(group_count * dog_count, dtype=bool)
+            seen[group * dog_count + dog] = True
+        else:
+            seen = np.bincount(group * dog_count + dog, weights=weights["readings"], minlength=group_count * dog_count) > 0.5
+        totals["dogs"] = seen.reshape(group_count, dog_count).sum(axis=1)
+        return totals
+
+    async def run(self):
+        """Build the first snapshot, then refresh it every refresh_seconds and rebuild it every rebuild_minutes."""
+        last_rebuild = None
+        while True:
+            full = last_rebuild is None or time.monotonic() - last_rebuild >= self.rebuild_minutes * 60
+            try:
+                started = time.perf_counter()
+                snapshot = await asyncio.to_thread(self.refresh, full)
+                if full:
+                    last_rebuild = time.monotonic()
+                    print(
+                        f"Cohort snapshot rebuilt: {len(snapshot.readings['recorded_at'])} readings "
+                        f"in {time.perf_counter() - started:.1f}s"
+                    )
+            except Exception as e:
+                print(f"Error refreshing cohort snapshot: {e}")
+            await asyncio.sleep(self.refresh_seconds)
@@ -0,0 +1,223 @@
+"""Downlink commands for collars.
+
+When an intervention opens, its collar gets a command (frequency, duration)
+it fetches by long-poll (GET /collars/{id}/commands?wait=...) or over the
+collar websocket, so commands arrive within a round trip without the
+collar polling often. A collar has at most one pending command: a newer
+intervention (escalation) supersedes an undelivered or unacknowledged one,
+and commands expire after COLLAR_COMMAND_TTL_SECONDS. Unacknowledged
+commands are redelivered after COLLAR_REDELIVER_SECONDS.
+
+Acknowledgements are buffered and written every COLLAR_ACK_FLUSH_SECONDS
+as one bulk UPDATE of Intervention.completed_at and is_successful.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, update
+
+from change_log import record_changes
+from config import (
+    COLLAR_ACK_FLUSH_SECONDS, COLLAR_COMMAND_TTL_SECONDS, COLLAR_POLL_TIMEOUT_SECONDS, COLLAR_REDELIVER_SECONDS
+)
+from database import SessionLocal
+from metrics import COLLAR_COMMANDS
+from models import Intervention
+
+NOTIFY_CHANNEL = "collar_commands"
+
+ACK_UPDATE = (
+    update(Intervention.__table__)
+    .where(Intervention.id == bindparam("b_id"), Intervention.collar_id == bindparam("b_collar_id"))
+    .values(completed_at=bindparam("b_completed_at"), is_successful=bindparam("b_is_successful"))
+)
+
+
+def command_for(row: dict, now: Optional[float] = None) -> dict:
+    """Command for a newly opened intervention row (see intervention_engine)."""
+    now = now or time.time()
+    return {
+        "id": row["id"],
+        "intervention_type": str(row["intervention_type"]),
+        "ultrasonic_frequency": int(row["ultrasonic_frequency"]),
+        "duration_seconds": int(row["duration_seconds"]),
+        "issued_at": now,
+        "expires_at": now + COLLAR_COMMAND_TTL_SECONDS,
+        "delivered_at": None
+    }
+
+
+def public(command: dict) -> dict:
+    return {name: value for name, value in command.items() if name != "delivered_at"}
+
+
+class MemoryCommandStore:
+    """Pending commands of this process; collars must fetch from the worker that queued them."""
+
+    def __init__(self):
+        self._commands: Dict[str, dict] = {}
+
+    async def get(self, collar_id: str) -> Optional[dict]:
+        command = self._commands.get(collar_id)
+        if command and command["expires_at"] <= time.time():
+            del self._commands[collar_id]
+            COLLAR_COMMANDS.labels("expired").inc()
+            return None
+        return command
+
+    async def put(self, collar_id: str, command: dict):
+        self._commands[collar_id] = command
+
+    async def remove(self, collar_id: str, command_ids: List[str]):
+        command = self._commands.get(collar_id)
+        if command and command["id"] in command_ids:
+            del self._commands[collar_id]
+
+
+class RedisCommandStore:
+    """Pending commands shared by all workers, one expiring key per collar."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def _key(self, collar_id: str) -> str:
+        return f"collar:{collar_id}:command"
+
+    async def get(self, collar_id: str) -> Optional[dict]:
+        value = await self.redis.get(self._key(collar_id))
+        return json.loads(value) if value is not None else None
+
+    async def put(self, collar_id: str, command: dict):
+        ttl = max(1, int(command["expires_at"] - time.time()))
+        await self.redis.set(self._key(collar_id), json.dumps(command), ex=ttl)
+
+    async def remove(self, collar_id: str, command_ids: List[str]):
+        command = await self.get(collar_id)
+        if command and command["id"] in command_ids:
+            await self.redis.delete(self._key(collar_id))
+
+
+class CommandQueue:
+    def __init__(self, store=None, redis_client=None):
+        self.store = store or MemoryCommandStore()
+        # With a shared store, workers tell each other about new commands over pub/sub
+        self.redis = redis_client
+        self._events: Dict[str, asyncio.Event] = {}
+        self._acks: List[dict] = []
+
+    def _wake(self, collar_id: str):
+        event = self._events.pop(collar_id, None)
+        if event:
+            event.set()
+
+    async def push(self, collar_id: str, command: dict):
+        await self.store.put(collar_id, command)
+        COLLAR_COMMANDS.labels("queued").inc()
+        if self.redis is not None:
+            await self.redis.publish(NOTIFY_CHANNEL, collar_id)
+        else:
+            self._wake(collar_id)
+
+    async def _take(self, collar_id: str) -> List[dict]:
+        command = await self.store.get(collar_id)
+        now = time.time()
+        if command is None or (command["delivered_at"] and now - command["delivered_at"] < COLLAR_REDELIVER_SECONDS):
+            return []
+        command = {**command, "delivered_at": now}
+        await self.store.put(collar_id, command)
+        COLLAR_COMMANDS.labels("delivered").inc()
+        return [public(command)]
+
+    async def fetch(self, collar_id: str, wait: float = 0) -> List[dict]:
+        """Commands due for the collar, waiting up to `wait` seconds for one to arrive."""
+        deadline = time.monotonic() + min(wait, COLLAR_POLL_TIMEOUT_SECONDS)
+        while True:
+            event = self._events.setdefault(collar_id, asyncio.Event())
+            commands = await self._take(collar_id)
+            remaining = deadline - time.monotonic()
+            if commands or remaining <= 0:
+                return commands
+            command = await self.store.get(collar_id)
+            if command is not None:
+                # Delivered but unacknowledged: wake up when it is due again
+                remaining = min(remaining, command["delivered_at"] + COLLAR_REDELIVER_SECONDS - time.time())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=max(remaining, 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def ack(self, collar_id: str, acks: List[dict]) -> int:
+        """Buffer acknowledgements ({"id", "success", "completed_at"}) for the next bulk write."""
+        now = datetime.now(timezone.utc)
+        await self.store.remove(collar_id, [ack["id"] for ack in acks])
+        self._acks.extend(
+            {
+                "b_id": ack["id"],
+                "b_collar_id": collar_id,
+                "b_completed_at": ack.get("completed_at") or now,
+                "b_is_successful": ack["success"]
+            }
+            for ack in acks
+        )
+        COLLAR_COMMANDS.labels("acked").inc(len(acks))
+        return len(acks)
+
+    @staticmethod
+    def write_acks(acks: List[dict]):
+        # Acks for another collar's interventions match no row
+        db = SessionLocal()
+        try:
+            db.execute(ACK_UPDATE, acks)
+            record_changes(db, "intervention", [ack["b_id"] for ack in acks])
+            db.commit()
+        finally:
+            db.close()
+
+    async def flush_acks(self) -> int:
+        """Write buffered acknowledgements in one bulk UPDATE; kept for a retry if it fails."""
+        acks, self._acks = self._acks, []
+        if not acks:
+            return 0
+        try:
+            await asyncio.to_thread(self.write_acks, acks)
+        except Exception:
+            self._acks[:0] = acks
+            raise
+        return len(acks)
+
+    async def run(self):
+        """Flush acknowledgements periodically (and relay pub/sub wake-ups with a shared store)."""
+        listener = asyncio.create_task(self._listen()) if self.redis is not None else None
+        try:
+            while True:
+                await asyncio.sleep(COLLAR_ACK_FLUSH_SECONDS)
+                try:
+                    await self.flush_acks()
+                except Exception as e:
+                    print(f"Error writing collar acks: {e}")
+        finally:
+            if listener:
+                listener.cancel()
+            if self._acks:
+                try:
+                    self.write_acks(self._acks)
+                except Exception as e:
+                    print(f"Error writing collar acks: {e}")
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(NOTIFY_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        collar_id = message["data"]
+                        self._wake(collar_id.decode() if isinstance(collar_id, bytes) else collar_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in collar command listener: {e}")
+                await asyncio.sleep(5)
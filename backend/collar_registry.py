@@ -0,0 +1,343 @@
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+import time
+import uuid
+
+import numpy as np
+
+from config import REGISTRY_MAX_MISSES, REGISTRY_MISS_TTL_SECONDS
+from models import Dog, Collar, Sex, SterilizationStatus
+from schemas import SensorDataCreate
+
+
+def enum_code(enum_cls, value) -> Optional[int]:
+    """Map a models/schemas enum member (or its name) to the integer code in models.py."""
+    if value is None:
+        return None
+    name = getattr(value, "name", value)
+    return enum_cls[name].value
+
+
+class DogProfile(NamedTuple):
+    """Static per-dog features the aggression model needs alongside each reading."""
+    age_years: Optional[int]
+    sex: Optional[int]
+    sterilization_status: Optional[int]
+
+
+class StaticTable:
+    """Read-only string key -> row lookup over sorted NumPy arrays.
+
+    Unlike dicts of Python objects, array buffers aren't written by reference
+    counting, so a table built before prefork.py forks stays shared between
+    workers instead of being copied page by page.
+    """
+
+    def __init__(self, keys, **columns):
+        keys = np.array([key.encode() for key in keys], dtype="S") if len(keys) else np.empty(0, dtype="S1")
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.columns = {name: np.asarray(values)[order] for name, values in columns.items()}
+
+    def find(self, key: str) -> int:
+        """Row index of key, or -1."""
+        encoded = key.encode()
+        i = int(np.searchsorted(self.keys, encoded))
+        if i < len(self.keys) and self.keys[i] == encoded:
+            return i
+        return -1
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class MissCache:
+    """Keys recently found missing, each expiring ttl seconds after it was added.
+
+    Entries are kept in insertion order, which with a fixed ttl is also expiry
+    order, so expired ones are dropped from the front as new ones come in.
+    """
+
+    def __init__(self, ttl: float = REGISTRY_MISS_TTL_SECONDS, max_size: int = REGISTRY_MAX_MISSES):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, key: str):
+        now = time.monotonic()
+        self._expires.pop(key, None)
+        self._expires[key] = now + self.ttl
+        while self._expires and (len(self._expires) > self.max_size or next(iter(self._expires.values())) <= now):
+            self._expires.popitem(last=False)
+
+    def discard(self, key: str):
+        self._expires.pop(key, None)
+
+    def clear(self):
+        self._expires.clear()
+
+    def __contains__(self, key: str) -> bool:
+        expires = self._expires.get(key)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            self._expires.pop(key, None)
+            return False
+        return True
+
+
+def _text(values) -> np.ndarray:
+    # Fixed-width bytes; None becomes b""
+    return np.array([(value or "").encode() for value in values], dtype="S") if len(values) else np.empty(0, dtype="S1")
+
+
+def _codes(values) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _optional_int(value: float) -> Optional[int]:
+    return None if np.isnan(value) else int(value)
+
+
+class CollarRegistry:
+    """In-memory map of collar_id/device_id -> dog_id plus each dog's static features.
+
+    Loaded once at startup and kept current by the dog/collar endpoints, so the
+    ingest path can validate and enrich readings without a DB round trip. A miss
+    (e.g. a collar registered through another worker) falls back to a single
+    lookup that is then cached.
+
+    The startup load is kept in StaticTables; changes since then go into small
+    override dicts, where None marks an entry dropped from the tables. Keys
+    that were dropped or not found in the DB are remembered in a MissCache, so
+    a deleted or unregistered collar that keeps sending doesn't cost a query
+    per reading; after the ttl the next miss looks again.
+    """
+
+    def __init__(self):
+        self._dog_table = StaticTable([], age_years=[], sex=[], sterilization_status=[])
+        self._collar_table = StaticTable([], device_id=_text([]), dog_id=_text([]))
+        self._device_table = StaticTable([], collar_id=_text([]))
+        # collar_id -> (device_id, dog_id)
+        self._collars: Dict[str, Optional[Tuple[str, Optional[str]]]] = {}
+        # device_id -> collar_id
+        self._devices: Dict[str, Optional[str]] = {}
+        # dog_id -> DogProfile
+        self._dogs: Dict[str, Optional[DogProfile]] = {}
+        # "collar:<id>", "device:<id>" and "dog:<id>" keys known to be missing
+        self._misses = MissCache()
+        self.loaded = False
+
+    def load(self, db: Session):
+        dogs = db.query(
+            Dog.id, Dog.age_years, Dog.sex, Dog.sterilization_status
+        ).filter(Dog.is_active == True).all()
+        self._dog_table = StaticTable(
+            [dog.id for dog in dogs],
+            age_years=_codes([dog.age_years for dog in dogs]),
+            sex=_codes([enum_code(Sex, dog.sex) for dog in dogs]),
+            sterilization_status=_codes([enum_code(SterilizationStatus, dog.sterilization_status) for dog in dogs])
+        )
+
+        collars = db.query(
+            Collar.id, Collar.device_id, Collar.dog_id
+        ).filter(Collar.is_active == True).all()
+        self._collar_table = StaticTable(
+            [collar.id for collar in collars],
+            device_id=_text([collar.device_id for collar in collars]),
+            dog_id=_text([collar.dog_id for collar in collars])
+        )
+        self._device_table = StaticTable(
+            [collar.device_id for collar in collars],
+            collar_id=_text([collar.id for collar in collars])
+        )
+
+        self._collars.clear()
+        self._devices.clear()
+        self._dogs.clear()
+        self._misses.clear()
+        self.loaded = True
+        print(f"Collar registry loaded: {len(collars)} collars, {len(dogs)} dogs")
+
+    def _dog(self, dog_id: str) -> Optional[DogProfile]:
+        if dog_id in self._dogs:
+            return self._dogs[dog_id]
+        i = self._dog_table.find(dog_id)
+        if i < 0:
+            return None
+        columns = self._dog_table.columns
+        return DogProfile(
+            age_years=_optional_int(columns["age_years"][i]),
+            sex=_optional_int(columns["sex"][i]),
+            sterilization_status=_optional_int(columns["sterilization_status"][i])
+        )
+
+    def _collar(self, collar_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        if collar_id in self._collars:
+            return self._collars[collar_id]
+        i = self._collar_table.find(collar_id)
+        if i < 0:
+            return None
+        columns = self._collar_table.columns
+        return columns["device_id"][i].decode(), columns["dog_id"][i].decode() or None
+
+    def _device(self, device_id: str) -> Optional[str]:
+        if device_id in self._devices:
+            return self._devices[device_id]
+        i = self._device_table.find(device_id)
+        return self._device_table.columns["collar_id"][i].decode() if i >= 0 else None
+
+    def _put_dog(self, dog_id: str, age_years, sex, sterilization_status):
+        self._misses.discard(f"dog:{dog_id}")
+        self._dogs[dog_id] = DogProfile(
+            age_years=age_years,
+            sex=enum_code(Sex, sex),
+            sterilization_status=enum_code(SterilizationStatus, sterilization_status)
+        )
+
+    def _put_collar(self, collar_id: str, device_id: str, dog_id: Optional[str]):
+        previous = self._collar(collar_id)
+        if previous and previous[0] != device_id:
+            self._devices[previous[0]] = None
+        self._collars[collar_id] = (device_id, dog_id)
+        self._devices[device_id] = collar_id
+        self._misses.discard(f"collar:{collar_id}")
+        self._misses.discard(f"device:{device_id}")
+
+    # Write-through hooks used by the dog/collar endpoints
+    def put_dog(self, dog):
+        """Cache a dog from an ORM row or a DogResponse."""
+        if not dog.is_active:
+            self.drop_dog(dog.id)
+            return
+        self._put_dog(dog.id, dog.age_years, dog.sex, dog.sterilization_status)
+
+    def drop_dog(self, dog_id: str):
+        self._dogs[dog_id] = None
+        self._misses.add(f"dog:{dog_id}")
+
+    def put_collar(self, collar):
+        """Cache a collar from an ORM row or a CollarResponse."""
+        if not collar.is_active:
+            self.drop_collar(collar.id)
+            return
+        self._put_collar(collar.id, collar.device_id, collar.dog_id)
+
+    def drop_collar(self, collar_id: str):
+        entry = self._collar(collar_id)
+        self._collars[collar_id] = None
+        self._misses.add(f"collar:{collar_id}")
+        if entry:
+            self._devices[entry[0]] = None
+            self._misses.add(f"device:{entry[0]}")
+
+    # Lookups
+    def _load_collar(self, db: Session, collar_id: Optional[str] = None, device_id: Optional[str] = None) -> Optional[str]:
+        miss = f"collar:{collar_id}" if collar_id is not None else f"device:{device_id}"
+        if miss in self._misses:
+            return None
+        query = db.query(Collar.id, Collar.device_id, Collar.dog_id).filter(Collar.is_active == True)
+        if collar_id is not None:
+            query = query.filter(Collar.id == collar_id)
+        else:
+            query = query.filter(Collar.device_id == device_id)
+        collar = query.first()
+        if not collar:
+            self._misses.add(miss)
+            return None
+        self._put_collar(collar.id, collar.device_id, collar.dog_id)
+        return collar.id
+
+    def _load_dog(self, db: Session, dog_id: str) -> Optional[DogProfile]:
+        if f"dog:{dog_id}" in self._misses:
+            return None
+        dog = db.query(
+            Dog.id, Dog.age_years, Dog.sex, Dog.sterilization_status
+        ).filter(Dog.id == dog_id, Dog.is_active == True).first()
+        if not dog:
+            self._misses.add(f"dog:{dog_id}")
+            return None
+        self._put_dog(dog.id, dog.age_years, dog.sex, dog.sterilization_status)
+        return self._dogs[dog.id]
+
+    def collar_for_device(self, db: Session, device_id: str) -> Optional[str]:
+        collar_id = self._device(device_id)
+        if collar_id is None:
+            collar_id = self._load_collar(db, device_id=device_id)
+        return collar_id
+
+    def resolve(self, db: Session, collar_id: str) -> Tuple[str, DogProfile]:
+        """Return (dog_id, profile) for a collar, raising ValueError if it is unknown or unassigned."""
+        entry = self._collar(collar_id)
+        if entry is None:
+            if self._load_collar(db, collar_id=collar_id) is None:
+                raise ValueError(f"Unknown collar {collar_id}")
+            entry = self._collars[collar_id]
+
+        dog_id = entry[1]
+        if dog_id is None:
+            raise ValueError(f"Collar {collar_id} is not assigned to a dog")
+
+        profile = self._dog(dog_id)
+        if profile is None:
+            profile = self._load_dog(db, dog_id)
+            if profile is None:
+                raise ValueError(f"Collar {collar_id} is assigned to unknown dog {dog_id}")
+        return dog_id, profile
+
+    def validate_reading(self, db: Session, sensor_data: SensorDataCreate) -> DogProfile:
+        """Check that the reading's collar belongs to its dog and return the dog's static features."""
+        dog_id, profile = self.resolve(db, sensor_data.collar_id)
+        if dog_id != sensor_data.dog_id:
+            raise ValueError(
+                f"Collar {sensor_data.collar_id} is assigned to dog {dog_id}, not {sensor_data.dog_id}"
+            )
+        return profile
+
+    def resolve_batch(self, db: Session, collar_uuids: np.ndarray) -> Dict[str, np.ndarray]:
+        """Resolve raw 16-byte collar UUIDs to per-row ids and dog features.
+
+        Only distinct collars are looked up; rows from unknown or unassigned
+        collars come back with known=False.
+        """
+        unique, inverse = np.unique(collar_uuids, return_inverse=True)
+        # NumPy strips trailing NUL bytes from "S16" items
+        collar_ids = np.array([str(uuid.UUID(bytes=raw.ljust(16, b"\0"))) for raw in unique], dtype=object)
+        return self._resolve_unique(db, collar_ids, inverse)
+
+    def resolve_ids(self, db: Session, collar_ids: np.ndarray) -> Dict[str, np.ndarray]:
+        """Same as resolve_batch for collar ids given as strings."""
+        unique, inverse = np.unique(collar_ids.astype(str), return_inverse=True)
+        return self._resolve_unique(db, unique.astype(object), inverse)
+
+    def _resolve_unique(self, db: Session, collar_ids: np.ndarray, inverse: np.ndarray) -> Dict[str, np.ndarray]:
+        n = len(collar_ids)
+        dog_ids = np.empty(n, dtype=object)
+        known = np.zeros(n, dtype=bool)
+        features = {field: np.full(n, np.nan) for field in DogProfile._fields}
+
+        for i, collar_id in enumerate(collar_ids):
+            try:
+                dog_ids[i], profile = self.resolve(db, collar_id)
+            except ValueError:
+                continue
+            known[i] = True
+            for field, value in profile._asdict().items():
+                if value is not None:
+                    features[field][i] = value
+
+        return {
+            "collar_id": collar_ids[inverse],
+            "dog_id": dog_ids[inverse],
+            "known": known[inverse],
+            **{field: values[inverse] for field, values in features.items()}
+        }
+
+    def get_profile(self, dog_id: str) -> Optional[DogProfile]:
+        return self._dog(dog_id)
+
+    def __len__(self) -> int:
+        added = sum(1 for collar_id, entry in self._collars.items() if entry and self._collar_table.find(collar_id) < 0)
+        dropped = sum(1 for collar_id, entry in self._collars.items() if entry is None and self._collar_table.find(collar_id) >= 0)
+        return len(self._collar_table) + added - dropped
@@ -0,0 +1,207 @@
+"""Streaming drift monitor for the aggression model.
+
+Live readings are compared with the data the model was trained on without
+keeping any rows: each model input is counted into DRIFT_BINS bins cut at
+quantiles of the training CSVs (features with few distinct values get a bin
+per value), and predicted classes are counted per class. Memory is fixed
+per feature whatever the traffic. Every DRIFT_INTERVAL_SECONDS check()
+compares the counts with the training proportions by PSI and by KS distance
+between the binned CDFs, publishes both as gauges and then multiplies the
+counts by DRIFT_DECAY, so the comparison follows recent traffic. NaN inputs
+are counted as missing, not binned. Counts are per process.
+"""
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import (
+    DRIFT_BINS, DRIFT_DECAY, DRIFT_INTERVAL_SECONDS, DRIFT_MIN_SAMPLES, DRIFT_PSI_THRESHOLD, DRIFT_REFERENCE_PATHS
+)
+from metrics import MODEL_DRIFT_SAMPLES, MODEL_FEATURE_KS, MODEL_FEATURE_PSI, MODEL_PREDICTION_PSI
+
+# Proportions are floored at this before PSI, so an empty bin doesn't make it infinite
+MIN_PROPORTION = 1e-4
+
+
+def bin_edges(values: np.ndarray, bins: int = DRIFT_BINS) -> np.ndarray:
+    """Inner cut points for a feature: reference quantiles, or midpoints between its distinct values."""
+    values = values[~np.isnan(values)]
+    distinct = np.unique(values)
+    if len(distinct) <= bins:
+        return (distinct[1:] + distinct[:-1]) / 2
+    return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+
+
+def psi(current: np.ndarray, reference: np.ndarray) -> float:
+    current = np.maximum(current, MIN_PROPORTION)
+    reference = np.maximum(reference, MIN_PROPORTION)
+    return float(np.sum((current - reference) * np.log(current / reference)))
+
+
+def ks(current: np.ndarray, reference: np.ndarray) -> float:
+    # Only differences at bin edges are visible, so this is a lower bound of the exact statistic
+    return float(np.max(np.abs(np.cumsum(current) - np.cumsum(reference))))
+
+
+def _proportions(counts: np.ndarray) -> np.ndarray:
+    total = counts.sum()
+    return counts / total if total > 0 else counts
+
+
+def load_reference(paths: Sequence[str], engineer, feature_names: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Training rows as float columns of the model features plus aggression_level.
+
+    engineer is MLService.engineer_features_columns, so derived features are
+    computed exactly as at serving time even for CSVs that only have raw readings.
+    """
+    parts: Dict[str, List[np.ndarray]] = {}
+    for path in paths:
+        table = np.genfromtxt(path, delimiter=",", names=True, dtype=np.float64)
+        columns = engineer({name: table[name] for name in table.dtype.names})
+        for name in (*feature_names, "aggression_level"):
+            parts.setdefault(name, []).append(columns[name])
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+class DriftMonitor:
+    def __init__(
+        self,
+        model_name: str,
+        feature_names: Sequence[str],
+        reference: Dict[str, np.ndarray],
+        classes: Dict[int, str],
+        bins: int = DRIFT_BINS,
+        decay: float = DRIFT_DECAY,
+        min_samples: int = DRIFT_MIN_SAMPLES,
+        psi_threshold: float = DRIFT_PSI_THRESHOLD,
+        interval: float = DRIFT_INTERVAL_SECONDS
+    ):
+        self.model_name = model_name
+        self.feature_names = list(feature_names)
+        self.classes = dict(sorted(classes.items()))
+        self.decay = decay
+        self.min_samples = min_samples
+        self.psi_threshold = psi_threshold
+        self.interval = interval
+
+        # All features' bins live in one flat array; feature j owns [offsets[j], offsets[j + 1])
+        self.edges = [bin_edges(reference[name], bins) for name in self.feature_names]
+        self.offsets = np.r_[0, np.cumsum([len(edges) + 1 for edges in self.edges])]
+        self.reference = np.zeros(self.offsets[-1])
+        for j, name in enumerate(self.feature_names):
+            self.reference[self.offsets[j]:self.offsets[j + 1]] = _proportions(self._bin_counts(j, reference[name]))
+        self.codes = np.array(list(self.classes))
+        labels = reference["aggression_level"]
+        self.reference_classes = _proportions((labels[:, None] == self.codes).sum(axis=0).astype(np.float64))
+
+        self.counts = np.zeros(self.offsets[-1])
+        self.missing = np.zeros(len(self.feature_names))
+        self.rows = 0.0
+        self.class_counts = np.zeros(len(self.classes))
+        self._lock = threading.Lock()
+        self.last_report: Optional[dict] = None
+
+    @classmethod
+    def for_model(cls, ml_service, paths: Sequence[str] = DRIFT_REFERENCE_PATHS, **kwargs) -> "DriftMonitor":
+        reference = load_reference(paths, ml_service.engineer_features_columns, ml_service.feature_names)
+        return cls(ml_service.model_name, ml_service.feature_names, reference, ml_service.aggression_levels, **kwargs)
+
+    def _bin_counts(self, j: int, values: np.ndarray) -> np.ndarray:
+        values = values[~np.isnan(values)]
+        return np.bincount(np.searchsorted(self.edges[j], values, side="right"), minlength=len(self.edges[j]) + 1)
+
+    def observe(self, X: np.ndarray, predicted: np.ndarray):
+        """Count a scored batch: X in feature_names order (unscaled), predicted class codes."""
+        n = len(X)
+        if n == 0:
+            return
+        missing = np.isnan(X)
+        bins = np.empty(X.shape, dtype=np.int64)
+        for j, edges in enumerate(self.edges):
+            bins[:, j] = np.searchsorted(edges, X[:, j], side="right") + self.offsets[j]
+        counts = np.bincount(bins[~missing], minlength=len(self.counts))
+        index = np.searchsorted(self.codes, predicted).clip(0, len(self.codes) - 1)
+        classes = np.bincount(index[self.codes[index] == predicted], minlength=len(self.codes))
+        with self._lock:
+            self.counts += counts
+            self.missing += missing.sum(axis=0)
+            self.rows += n
+            self.class_counts += classes
+
+    def check(self) -> dict:
+        """Compare the counts so far with the reference, publish the gauges, then decay the counts."""
+        with self._lock:
+            counts, missing, rows, class_counts = (
+                self.counts.copy(), self.missing.copy(), self.rows, self.class_counts.copy()
+            )
+            self.counts *= self.decay
+            self.missing *= self.decay
+            self.rows *= self.decay
+            self.class_counts *= self.decay
+
+        MODEL_DRIFT_SAMPLES.labels(self.model_name).set(rows)
+        report = {
+            "model": self.model_name,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "samples": round(rows, 1),
+            "min_samples": self.min_samples,
+            "psi_threshold": self.psi_threshold
+        }
+        if rows < self.min_samples:
+            report["status"] = "insufficient_data"
+            self.last_report = report
+            return report
+
+        features = {}
+        for j, name in enumerate(self.feature_names):
+            bins = slice(self.offsets[j], self.offsets[j + 1])
+            feature = {"psi": None, "ks": None, "missing_rate": round(float(missing[j] / rows), 4), "drifted": True}
+            features[name] = feature
+            if counts[bins].sum() == 0:
+                # Every recent value was missing; the training data has none missing
+                continue
+            current, reference = _proportions(counts[bins]), self.reference[bins]
+            feature["psi"] = round(psi(current, reference), 4)
+            feature["ks"] = round(ks(current, reference), 4)
+            feature["drifted"] = feature["psi"] > self.psi_threshold
+            MODEL_FEATURE_PSI.labels(self.model_name, name).set(feature["psi"])
+            MODEL_FEATURE_KS.labels(self.model_name, name).set(feature["ks"])
+
+        current_classes = _proportions(class_counts)
+        prediction_psi = round(psi(current_classes, self.reference_classes), 4)
+        MODEL_PREDICTION_PSI.labels(self.model_name).set(prediction_psi)
+        drifted = [name for name, feature in features.items() if feature["drifted"]]
+        report.update({
+            "status": "drift" if drifted or prediction_psi > self.psi_threshold else "ok",
+            "drifted_features": drifted,
+            "features": features,
+            "predictions": {
+                "psi": prediction_psi,
+                "drifted": prediction_psi > self.psi_threshold,
+                "current": {label: round(float(p), 4) for label, p in zip(self.classes.values(), current_classes)},
+                "reference": {
+                    label: round(float(p), 4) for label, p in zip(self.classes.values(), self.reference_classes)
+                }
+            }
+        })
+        self.last_report = report
+        return report
+
+    def report(self) -> dict:
+        """Result of the last check (none yet: the rows counted so far)."""
+        if self.last_report is not None:
+            return self.last_report
+        return {"model": self.model_name, "checked_at": None, "samples": round(self.rows, 1), "status": "pending"}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = self.check()
+                if report["status"] == "drift":
+                    print(f"Model drift detected: {', '.join(report['drifted_features']) or 'predicted classes'}")
+            except Exception as e:
+                print(f"Error checking model drift: {e}")
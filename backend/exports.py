@@ -0,0 +1,361 @@
+"""Report exports (CSV, PDF, XLSX) rendered off the API workers.
+
+A request becomes an ExportJob whose id is a hash of (kind, dog, range,
+format). If that job finished recently, or its range was already a day old
+when it was rendered, its file in EXPORT_DIR is served again; otherwise the
+job is (re)queued on a process pool, so rendering a year-long PDF doesn't
+hold an API worker. The pool reads rows in EXPORT_CHUNK_ROWS chunks (cold
+archive first, then sensor_data) and streams them into the writer.
+"""
+import csv
+import enum
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import (
+    EXPORT_CACHE_MAX_MB, EXPORT_CACHE_SECONDS, EXPORT_CHUNK_ROWS, EXPORT_DIR, EXPORT_STALE_SECONDS,
+    EXPORT_WORKERS, SENSOR_QUERY_DEFAULT_DAYS
+)
+from database import ReadSessionLocal, SessionLocal
+from models import Dog, ExportJob, Intervention, SensorData
+from retention import ColdArchive, to_naive_utc
+
+FORMATS = ("csv", "pdf", "xlsx")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+DOG_DATA_COLUMNS = (
+    "recorded_at", "heart_rate_bpm", "hrv_rmssd", "body_temperature", "stress_cortisol",
+    "body_posture", "tail_position", "ear_position", "vocalization_type", "other_dogs_nearby",
+    "human_proximity_meters", "aggression_level", "aggression_probability", "intervention_required",
+    "gps_latitude", "gps_longitude",
+)
+INTERVENTION_COLUMNS = (
+    "triggered_at", "dog_id", "collar_id", "intervention_type", "aggression_level", "confidence",
+    "ultrasonic_frequency", "duration_seconds", "is_acknowledged", "is_successful", "completed_at",
+)
+
+# Rows per XLSX sheet (Excel's limit, less the header)
+XLSX_SHEET_ROWS = 1048575
+
+
+def job_id_for(kind: str, dog_id: Optional[str], start_time: datetime, end_time: datetime, fmt: str) -> str:
+    key = f"{kind}:{dog_id or '*'}:{start_time:%Y%m%dT%H%M%S}:{end_time:%Y%m%dT%H%M%S}:{fmt}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def export_range(start_time: Optional[datetime], end_time: Optional[datetime]):
+    """Naive UTC range to whole seconds; an open end is the current minute, so repeats share a cache entry."""
+    end_time = to_naive_utc(end_time) or datetime.utcnow().replace(second=0, microsecond=0) + timedelta(minutes=1)
+    start_time = to_naive_utc(start_time) or end_time - timedelta(days=SENSOR_QUERY_DEFAULT_DAYS)
+    return start_time.replace(microsecond=0), end_time.replace(microsecond=0)
+
+
+def _cell(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _is_fresh(job: ExportJob, now: datetime) -> bool:
+    if job.status != "completed" or not job.path or not os.path.exists(job.path):
+        return False
+    finished_at = to_naive_utc(job.finished_at)
+    return (
+        finished_at - to_naive_utc(job.end_time) >= timedelta(days=1)
+        or now - finished_at < timedelta(seconds=EXPORT_CACHE_SECONDS)
+    )
+
+
+# Row sources: lists of tuples in column order
+
+def dog_data_chunks(db: Session, archive: ColdArchive, dog_id: str, start_time: datetime, end_time: datetime) -> Iterator[List[tuple]]:
+    # Archived days come first; rows still in sensor_data start at the oldest hot reading
+    hot_start = db.query(func.min(SensorData.recorded_at)).filter(
+        SensorData.dog_id == dog_id, SensorData.recorded_at >= start_time, SensorData.recorded_at <= end_time
+    ).scalar()
+    archive_end = min(end_time, to_naive_utc(hot_start) - timedelta(microseconds=1)) if hot_start else end_time
+    if archive.has_dog(dog_id):
+        month = start_time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while month <= archive_end:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            table = archive.read(dog_id, max(start_time, month), min(archive_end, next_month - timedelta(microseconds=1)),
+                                 columns=list(DOG_DATA_COLUMNS))
+            if table.num_rows:
+                table = table.sort_by("recorded_at")
+                for batch in table.to_batches(max_chunksize=EXPORT_CHUNK_ROWS):
+                    rows = zip(*(column.to_pylist() for column in batch.columns))
+                    yield [tuple(_cell(value) for value in row) for row in rows]
+            month = next_month
+
+    query = select(*(getattr(SensorData, name) for name in DOG_DATA_COLUMNS)).where(
+        SensorData.dog_id == dog_id,
+        SensorData.recorded_at >= (hot_start or start_time),
+        SensorData.recorded_at <= end_time
+    ).order_by(SensorData.recorded_at).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    for partition in db.execute(query).partitions():
+        yield [tuple(_cell(value) for value in row) for row in partition]
+
+
+def intervention_chunks(db: Session, dog_id: Optional[str], start_time: datetime, end_time: datetime) -> Iterator[List[tuple]]:
+    query = select(*(getattr(Intervention, name) for name in INTERVENTION_COLUMNS)).where(
+        Intervention.triggered_at >= start_time, Intervention.triggered_at <= end_time
+    )
+    if dog_id:
+        query = query.where(Intervention.dog_id == dog_id)
+    query = query.order_by(Intervention.triggered_at).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    for partition in db.execute(query).partitions():
+        yield [tuple(_cell(value) for value in row) for row in partition]
+
+
+# Writers: header once, then rows chunk by chunk
+
+class CsvWriter:
+    def __init__(self, path: str, title: str, columns: Sequence[str]):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(
+            tuple(value.isoformat() if isinstance(value, datetime) else value for value in row) for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxWriter:
+    def __init__(self, path: str, title: str, columns: Sequence[str]):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.columns = list(columns)
+        # Write-only mode streams rows to disk instead of keeping cells in memory
+        self.book = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = XLSX_SHEET_ROWS
+
+    def write(self, rows: List[tuple]):
+        for row in rows:
+            if self.sheet_rows >= XLSX_SHEET_ROWS:
+                self.sheet = self.book.create_sheet(f"Export {len(self.book.worksheets) + 1}")
+                self.sheet.append(self.columns)
+                self.sheet_rows = 0
+            # Excel has no time zones
+            self.sheet.append([to_naive_utc(value) if isinstance(value, datetime) else value for value in row])
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            self.sheet = self.book.create_sheet("Export 1")
+            self.sheet.append(self.columns)
+        self.book.save(self.path)
+
+
+class PdfWriter:
+    """Landscape table drawn straight onto the canvas page by page, so memory stays flat."""
+
+    FONT_SIZE = 6.5
+    LINE_HEIGHT = 9
+    MARGIN = 28
+
+    def __init__(self, path: str, title: str, columns: Sequence[str]):
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(path, pagesize=landscape(A4))
+        self.width, self.height = landscape(A4)
+        self.title = title
+        self.columns = list(columns)
+        # Timestamps and ids get twice the width of other columns
+        weights = [2 if name.endswith(("_at", "_id")) else 1 for name in self.columns]
+        unit = (self.width - 2 * self.MARGIN) / sum(weights)
+        self.x = [self.MARGIN + unit * sum(weights[:i]) for i in range(len(weights))]
+        self.max_chars = [int(unit * weight / (self.FONT_SIZE * 0.5)) for weight in weights]
+        self.page = 0
+        self.y = 0.0
+        self._new_page()
+
+    def _line(self, values, font: str):
+        self.canvas.setFont(font, self.FONT_SIZE)
+        for x, chars, value in zip(self.x, self.max_chars, values):
+            self.canvas.drawString(x, self.y, _text(value)[:chars])
+        self.y -= self.LINE_HEIGHT
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - self.MARGIN
+        self.canvas.setFont("Helvetica-Bold", 10)
+        self.canvas.drawString(self.MARGIN, self.y, self.title)
+        self.canvas.setFont("Helvetica", self.FONT_SIZE)
+        self.canvas.drawRightString(self.width - self.MARGIN, self.y, f"Page {self.page}")
+        self.y -= 2 * self.LINE_HEIGHT
+        self._line(self.columns, "Helvetica-Bold")
+
+    def write(self, rows: List[tuple]):
+        for row in rows:
+            if self.y < self.MARGIN:
+                self._new_page()
+            self._line(row, "Helvetica")
+
+    def close(self):
+        self.canvas.save()
+
+
+WRITERS = {"csv": CsvWriter, "pdf": PdfWriter, "xlsx": XlsxWriter}
+
+
+def evict_cache(root: str = EXPORT_DIR, max_mb: int = EXPORT_CACHE_MAX_MB):
+    files = [os.path.join(root, name) for name in os.listdir(root) if not name.endswith(".tmp")]
+    files.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(path) for path in files)
+    while files and total > max_mb * 1024 * 1024:
+        path = files.pop(0)
+        total -= os.path.getsize(path)
+        os.remove(path)
+
+
+def render(job_id: str) -> int:
+    """Pool entry point: render one job to EXPORT_DIR and record the outcome."""
+    db = SessionLocal()
+    # Rows come from the read replica (or read pool); the job row is updated on the primary
+    reads = ReadSessionLocal()
+    try:
+        job = db.get(ExportJob, job_id)
+        job.status = "running"
+        db.commit()
+        tmp_path = None
+        try:
+            start_time, end_time = to_naive_utc(job.start_time), to_naive_utc(job.end_time)
+            if job.kind == "dog-data":
+                dog = db.get(Dog, job.dog_id)
+                title = f"Sensor data: {dog.name if dog else job.dog_id}, {start_time:%Y-%m-%d %H:%M} to {end_time:%Y-%m-%d %H:%M} UTC"
+                columns, chunks = DOG_DATA_COLUMNS, dog_data_chunks(reads, ColdArchive(), job.dog_id, start_time, end_time)
+            else:
+                title = f"Interventions{f' for dog {job.dog_id}' if job.dog_id else ''}, {start_time:%Y-%m-%d %H:%M} to {end_time:%Y-%m-%d %H:%M} UTC"
+                columns, chunks = INTERVENTION_COLUMNS, intervention_chunks(reads, job.dog_id, start_time, end_time)
+
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            path = os.path.abspath(os.path.join(EXPORT_DIR, f"{job.id}.{job.format}"))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            writer = WRITERS[job.format](tmp_path, title, columns)
+            rows = 0
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+                    rows += len(chunk)
+            finally:
+                writer.close()
+            os.replace(tmp_path, path)
+        except Exception as e:
+            # evict_cache() skips *.tmp files, so a partial file would stay for good
+            if tmp_path is not None:
+                with suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            print(f"Export {job_id} failed: {e}")
+            raise
+
+        job.status = "completed"
+        job.rows = rows
+        job.path = path
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        evict_cache()
+        return rows
+    finally:
+        reads.close()
+        db.close()
+
+
+class ExportService:
+    def __init__(self, workers: int = EXPORT_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _submit(self, job_id: str):
+        if self._pool is None:
+            # Spawned, not forked: the API process has threads and an event loop running
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._pool.submit(render, job_id).add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        # render() has recorded the failure on the job; this catches a crashed pool process
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Export worker error: {future.exception()}")
+
+    def request(
+        self, db: Session, kind: str, fmt: str, dog_id: Optional[str] = None,
+        start_time: Optional[datetime] = None, end_time: Optional[datetime] = None
+    ) -> ExportJob:
+        """Return the cached export for these parameters, or queue one."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported export format {fmt}")
+        start_time, end_time = export_range(start_time, end_time)
+        if start_time >= end_time:
+            raise ValueError("start_time must be before end_time")
+        job_id = job_id_for(kind, dog_id, start_time, end_time, fmt)
+        now = datetime.utcnow()
+
+        job = db.get(ExportJob, job_id)
+        if job is not None:
+            if _is_fresh(job, now):
+                return job
+            updated_at = to_naive_utc(job.updated_at or job.created_at)
+            if job.status in ("queued", "running") and updated_at and now - updated_at < timedelta(seconds=EXPORT_STALE_SECONDS):
+                return job
+            job.status = "queued"
+            job.rows = 0
+            job.error = None
+            job.finished_at = None
+            job.updated_at = now
+        else:
+            job = ExportJob(id=job_id, kind=kind, dog_id=dog_id, format=fmt, start_time=start_time, end_time=end_time)
+            db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker queued the same export first
+            db.rollback()
+            return db.get(ExportJob, job_id)
+        self._submit(job_id)
+        db.refresh(job)
+        return job
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,216 @@
+"""Streaming health alerts from per-dog EWMA baselines.
+
+Every reading updates an exponentially weighted mean and variance per dog
+and signal in O(1), so no periodic scans of sensor_data are needed. A
+reading whose z-score against the dog's baseline (before the update) passes
+HEALTH_Z_THRESHOLD in the unhealthy direction raises an alert; it clears
+once a reading is back within HEALTH_Z_THRESHOLD - 1, or expires after
+HEALTH_ALERT_TTL_SECONDS without a repeat. Only the alerts of the dogs in a
+batch are looked at, and expired ones are dropped when next touched or
+read, so the cost stays per reading. Baselines and active alerts are per
+process.
+"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    HEALTH_ALERT_TTL_SECONDS, HEALTH_EWMA_ALPHA, HEALTH_MAX_ACTIVE_ALERTS, HEALTH_WARMUP_READINGS,
+    HEALTH_Z_THRESHOLD
+)
+from metrics import HEALTH_ALERTS_RAISED
+from services import temp_deviation
+
+
+# Reading fields the signals are computed from
+READING_FIELDS = ("heart_rate_bpm", "hrv_rmssd", "body_temperature", "stress_cortisol")
+
+
+class HealthSignal(NamedTuple):
+    name: str
+    label: str
+    values: Callable[[Dict[str, np.ndarray]], np.ndarray]
+    # +1 alerts on high values, -1 on low ones
+    direction: int
+    # Floor for the baseline's standard deviation, so a very steady dog doesn't alert on noise
+    min_std: float
+
+
+SIGNALS = (
+    HealthSignal("heart_rate", "Heart rate", lambda columns: columns["heart_rate_bpm"], 1, 3.0),
+    HealthSignal("hrv", "Heart rate variability", lambda columns: columns["hrv_rmssd"], -1, 3.0),
+    HealthSignal("temp_deviation", "Body temperature deviation",
+                 lambda columns: temp_deviation(columns["body_temperature"]), 1, 0.1),
+    HealthSignal("cortisol", "Cortisol", lambda columns: columns["stress_cortisol"], 1, 0.5),
+)
+
+MIN_STD = np.array([signal.min_std for signal in SIGNALS])
+DIRECTION = np.array([signal.direction for signal in SIGNALS], dtype=np.float64)
+
+# Severity by |z| as a multiple of the threshold, highest first
+SEVERITY_STEPS = ((2.0, "critical"), (1.5, "high"), (1.0, "medium"))
+SEVERITY_RANK = {"medium": 1, "high": 2, "critical": 3}
+
+
+def _rounds(slots: np.ndarray) -> List[np.ndarray]:
+    """Split reading positions so each group has at most one reading per dog, in arrival order."""
+    n = len(slots)
+    order = np.argsort(slots, kind="stable")
+    sorted_slots = slots[order]
+    starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+    by_rank = np.argsort(rank, kind="stable")
+    return np.split(by_rank, np.cumsum(np.bincount(rank))[:-1])
+
+
+class HealthMonitor:
+    def __init__(
+        self,
+        alpha: float = HEALTH_EWMA_ALPHA,
+        z_threshold: float = HEALTH_Z_THRESHOLD,
+        warmup: int = HEALTH_WARMUP_READINGS,
+        alert_ttl: int = HEALTH_ALERT_TTL_SECONDS,
+        max_alerts: int = HEALTH_MAX_ACTIVE_ALERTS
+    ):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.alert_ttl = alert_ttl
+        self.max_alerts = max_alerts
+        # Baselines are rows of dense arrays, one row (slot) per dog
+        self._slots: Dict[str, int] = {}
+        self._mean = np.zeros((0, len(SIGNALS)))
+        self._var = np.zeros((0, len(SIGNALS)))
+        self._count = np.zeros((0, len(SIGNALS)), dtype=np.int64)
+        # (dog_id, signal name) -> alert, least recently seen first
+        self._alerts: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+
+    def _slot_array(self, dog_ids: Sequence[str]) -> np.ndarray:
+        slots = np.empty(len(dog_ids), dtype=np.int64)
+        for i, dog_id in enumerate(dog_ids):
+            slot = self._slots.get(dog_id)
+            if slot is None:
+                slot = self._slots[dog_id] = len(self._slots)
+            slots[i] = slot
+        if len(self._slots) > len(self._mean):
+            grow = max(len(self._slots), 2 * len(self._mean), 64) - len(self._mean)
+            self._mean = np.vstack([self._mean, np.zeros((grow, len(SIGNALS)))])
+            self._var = np.vstack([self._var, np.zeros((grow, len(SIGNALS)))])
+            self._count = np.vstack([self._count, np.zeros((grow, len(SIGNALS)), dtype=np.int64)])
+        return slots
+
+    def baseline(self, dog_id: str) -> Optional[dict]:
+        slot = self._slots.get(dog_id)
+        if slot is None:
+            return None
+        return {
+            signal.name: {
+                "mean": float(self._mean[slot, j]),
+                "std": float(np.sqrt(self._var[slot, j])),
+                "readings": int(self._count[slot, j])
+            }
+            for j, signal in enumerate(SIGNALS)
+        }
+
+    def observe(self, dog_ids: Sequence[str], columns: Dict[str, np.ndarray], now: Optional[datetime] = None) -> List[dict]:
+        """Update baselines with readings (in arrival order); returns newly raised or escalated alerts.
+
+        columns holds the reading fields as float arrays with NaN for missing values.
+        """
+        n = len(dog_ids)
+        if n == 0:
+            return []
+        now = now or datetime.utcnow()
+        values = np.column_stack([np.asarray(signal.values(columns), dtype=np.float64) for signal in SIGNALS])
+        baselines = np.empty_like(values)
+        z = np.full_like(values, np.nan)
+        slots = self._slot_array(dog_ids)
+
+        for positions in _rounds(slots):
+            rows = slots[positions]
+            x = values[positions]
+            mean, var, count = self._mean[rows], self._var[rows], self._count[rows]
+            present = ~np.isnan(x)
+            delta = np.where(present, x - mean, 0.0)
+            std = np.maximum(np.sqrt(var), MIN_STD)
+            z[positions] = np.where(present & (count >= self.warmup), delta / std, np.nan)
+            baselines[positions] = mean
+
+            first = present & (count == 0)
+            self._mean[rows] = np.where(first, x, mean + self.alpha * delta)
+            self._var[rows] = np.where(first, 0.0, np.where(present, (1 - self.alpha) * (var + self.alpha * delta ** 2), var))
+            self._count[rows] = count + present
+
+        return self._update_alerts(dog_ids, slots, values, baselines, z * DIRECTION, now)
+
+    def _update_alerts(self, dog_ids, slots, values, baselines, scores, now: datetime) -> List[dict]:
+        raised = []
+        with np.errstate(invalid="ignore"):
+            over = scores >= self.z_threshold
+            back = scores < self.z_threshold - 1
+
+        for i, j in zip(*np.nonzero(over)):
+            key = (dog_ids[i], SIGNALS[j].name)
+            alert = self._alerts.get(key)
+            if alert is not None and self._expired(alert, now):
+                del self._alerts[key]
+                alert = None
+            severity = next(name for step, name in SEVERITY_STEPS if scores[i, j] >= self.z_threshold * step)
+            update = {
+                "value": round(float(values[i, j]), 2),
+                "baseline": round(float(baselines[i, j]), 2),
+                "z_score": round(float(scores[i, j] * DIRECTION[j]), 2),
+                "last_seen": now.isoformat()
+            }
+            if alert is not None:
+                escalated = SEVERITY_RANK[severity] > SEVERITY_RANK[alert["severity"]]
+                alert.update(update, severity=severity if escalated else alert["severity"])
+                alert["message"] = self._message(SIGNALS[j], alert)
+                self._alerts.move_to_end(key)
+                if escalated:
+                    raised.append(dict(alert))
+                continue
+            alert = {
+                "id": str(uuid.uuid4()),
+                "dog_id": dog_ids[i],
+                "alert_type": SIGNALS[j].name,
+                "severity": severity,
+                "timestamp": now.isoformat(),
+                **update
+            }
+            alert["message"] = self._message(SIGNALS[j], alert)
+            self._alerts[key] = alert
+            raised.append(dict(alert))
+            HEALTH_ALERTS_RAISED.labels(SIGNALS[j].name, severity).inc()
+
+        if self._alerts:
+            # Each dog's latest reading in the batch decides whether its alerts clear
+            _, last_from_end = np.unique(slots[::-1], return_index=True)
+            latest = {dog_ids[i]: i for i in (len(slots) - 1 - last_from_end).tolist()}
+            for dog_id, i in latest.items():
+                for j in np.flatnonzero(back[i]).tolist():
+                    self._alerts.pop((dog_id, SIGNALS[j].name), None)
+
+        while len(self._alerts) > self.max_alerts:
+            self._alerts.popitem(last=False)
+        return raised
+
+    @staticmethod
+    def _message(signal: HealthSignal, alert: dict) -> str:
+        direction = "above" if signal.direction > 0 else "below"
+        return f"{signal.label} {alert['value']} is {direction} this dog's baseline of {alert['baseline']}"
+
+    def _expired(self, alert: dict, now: datetime) -> bool:
+        return (now - datetime.fromisoformat(alert["last_seen"])).total_seconds() > self.alert_ttl
+
+    def active_alerts(self, now: Optional[datetime] = None) -> List[dict]:
+        """Unexpired alerts, most recently seen first."""
+        now = now or datetime.utcnow()
+        # Least recently seen first, so the expired ones are at the front
+        while self._alerts and self._expired(next(iter(self._alerts.values())), now):
+            self._alerts.popitem(last=False)
+        return [dict(alert) for alert in reversed(self._alerts.values())]
@@ -0,0 +1,237 @@
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import desc, update
+from sqlalchemy.orm import Session
+
+from change_log import record_changes
+from config import INTERVENTION_COOLDOWNS, INTERVENTION_EXTEND_WRITE_SECONDS
+from models import Intervention
+from retention import to_naive_utc
+from services import copy_rows
+
+LEVEL_RANK = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
+
+
+def _timestamp(value: datetime) -> float:
+    return to_naive_utc(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _datetime(timestamp: float) -> datetime:
+    # Naive UTC, like the rest of the ingest path
+    return datetime.utcfromtimestamp(timestamp)
+
+
+class InterventionState(NamedTuple):
+    """A dog's current (or last) intervention; times are epoch seconds."""
+    intervention_id: str
+    level: str
+    triggered_at: float
+    completed_at: float
+    # completed_at as last written to the database
+    stored_completed_at: float
+
+
+class MemoryStateStore:
+    """Per-process intervention state; entries drop out once their cooldown has passed."""
+
+    def __init__(self):
+        self._states: Dict[str, tuple] = {}
+        self._puts = 0
+
+    async def get_many(self, dog_ids: List[str]) -> Dict[str, InterventionState]:
+        now = time.time()
+        states = {}
+        for dog_id in dog_ids:
+            entry = self._states.get(dog_id)
+            if entry and entry[1] > now:
+                states[dog_id] = entry[0]
+        return states
+
+    async def put_many(self, states: Dict[str, InterventionState], expires_at: Dict[str, float]):
+        for dog_id, state in states.items():
+            self._states[dog_id] = (state, expires_at[dog_id])
+        self._puts += len(states)
+        if self._puts >= 10000:
+            self._puts = 0
+            now = time.time()
+            for dog_id in [dog_id for dog_id, entry in self._states.items() if entry[1] <= now]:
+                del self._states[dog_id]
+
+
+class RedisStateStore:
+    """Intervention state shared by all workers, one expiring key per dog."""
+
+    def __init__(self, redis_client, prefix: str = "intervention_state"):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def _key(self, dog_id: str) -> str:
+        return f"dog:{dog_id}:{self.prefix}"
+
+    async def get_many(self, dog_ids: List[str]) -> Dict[str, InterventionState]:
+        if not dog_ids:
+            return {}
+        values = await self.redis.mget([self._key(dog_id) for dog_id in dog_ids])
+        return {
+            dog_id: InterventionState(*json.loads(value))
+            for dog_id, value in zip(dog_ids, values)
+            if value is not None
+        }
+
+    async def put_many(self, states: Dict[str, InterventionState], expires_at: Dict[str, float]):
+        now = time.time()
+        for dog_id, state in states.items():
+            await self.redis.set(self._key(dog_id), json.dumps(list(state)), ex=max(1, int(expires_at[dog_id] - now)))
+
+
+class InterventionEngine:
+    """Turns intervention triggers into at most one open intervention per dog.
+
+    A trigger at or below the level of the dog's current intervention, while
+    that intervention is running or within its level's cooldown after
+    completed_at, extends completed_at instead of creating a row ("extended").
+    A higher level closes the current intervention and opens a new one
+    ("escalated"); anything else opens a new one ("new"). Extensions are
+    written once they run INTERVENTION_EXTEND_WRITE_SECONDS past the stored
+    completed_at (and when the intervention is replaced), so a long incident
+    costs a few updates rather than a row per reading, and the stored
+    completed_at is at most that far behind.
+
+    State lives in a MemoryStateStore or RedisStateStore; a dog without state
+    picks up its latest intervention from the database.
+    """
+
+    def __init__(
+        self,
+        store,
+        cooldowns: Dict[str, int] = INTERVENTION_COOLDOWNS,
+        extend_write_seconds: int = INTERVENTION_EXTEND_WRITE_SECONDS
+    ):
+        self.store = store
+        self.cooldowns = cooldowns
+        self.extend_write_seconds = extend_write_seconds
+
+    def _cooldown(self, level: str) -> int:
+        return self.cooldowns.get(level, 0)
+
+    def _load_latest(self, db: Session, dog_ids: Iterable[str], now: float) -> Dict[str, InterventionState]:
+        # Only interventions recent enough to still be within a cooldown matter;
+        # incidents are assumed to last less than a day
+        since = _datetime(now - max(self.cooldowns.values(), default=0) - 86400)
+        rows = db.query(
+            Intervention.id, Intervention.dog_id, Intervention.intervention_type,
+            Intervention.duration_seconds, Intervention.triggered_at, Intervention.completed_at
+        ).filter(
+            Intervention.dog_id.in_(list(dog_ids)),
+            Intervention.triggered_at >= since
+        ).order_by(desc(Intervention.triggered_at)).all()
+
+        states = {}
+        for row in rows:
+            if row.dog_id in states:
+                continue
+            triggered_at = _timestamp(row.triggered_at)
+            completed_at = (
+                _timestamp(row.completed_at) if row.completed_at is not None
+                else triggered_at + (row.duration_seconds or 0)
+            )
+            level = row.intervention_type.name
+            states[row.dog_id] = InterventionState(row.id, level, triggered_at, completed_at, completed_at)
+        return states
+
+    async def process(self, db: Session, triggers: Dict[str, np.ndarray], now: Optional[datetime] = None) -> dict:
+        """Apply triggers (intervention columns, in arrival order) and commit.
+
+        Returns per-trigger "action" and "intervention_id" arrays, and "opened",
+        the row dicts of interventions created (new or escalated).
+        """
+        n = len(triggers["dog_id"])
+        actions = np.empty(n, dtype=object)
+        intervention_ids = np.empty(n, dtype=object)
+        if n == 0:
+            return {"action": actions, "intervention_id": intervention_ids, "opened": []}
+
+        now_dt = now or datetime.utcnow()
+        now_ts = _timestamp(now_dt)
+        triggers = {name: np.asarray(values).tolist() for name, values in triggers.items()}
+        dog_ids = list(dict.fromkeys(triggers["dog_id"]))
+        states = await self.store.get_many(dog_ids)
+        missing = [dog_id for dog_id in dog_ids if dog_id not in states]
+        if missing:
+            states.update(self._load_latest(db, missing, now_ts))
+
+        opened: List[dict] = []
+        completed_updates: Dict[str, float] = {}
+        changed: Dict[str, InterventionState] = {}
+        for i in range(n):
+            dog_id = triggers["dog_id"][i]
+            level = str(triggers["intervention_type"][i])
+            duration = int(triggers["duration_seconds"][i] or 0)
+            state = states.get(dog_id)
+
+            active = state is not None and now_ts <= state.completed_at + self._cooldown(state.level)
+            if active and LEVEL_RANK[level] <= LEVEL_RANK[state.level]:
+                state = state._replace(completed_at=max(state.completed_at, now_ts + duration))
+                if state.completed_at - state.stored_completed_at >= self.extend_write_seconds:
+                    completed_updates[state.intervention_id] = state.completed_at
+                    state = state._replace(stored_completed_at=state.completed_at)
+                actions[i] = "extended"
+            else:
+                if active:
+                    # Escalation ends the lower-level intervention now
+                    completed_updates[state.intervention_id] = min(state.completed_at, now_ts)
+                    actions[i] = "escalated"
+                else:
+                    if state is not None and state.completed_at > state.stored_completed_at:
+                        # Flush the last unwritten extension of the expired intervention
+                        completed_updates[state.intervention_id] = state.completed_at
+                    actions[i] = "new"
+                intervention_id = str(uuid.uuid4())
+                completed_at = now_ts + duration
+                opened.append({
+                    "id": intervention_id,
+                    **{name: values[i] for name, values in triggers.items()},
+                    "triggered_at": now_dt,
+                    "completed_at": _datetime(completed_at)
+                })
+                state = InterventionState(intervention_id, level, now_ts, completed_at, completed_at)
+            states[dog_id] = changed[dog_id] = state
+            intervention_ids[i] = state.intervention_id
+
+        if opened:
+            copy_rows(db, Intervention, {name: [row[name] for row in opened] for name in opened[0]})
+        if completed_updates:
+            db.execute(update(Intervention), [
+                {"id": intervention_id, "completed_at": datetime.fromtimestamp(completed_at, timezone.utc)}
+                for intervention_id, completed_at in completed_updates.items()
+            ])
+        record_changes(db, "intervention", [*(row["id"] for row in opened), *completed_updates])
+        db.commit()
+
+        await self.store.put_many(changed, {
+            dog_id: state.completed_at + self._cooldown(state.level) for dog_id, state in changed.items()
+        })
+        return {"action": actions, "intervention_id": intervention_ids, "opened": opened}
+
+
+def opened_alert(row: dict, escalated: bool) -> dict:
+    """Websocket payload for a newly opened intervention."""
+    level = row["aggression_level"]
+    return {
+        "id": row["id"],
+        "dog_id": row["dog_id"],
+        "collar_id": row["collar_id"],
+        "intervention_type": str(row["intervention_type"]),
+        "aggression_level": getattr(level, "name", level),
+        "confidence": float(row["confidence"]) if row["confidence"] is not None else None,
+        "ultrasonic_frequency": int(row["ultrasonic_frequency"]),
+        "duration_seconds": int(row["duration_seconds"]),
+        "escalated": escalated,
+        "triggered_at": row["triggered_at"].isoformat(),
+        "completed_at": row["completed_at"].isoformat()
+    }
@@ -1,37 +1,111 @@
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, Request, BackgroundTasks, Response, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Set
 import asyncio
 import json
-import redis
+from contextlib import asynccontextmanager
+import redis.asyncio as redis
 from datetime import datetime, timedelta
 import os
+import time
+import uuid
+import numpy as np
 from dotenv import load_dotenv
 
-from database import get_db, engine, Base
-from models import Dog, Collar, SensorData, Intervention, User
+from database import get_db, get_read_db, engine, read_engine, SessionLocal
+from models import Dog, Collar, SensorData, Intervention, User, AggressionLevel, BulkLoadJob, ExportJob
 from schemas import (
     DogCreate, DogResponse, CollarCreate, CollarResponse,
     SensorDataCreate, SensorDataResponse, InterventionResponse,
-    UserCreate, UserResponse, LoginRequest, Token
+    UserCreate, UserResponse, LoginRequest, Token,
+    BulkLoadRequest, BulkLoadJobResponse, CollarCommand, CollarCommandAckBatch,
+    ExportFormat, ExportJobResponse, ResponseLayout
 )
 from services import (
     DogService, CollarService, SensorDataService, 
-    InterventionService, AuthService, MLService
+    InterventionService, AuthService, MLService, AuthBusyError,
+    vitals_in_range, sensor_data_columns
 )
 from websocket_manager import ConnectionManager
+from collar_registry import CollarRegistry
+from wire_format import decode_batch, to_columns, WireFormatError
+from retention import ColdArchive, RetentionService
+from partitions import ensure_partitions
+from bulk_loader import BulkLoader, job_id_for
+from admission import AdmissionController, MemoryRateLimiter, RedisRateLimiter, HIGH, LOW
+from exports import ExportService, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from readiness import Readiness
+from serialization import json_response, list_responses, objects, rows_response
+from change_log import changes_since, prune as prune_change_log
+from photos import PhotoService, CACHE_CONTROL as PHOTO_CACHE_CONTROL, variant_url
+from collar_commands import CommandQueue, RedisCommandStore, command_for
+from drift_monitor import DriftMonitor
+from cohort_analytics import CohortAnalytics, parse_filters, parse_group_by
+from health_monitor import HealthMonitor, READING_FIELDS as HEALTH_READING_FIELDS
+from intervention_engine import InterventionEngine, MemoryStateStore, RedisStateStore, opened_alert
+from metrics import REQUEST_LATENCY, instrument_pool, render_metrics, stage_timer
+from config import (
+    WIRE_MAX_BATCH, RETENTION_ENABLED, RETENTION_INTERVAL_MINUTES, DB_PARTITIONING, BULK_LOAD_DIR,
+    INTERVENTION_STATE_BACKEND, COLLAR_COMMAND_BACKEND, COLLAR_POLL_TIMEOUT_SECONDS, RATE_LIMIT_BACKEND,
+    COLLAR_RATE_PER_SECOND, SYNC_MAX_PAGE, DRIFT_ENABLED, COHORT_ENABLED
+)
 
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Schema changes run as a deploy step (`alembic upgrade head`), not on worker import.
+# Heavy startup work (model, registry) happens here, after the worker is importable;
+# under prefork.py the parent has done it already and the workers share the result.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global rate_limiter
+    if ml_service.sess is None:
+        await asyncio.to_thread(ml_service.load)
+    if DRIFT_ENABLED and ml_service.sess is not None and ml_service.drift_monitor is None:
+        try:
+            ml_service.drift_monitor = await asyncio.to_thread(DriftMonitor.for_model, ml_service)
+        except Exception as e:
+            print(f"Warning: Could not load drift reference data: {e}")
+    if DB_PARTITIONING:
+        created = await asyncio.to_thread(ensure_partitions, engine)
+        if created:
+            print(f"Created partitions: {created}")
+    if not collar_registry.loaded:
+        await asyncio.to_thread(load_collar_registry)
+    if INTERVENTION_STATE_BACKEND == "redis":
+        intervention_engine.store = RedisStateStore(redis_client)
+    if COLLAR_COMMAND_BACKEND == "redis":
+        command_queue.store = RedisCommandStore(redis_client)
+        command_queue.redis = redis_client
+    if RATE_LIMIT_BACKEND == "redis":
+        rate_limiter = RedisRateLimiter(redis_client)
+    tasks = [
+        asyncio.create_task(process_real_time_data()),
+        asyncio.create_task(command_queue.run()),
+        asyncio.create_task(admission.run()),
+        asyncio.create_task(readiness.run()),
+        asyncio.create_task(run_change_log_pruning())
+    ]
+    if RETENTION_ENABLED:
+        tasks.append(asyncio.create_task(run_retention()))
+    if ml_service.drift_monitor is not None:
+        tasks.append(asyncio.create_task(ml_service.drift_monitor.run()))
+    if COHORT_ENABLED:
+        tasks.append(asyncio.create_task(cohort_analytics.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    export_service.shutdown()
+    photo_service.shutdown()
 
 app = FastAPI(
     title="IoT Dog Collar Monitoring System",
     description="Comprehensive monitoring system for Indian street dogs with ML-powered aggression prediction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -43,6 +117,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_pool(engine)
+instrument_pool(read_engine, "read")
+
+# Route template per endpoint, so latency labels don't include ids
+ROUTE_TEMPLATES = {}
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        endpoint = request.scope.get("endpoint")
+        if not ROUTE_TEMPLATES:
+            ROUTE_TEMPLATES.update({route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")})
+        REQUEST_LATENCY.labels(
+            request.method, ROUTE_TEMPLATES.get(endpoint, "unmatched"), str(status)
+        ).observe(time.perf_counter() - started)
+
 # Redis connection
 redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0)
 
@@ -55,32 +151,142 @@ security = HTTPBearer()
 # Services
 dog_service = DogService()
 collar_service = CollarService()
-sensor_service = SensorDataService()
+cold_archive = ColdArchive()
+sensor_service = SensorDataService(archive=cold_archive)
 intervention_service = InterventionService()
 auth_service = AuthService()
 ml_service = MLService()
 
+# Collar -> dog map and static dog features for the ingest path
+collar_registry = CollarRegistry()
+bulk_loader = BulkLoader(ml_service, collar_registry)
+export_service = ExportService()
+photo_service = PhotoService()
+
+# One open intervention per dog; the lifespan switches to shared Redis state if configured
+intervention_engine = InterventionEngine(MemoryStateStore())
+
+# Per-dog vitals baselines; raised alerts go out over the websocket, active ones feed the dashboard
+health_monitor = HealthMonitor()
+
+# Fan-out tasks in flight, referenced so they aren't garbage collected before they finish
+health_alert_tasks: Set[asyncio.Task] = set()
+
+async def broadcast_health_alerts(alerts: List[dict]):
+    for alert in alerts:
+        await manager.send_health_alert(alert["dog_id"], alert)
+
+def send_health_alerts(alerts: List[dict]):
+    """Broadcast alerts in the background, so ingest doesn't wait on a send per client."""
+    if not alerts:
+        return
+    task = asyncio.create_task(broadcast_health_alerts(alerts))
+    health_alert_tasks.add(task)
+    task.add_done_callback(health_alert_tasks.discard)
+
+# Per-collar token buckets and load shedding for ingest
+rate_limiter = MemoryRateLimiter()
+admission = AdmissionController()
+RATE_LIMIT_HEADERS = {"Retry-After": str(max(1, round(1 / COLLAR_RATE_PER_SECOND)))}
+
+async def admit_ingest():
+    if not admission.admit(HIGH, "ingest"):
+        raise HTTPException(status_code=503, detail="Server overloaded, retry later", headers={"Retry-After": "1"})
+    with admission.track():
+        yield
+
+async def admit_analytics():
+    if not admission.admit(LOW, "analytics"):
+        raise HTTPException(status_code=503, detail="Analytics paused while ingest is under load", headers={"Retry-After": "5"})
+
+# Columnar snapshot of recent readings for cohort queries, refreshed by a lifespan task
+cohort_analytics = CohortAnalytics()
+
+# Dependency probes for /ready, refreshed by a lifespan task
+readiness = Readiness(engine, redis_client, ml_service, admission, read_engine=read_engine)
+
+# Commands for opened interventions, fetched by collars (long-poll or websocket)
+command_queue = CommandQueue()
+
+async def dispatch_opened(result: dict):
+    for row in result["opened"]:
+        await command_queue.push(row["collar_id"], command_for(row))
+        escalated = result["action"][result["intervention_id"] == row["id"]][0] == "escalated"
+        await manager.send_intervention_alert(row["dog_id"], opened_alert(row, escalated))
+
 @app.get("/")
 async def root():
     return {"message": "IoT Dog Collar Monitoring System API", "version": "1.0.0"}
 
+# Liveness: no I/O, so it only fails if the event loop is stuck
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+
+# Readiness: the last background probe results, never a probe per request
+@app.get("/ready")
+async def ready(response: Response):
+    report = readiness.report()
+    if report["status"] != "ready":
+        response.status_code = 503
+    return report
+
+# Model input and prediction drift against the training data, as of the last scheduled check
+@app.get("/model/drift")
+async def model_drift():
+    if ml_service.drift_monitor is None:
+        raise HTTPException(status_code=503, detail="Drift monitor is not running")
+    return ml_service.drift_monitor.report()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Authentication dependencies; verified claims are cached until the token expires
+async def get_current_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    try:
+        return auth_service.verify_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+async def require_admin(claims: dict = Depends(get_current_claims)) -> dict:
+    if not claims.get("admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return claims
+
 # Authentication endpoints
 @app.post("/auth/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    return await auth_service.create_user(db, user_data)
+    try:
+        return await auth_service.create_user(db, user_data)
+    except AuthBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 @app.post("/auth/login", response_model=Token)
 async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    return await auth_service.authenticate_user(db, login_data)
+    try:
+        return await auth_service.authenticate_user(db, login_data)
+    except AuthBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
 
 # Dog management endpoints
 @app.post("/dogs", response_model=DogResponse)
 async def create_dog(dog_data: DogCreate, db: Session = Depends(get_db)):
-    return await dog_service.create_dog(db, dog_data)
+    dog = await dog_service.create_dog(db, dog_data)
+    collar_registry.put_dog(dog)
+    return dog
 
-@app.get("/dogs", response_model=List[DogResponse])
-async def get_dogs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return await dog_service.get_dogs(db, skip=skip, limit=limit)
+@app.get("/dogs", response_model=None, responses=list_responses(DogResponse))
+async def get_dogs(
+    skip: int = 0,
+    limit: int = 100,
+    layout: ResponseLayout = ResponseLayout.OBJECTS,
+    db: Session = Depends(get_db)
+):
+    return rows_response(await dog_service.get_dogs(db, skip=skip, limit=limit), layout.value)
 
 @app.get("/dogs/{dog_id}", response_model=DogResponse)
 async def get_dog(dog_id: str, db: Session = Depends(get_db)):
@@ -91,21 +297,59 @@ async def get_dog(dog_id: str, db: Session = Depends(get_db)):
 
 @app.put("/dogs/{dog_id}", response_model=DogResponse)
 async def update_dog(dog_id: str, dog_data: DogCreate, db: Session = Depends(get_db)):
-    return await dog_service.update_dog(db, dog_id, dog_data)
+    dog = await dog_service.update_dog(db, dog_id, dog_data)
+    collar_registry.put_dog(dog)
+    return dog
+
+@app.post("/dogs/{dog_id}/photo")
+async def upload_dog_photo(dog_id: str, photo: UploadFile = File(...), db: Session = Depends(get_db)):
+    dog = db.get(Dog, dog_id)
+    if dog is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    try:
+        photo_url = await photo_service.store(photo.file)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        await photo.close()
+    dog.photo_url = photo_url
+    db.commit()
+    return {"photo_url": photo_url, "thumbnail_url": variant_url(photo_url, "thumb")}
+
+@app.get("/photos/{name}")
+async def get_photo(name: str, request: Request):
+    path = photo_service.path_for(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    # Variants are content-addressed, so the name is a strong validator
+    etag = f'"{os.path.splitext(name)[0]}"'
+    headers = {"Cache-Control": PHOTO_CACHE_CONTROL, "ETag": etag}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/webp", headers=headers)
 
 @app.delete("/dogs/{dog_id}")
 async def delete_dog(dog_id: str, db: Session = Depends(get_db)):
     await dog_service.delete_dog(db, dog_id)
+    collar_registry.drop_dog(dog_id)
     return {"message": "Dog deleted successfully"}
 
 # Collar management endpoints
 @app.post("/collars", response_model=CollarResponse)
 async def create_collar(collar_data: CollarCreate, db: Session = Depends(get_db)):
-    return await collar_service.create_collar(db, collar_data)
+    collar = await collar_service.create_collar(db, collar_data)
+    collar_registry.put_collar(collar)
+    return collar
 
-@app.get("/collars", response_model=List[CollarResponse])
-async def get_collars(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return await collar_service.get_collars(db, skip=skip, limit=limit)
+@app.get("/collars", response_model=None, responses=list_responses(CollarResponse))
+async def get_collars(
+    skip: int = 0,
+    limit: int = 100,
+    layout: ResponseLayout = ResponseLayout.OBJECTS,
+    db: Session = Depends(get_db)
+):
+    return rows_response(await collar_service.get_collars(db, skip=skip, limit=limit), layout.value)
 
 @app.get("/collars/{collar_id}", response_model=CollarResponse)
 async def get_collar(collar_id: str, db: Session = Depends(get_db)):
@@ -114,52 +358,195 @@ async def get_collar(collar_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Collar not found")
     return collar
 
+def check_collar(collar_id: str):
+    # Own short-lived session, so long-polls don't hold a pooled connection while waiting
+    db = SessionLocal()
+    try:
+        collar_registry.resolve(db, collar_id)
+    finally:
+        db.close()
+
+@app.get("/collars/{collar_id}/commands", response_model=List[CollarCommand])
+async def get_collar_commands(collar_id: str, wait: float = 0):
+    """Commands for the collar; with wait > 0, long-polls up to that many seconds for one."""
+    try:
+        check_collar(collar_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return await command_queue.fetch(collar_id, wait=wait)
+
+@app.post("/collars/{collar_id}/commands/ack")
+async def ack_collar_commands(collar_id: str, batch: CollarCommandAckBatch):
+    accepted = await command_queue.ack(collar_id, [ack.dict() for ack in batch.acks])
+    return {"accepted": accepted}
+
 # Sensor data endpoints
-@app.post("/sensor-data", response_model=SensorDataResponse)
+@app.post("/sensor-data", response_model=SensorDataResponse, dependencies=[Depends(admit_ingest)])
 async def create_sensor_data(sensor_data: SensorDataCreate, db: Session = Depends(get_db)):
-    # Get ML prediction
-    prediction = await ml_service.predict_aggression(sensor_data)
+    if not (await rate_limiter.allow_many([sensor_data.collar_id]))[0]:
+        raise HTTPException(status_code=429, detail="Collar rate limit exceeded", headers=RATE_LIMIT_HEADERS)
+    
+    # Check the collar belongs to the dog and pick up the dog's static features
+    try:
+        with stage_timer("single", "validation"):
+            dog_profile = collar_registry.validate_reading(db, sensor_data)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    # Get ML prediction (feature engineering and inference are timed inside)
+    prediction = await ml_service.predict_aggression(sensor_data, dog_profile)
     
     # Create sensor data record
-    sensor_record = await sensor_service.create_sensor_data(db, sensor_data)
+    with stage_timer("single", "db_insert"):
+        sensor_record = await sensor_service.create_sensor_data(db, sensor_data, prediction)
     
-    # Create intervention if needed
+    # Open, extend or escalate the dog's intervention if needed
     if prediction["intervention"] != "LOW":
-        intervention_data = {
-            "dog_id": sensor_data.dog_id,
-            "collar_id": sensor_data.collar_id,
-            "intervention_type": prediction["intervention"],
-            "ultrasonic_frequency": prediction["ultrasonic_frequency"],
-            "duration_seconds": prediction["duration_seconds"],
-            "aggression_level": prediction["aggression_level"],
-            "confidence": prediction["probability"]
-        }
-        await intervention_service.create_intervention(db, intervention_data)
-    
-    # Store in Redis for real-time updates
-    await redis_client.setex(
-        f"dog:{sensor_data.dog_id}:latest",
-        300,  # 5 minutes TTL
-        json.dumps({
-            **sensor_data.dict(),
-            **prediction,
-            "timestamp": datetime.utcnow().isoformat()
+        with stage_timer("single", "intervention_insert"):
+            result = await intervention_engine.process(db, {
+                "dog_id": [sensor_data.dog_id],
+                "collar_id": [sensor_data.collar_id],
+                "intervention_type": [prediction["intervention"]],
+                "ultrasonic_frequency": [prediction["ultrasonic_frequency"]],
+                "duration_seconds": [prediction["duration_seconds"]],
+                "aggression_level": [AggressionLevel(prediction["aggression_level"]).name],
+                "confidence": [prediction["probability"]]
+            })
+        await dispatch_opened(result)
+    
+    with stage_timer("single", "health_check"):
+        health_alerts = health_monitor.observe([sensor_data.dog_id], {
+            name: np.array([getattr(sensor_data, name)], dtype=np.float64) for name in HEALTH_READING_FIELDS
         })
-    )
+    send_health_alerts(health_alerts)
+    
+    # Store in Redis for real-time updates, unless shedding low-priority work
+    if admission.admit(LOW, "latest_cache"):
+        with stage_timer("single", "redis_write"):
+            await redis_client.setex(
+                f"dog:{sensor_data.dog_id}:latest",
+                300,  # 5 minutes TTL
+                json.dumps({
+                    **sensor_data.dict(),
+                    **prediction,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+            )
     
-    return SensorDataResponse(**sensor_record.dict(), **prediction)
+    return SensorDataResponse.from_orm(sensor_record)
 
-@app.get("/sensor-data/{dog_id}", response_model=List[SensorDataResponse])
+@app.post("/sensor-data/batch", dependencies=[Depends(admit_ingest)])
+async def create_sensor_data_batch(request: Request, db: Session = Depends(get_db)):
+    """Ingest a binary batch of readings (see wire_format.py) without per-reading pydantic models."""
+    body = await request.body()
+    with stage_timer("batch", "validation"):
+        try:
+            records = decode_batch(body, max_records=WIRE_MAX_BATCH)
+        except WireFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # One token per collar in the batch, however many readings it carries
+        collar_keys, inverse = np.unique(records["collar_id"], return_inverse=True)
+        admitted = (await rate_limiter.allow_many([
+            str(uuid.UUID(bytes=raw.ljust(16, b"\0"))) for raw in collar_keys
+        ]))[inverse]
+        if len(records) and not admitted.any():
+            raise HTTPException(status_code=429, detail="Collar rate limit exceeded", headers=RATE_LIMIT_HEADERS)
+        
+        resolved = collar_registry.resolve_batch(db, records["collar_id"])
+        columns = to_columns(records)
+        
+        # Rate-limited and unknown collars and out-of-range vitals are dropped
+        valid = admitted & resolved["known"] & vitals_in_range(columns)
+        index = np.flatnonzero(valid)
+        records = records[index]
+        columns = {name: values[index] for name, values in columns.items()}
+        resolved = {name: values[index] for name, values in resolved.items()}
+    
+    prediction = ml_service.predict_batch({
+        **columns,
+        "age_years": resolved["age_years"],
+        "sex": resolved["sex"],
+        "sterilization_status": resolved["sterilization_status"]
+    })
+    
+    now = datetime.utcnow()
+    recorded_at = records["recorded_at"].astype(np.int64).astype("datetime64[s]").astype(object)
+    recorded_at[records["recorded_at"] == 0] = now
+    
+    row_columns = sensor_data_columns(
+        columns, resolved["dog_id"], resolved["collar_id"], prediction, recorded_at, now
+    )
+    with stage_timer("batch", "db_insert"):
+        await sensor_service.create_sensor_data_batch(db, row_columns)
+    
+    triggered = np.flatnonzero(row_columns["intervention_required"])
+    with stage_timer("batch", "intervention_insert"):
+        result = await intervention_engine.process(db, {
+            "dog_id": resolved["dog_id"][triggered],
+            "collar_id": resolved["collar_id"][triggered],
+            "intervention_type": prediction["intervention"][triggered],
+            "ultrasonic_frequency": prediction["ultrasonic_frequency"][triggered],
+            "duration_seconds": prediction["duration_seconds"][triggered],
+            "aggression_level": row_columns["aggression_level"][triggered],
+            "confidence": prediction["probability"][triggered]
+        })
+    await dispatch_opened(result)
+    
+    with stage_timer("batch", "health_check"):
+        health_alerts = health_monitor.observe(resolved["dog_id"], columns)
+    send_health_alerts(health_alerts)
+    
+    # Only each dog's newest reading in the batch goes to the real-time cache, unless shedding
+    if admission.admit(LOW, "latest_cache"):
+        dog_ids = resolved["dog_id"]
+        _, last_from_end = np.unique(dog_ids[::-1], return_index=True)
+        with stage_timer("batch", "redis_write"):
+            for i in len(dog_ids) - 1 - last_from_end:
+                await redis_client.setex(
+                    f"dog:{dog_ids[i]}:latest",
+                    300,  # 5 minutes TTL
+                    json.dumps({
+                        "dog_id": dog_ids[i],
+                        "collar_id": resolved["collar_id"][i],
+                        **{name: row_columns[name][i] for name in columns},
+                        "aggression_level": int(prediction["aggression_level"][i]),
+                        "probability": float(prediction["probability"][i]),
+                        "intervention": prediction["intervention"][i],
+                        "timestamp": recorded_at[i].isoformat()
+                    })
+                )
+    
+    return {
+        "accepted": len(index),
+        "rejected": len(valid) - len(index),
+        "rate_limited": int(len(admitted) - admitted.sum()),
+        "interventions": [
+            {
+                "index": int(index[i]),
+                "intervention": prediction["intervention"][i],
+                "ultrasonic_frequency": int(prediction["ultrasonic_frequency"][i]),
+                "duration_seconds": int(prediction["duration_seconds"][i]),
+                "action": result["action"][n],
+                "intervention_id": result["intervention_id"][n]
+            }
+            for n, i in enumerate(triggered)
+        ]
+    }
+
+@app.get("/sensor-data/{dog_id}", response_model=None, responses=list_responses(SensorDataResponse))
 async def get_sensor_data(
     dog_id: str, 
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    layout: ResponseLayout = ResponseLayout.OBJECTS,
+    db: Session = Depends(get_read_db)
 ):
-    return await sensor_service.get_sensor_data_by_dog(
+    rowset = await sensor_service.get_sensor_data_by_dog(
         db, dog_id, start_time, end_time, limit
     )
+    return rows_response(rowset, layout.value)
 
 @app.get("/sensor-data/latest/{dog_id}")
 async def get_latest_sensor_data(dog_id: str):
@@ -169,35 +556,65 @@ async def get_latest_sensor_data(dog_id: str):
     return json.loads(data)
 
 # Analytics endpoints
-@app.get("/analytics/aggression-trends/{dog_id}")
+@app.get("/analytics/aggression-trends/{dog_id}", dependencies=[Depends(admit_analytics)])
 async def get_aggression_trends(
     dog_id: str,
     days: int = 7,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     return await sensor_service.get_aggression_trends(db, dog_id, days)
 
-@app.get("/analytics/health-metrics/{dog_id}")
+@app.get("/analytics/health-metrics/{dog_id}", dependencies=[Depends(admit_analytics)])
 async def get_health_metrics(
     dog_id: str,
     days: int = 7,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     return await sensor_service.get_health_metrics(db, dog_id, days)
 
-@app.get("/analytics/dashboard")
-async def get_dashboard_data(db: Session = Depends(get_db)):
-    return await sensor_service.get_dashboard_analytics(db)
+@app.get("/analytics/dashboard", dependencies=[Depends(admit_analytics)])
+async def get_dashboard_data(db: Session = Depends(get_read_db)):
+    return await sensor_service.get_dashboard_analytics(db, health_monitor.active_alerts())
+
+# Risk by cohort over the in-memory snapshot, e.g. ?group_by=young_male_risk&where=time_of_day:NIGHT
+@app.get("/analytics/cohorts", dependencies=[Depends(admit_analytics)])
+async def get_cohort_analytics(group_by: Optional[str] = None, where: Optional[str] = None, hours: Optional[float] = None):
+    try:
+        dimensions, filters = parse_group_by(group_by), parse_filters(where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cohort_analytics.snapshot is None:
+        raise HTTPException(status_code=503, detail="Cohort snapshot is still loading", headers={"Retry-After": "5"})
+    return await asyncio.to_thread(cohort_analytics.query, dimensions, filters, hours)
+
+# Delta sync: what changed since the client's cursor (see change_log.py)
+@app.get("/sync")
+async def sync(since: Optional[int] = None, limit: int = 500, db: Session = Depends(get_db)):
+    # Primary, not the read pool: a lagging replica would let the cursor skip changes
+    changes = changes_since(db, since, max(1, min(limit, SYNC_MAX_PAGE)))
+    ids = changes.pop("ids")
+    dog_ids, collar_ids, intervention_ids = ids.get("dog", []), ids.get("collar", []), ids.get("intervention", [])
+    return json_response({
+        **changes,
+        "dogs": objects(await dog_service.get_dogs(db, limit=len(dog_ids), ids=dog_ids)) if dog_ids else [],
+        "collars": objects(await collar_service.get_collars(db, limit=len(collar_ids), ids=collar_ids)) if collar_ids else [],
+        "interventions": objects(await intervention_service.get_interventions(
+            db, limit=len(intervention_ids), ids=intervention_ids
+        )) if intervention_ids else []
+    })
 
 # Intervention endpoints
-@app.get("/interventions", response_model=List[InterventionResponse])
+@app.get("/interventions", response_model=None, responses=list_responses(InterventionResponse))
 async def get_interventions(
     dog_id: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    start_time: Optional[datetime] = None,
+    layout: ResponseLayout = ResponseLayout.OBJECTS,
     db: Session = Depends(get_db)
 ):
-    return await intervention_service.get_interventions(db, dog_id, skip, limit)
+    rowset = await intervention_service.get_interventions(db, dog_id, skip, limit, start_time=start_time)
+    return rows_response(rowset, layout.value)
 
 @app.post("/interventions/{intervention_id}/acknowledge")
 async def acknowledge_intervention(
@@ -206,24 +623,177 @@ async def acknowledge_intervention(
 ):
     return await intervention_service.acknowledge_intervention(db, intervention_id)
 
+# Bulk import endpoints
+@app.post("/admin/bulk-loads", response_model=BulkLoadJobResponse, status_code=202)
+async def start_bulk_load(
+    load_request: BulkLoadRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    claims: dict = Depends(require_admin)
+):
+    # Only files already placed under BULK_LOAD_DIR can be imported
+    root = os.path.realpath(BULK_LOAD_DIR)
+    path = os.path.realpath(os.path.join(root, load_request.path))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Import file not found")
+    
+    job_id = load_request.job_id or job_id_for(path)
+    if job_id in bulk_loader.active:
+        raise HTTPException(status_code=409, detail="Bulk load already running")
+    
+    background_tasks.add_task(
+        run_bulk_load, path, job_id,
+        load_request.dog_id, load_request.collar_id,
+        load_request.start_time, load_request.interval_seconds, load_request.from_scratch
+    )
+    job = db.get(BulkLoadJob, job_id)
+    if job is None or load_request.from_scratch:
+        return BulkLoadJobResponse(id=job_id, source=path, status="running", rows_read=0, rows_loaded=0, rows_rejected=0)
+    return BulkLoadJobResponse.from_orm(job)
+
+@app.get("/admin/bulk-loads/{job_id}", response_model=BulkLoadJobResponse)
+async def get_bulk_load(job_id: str, db: Session = Depends(get_db), claims: dict = Depends(require_admin)):
+    job = db.get(BulkLoadJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk load not found")
+    return BulkLoadJobResponse.from_orm(job)
+
+def run_bulk_load(*args):
+    # Sync so BackgroundTasks runs it in the threadpool; progress is in bulk_load_jobs
+    try:
+        bulk_loader.run(*args)
+    except Exception as e:
+        print(f"Error in bulk load: {e}")
+
+# Export endpoints: queue a report (or return the cached one), poll it, download it
+def export_job_response(job: ExportJob, response: Optional[Response] = None) -> ExportJobResponse:
+    result = ExportJobResponse.from_orm(job)
+    if job.status == "completed":
+        result.download_url = f"/export/jobs/{job.id}/download"
+    elif response is not None:
+        response.status_code = 202
+    return result
+
+@app.get("/export/dog-data/{dog_id}", response_model=ExportJobResponse)
+async def export_dog_data(
+    dog_id: str,
+    response: Response,
+    format: ExportFormat = ExportFormat.CSV,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    if db.get(Dog, dog_id) is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    try:
+        job = export_service.request(db, "dog-data", format.value, dog_id, start_time, end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return export_job_response(job, response)
+
+@app.get("/export/interventions", response_model=ExportJobResponse)
+async def export_interventions(
+    response: Response,
+    format: ExportFormat = ExportFormat.CSV,
+    dog_id: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    try:
+        job = export_service.request(db, "interventions", format.value, dog_id, start_time, end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return export_job_response(job, response)
+
+@app.get("/export/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(job_id: str, response: Response, db: Session = Depends(get_db)):
+    job = db.get(ExportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return export_job_response(job, response)
+
+@app.get("/export/jobs/{job_id}/download")
+async def download_export(job_id: str, db: Session = Depends(get_db)):
+    job = db.get(ExportJob, job_id)
+    if job is None or job.status != "completed" or not job.path or not os.path.exists(job.path):
+        raise HTTPException(status_code=404, detail="Export not ready")
+    name = f"{job.kind}-{job.dog_id + '-' if job.dog_id else ''}{job.start_time:%Y%m%d}-{job.end_time:%Y%m%d}.{job.format}"
+    return FileResponse(job.path, media_type=EXPORT_MEDIA_TYPES[job.format], filename=name)
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await manager.connect(websocket, client_id)
     try:
-        while True:
-            # Keep connection alive and send periodic updates
-            await asyncio.sleep(1)
-            # Send any pending updates
-            await manager.send_personal_message("ping", websocket)
+        # Until the client reconnects on another socket
+        while manager.is_current(client_id, websocket):
+            try:
+                # Client messages are ignored; receiving is how a close is noticed
+                message = await asyncio.wait_for(websocket.receive(), timeout=1)
+            except asyncio.TimeoutError:
+                # Keep connection alive, unless a reconnect has closed this socket meanwhile
+                if manager.is_current(client_id, websocket):
+                    await manager.send_personal_message("ping", websocket)
+                continue
+            if message["type"] == "websocket.disconnect":
+                break
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
+    except Exception as e:
+        print(f"WebSocket {client_id} closed: {e}")
+    finally:
+        manager.disconnect(client_id, websocket)
+
+@app.websocket("/ws/collars/{collar_id}")
+async def collar_websocket(websocket: WebSocket, collar_id: str):
+    """Pushes {"type": "commands"} messages; the collar sends {"type": "ack", "acks": [...]}."""
+    try:
+        check_collar(collar_id)
+    except ValueError:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    
+    async def send_commands():
+        while True:
+            commands = await command_queue.fetch(collar_id, wait=COLLAR_POLL_TIMEOUT_SECONDS)
+            if commands:
+                await websocket.send_json({"type": "commands", "commands": commands})
+    
+    async def receive_acks():
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") != "ack":
+                continue
+            try:
+                batch = CollarCommandAckBatch(acks=message.get("acks", []))
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            await command_queue.ack(collar_id, [ack.dict() for ack in batch.acks])
+    
+    tasks = [asyncio.create_task(send_commands()), asyncio.create_task(receive_acks())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def load_collar_registry():
+    db = SessionLocal()
+    try:
+        collar_registry.load(db)
+    except Exception as e:
+        print(f"Warning: Could not load collar registry: {e}")
+    finally:
+        db.close()
 
 # Background task for real-time data processing
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(process_real_time_data())
-
 async def process_real_time_data():
     while True:
         try:
@@ -235,6 +805,39 @@ async def process_real_time_data():
             print(f"Error in real-time processing: {e}")
             await asyncio.sleep(5)
 
+def prune_change_log_once() -> int:
+    db = SessionLocal()
+    try:
+        return prune_change_log(db)
+    finally:
+        db.close()
+
+async def run_change_log_pruning():
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            deleted = await asyncio.to_thread(prune_change_log_once)
+            if deleted:
+                print(f"Pruned {deleted} change log entries")
+        except Exception as e:
+            print(f"Error pruning change log: {e}")
+
+def run_retention_once() -> dict:
+    db = SessionLocal()
+    try:
+        return RetentionService(cold_archive).run(db)
+    finally:
+        db.close()
+
+async def run_retention():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_MINUTES * 60)
+        try:
+            stats = await asyncio.to_thread(run_retention_once)
+            print(f"Retention run: {stats}")
+        except Exception as e:
+            print(f"Error in retention run: {e}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,196 @@
+"""Prometheus metrics for the API, the ingest hot path and the model.
+
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so /metrics
+aggregates all of them.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+
+# Sub-millisecond stages matter on the ingest path, so the buckets start low
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=FAST_BUCKETS
+)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "sensor_ingest_stage_seconds",
+    "Time spent in each stage of sensor data ingest",
+    ["path", "stage"],
+    buckets=FAST_BUCKETS
+)
+
+MODEL_BATCH_SIZE = Histogram(
+    "model_batch_size",
+    "Rows per ONNX inference call",
+    ["model"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+)
+
+MODEL_INFERENCES = Counter(
+    "model_inferences_total",
+    "Inference calls per model",
+    ["model", "path"]
+)
+
+MODEL_ROWS_SCORED = Counter(
+    "model_rows_scored_total",
+    "Rows scored per model",
+    ["model", "path"]
+)
+
+MODEL_ERRORS = Counter(
+    "model_inference_errors_total",
+    "Failed inference calls per model",
+    ["model"]
+)
+
+MODEL_FEATURE_PSI = Gauge(
+    "model_feature_psi",
+    "Population stability index of each model input against the training data, at the last drift check",
+    ["model", "feature"],
+    multiprocess_mode="livemax"
+)
+
+MODEL_FEATURE_KS = Gauge(
+    "model_feature_ks",
+    "Kolmogorov-Smirnov distance (over the drift bins) of each model input against the training data",
+    ["model", "feature"],
+    multiprocess_mode="livemax"
+)
+
+MODEL_PREDICTION_PSI = Gauge(
+    "model_prediction_psi",
+    "Population stability index of predicted classes against the training labels",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+
+MODEL_DRIFT_SAMPLES = Gauge(
+    "model_drift_samples",
+    "Decayed number of scored rows behind the last drift check",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+
+HEALTH_ALERTS_RAISED = Counter(
+    "health_alerts_total",
+    "Health alerts raised by the streaming detector",
+    ["signal", "severity"]
+)
+
+COLLAR_COMMANDS = Counter(
+    "collar_commands_total",
+    "Collar downlink commands by event (queued, delivered, acked, expired)",
+    ["event"]
+)
+
+COLLAR_RATE_LIMITED = Counter(
+    "collar_rate_limited_total",
+    "Collar ingest requests rejected by the per-collar token bucket"
+)
+
+ADMISSION_SHED_LEVEL = Gauge(
+    "admission_shed_level",
+    "Load shedding level (0 = normal, 1 = shedding low-priority work, 2 = also rejecting ingest)",
+    multiprocess_mode="livemax"
+)
+
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Work skipped or rejected by admission control",
+    ["work"]
+)
+
+EVENT_LOOP_LAG_SECONDS = Gauge(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a short timer, sampled every 100 ms",
+    multiprocess_mode="livemax"
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of the SQLAlchemy pool, including any wait",
+    ["pool"],
+    buckets=FAST_BUCKETS
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of each pool",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT with the pool exhausted",
+    ["pool"]
+)
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Open dashboard websocket connections",
+    multiprocess_mode="livesum"
+)
+
+WEBSOCKET_SEND_QUEUE = Gauge(
+    "websocket_send_queue_depth",
+    "Websocket messages waiting to be written",
+    multiprocess_mode="livesum"
+)
+
+
+@contextmanager
+def stage_timer(path: str, stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        INGEST_STAGE_SECONDS.labels(path, stage).observe(time.perf_counter() - started)
+
+
+def instrument_pool(engine, name: str = "primary"):
+    """Observe pool checkouts: time taken (waiting for a free connection or opening one), timeouts, connections in use.
+
+    engine.dispose() (prefork.py) swaps in a new pool, so the timing wraps the
+    engine's raw_connection(), which every Connection checks out through, and
+    the counts use pool events, which the new pool inherits.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+    raw_connection = engine.raw_connection
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(name).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+    engine.raw_connection = timed_raw_connection
+    event.listen(engine.pool, "checkout", lambda *args: checked_out.inc())
+    event.listen(engine.pool, "checkin", lambda *args: checked_out.dec())
+
+
+def render_metrics():
+    """Return (body, content type) for the /metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,35 @@
+"""Initial schema
+
+Creates every table that main.py used to create at import time, with
+sensor_data and interventions range-partitioned when DB_PARTITIONING is set.
+Existing tables are skipped, so databases created the old way upgrade cleanly.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from config import DB_PARTITIONING
+from database import Base
+from partitions import create_partitioned_tables
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if DB_PARTITIONING:
+        create_partitioned_tables(bind)
+    Base.metadata.create_all(bind=bind)
+
+
+def downgrade() -> None:
+    Base.metadata.drop_all(bind=op.get_bind())
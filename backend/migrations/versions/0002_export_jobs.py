@@ -0,0 +1,26 @@
+"""Export jobs
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from models import ExportJob
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    ExportJob.__table__.create(bind=op.get_bind(), checkfirst=True)
+
+
+def downgrade() -> None:
+    ExportJob.__table__.drop(bind=op.get_bind(), checkfirst=True)
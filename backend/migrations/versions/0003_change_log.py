@@ -0,0 +1,26 @@
+"""Change log for delta sync
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from models import ChangeLog
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    ChangeLog.__table__.create(bind=op.get_bind(), checkfirst=True)
+
+
+def downgrade() -> None:
+    ChangeLog.__table__.drop(bind=op.get_bind(), checkfirst=True)
@@ -0,0 +1,86 @@
+"""Model artifacts for MLService.
+
+The scaler ships as plain NumPy arrays (mean, scale, feature names, level
+labels) so workers load it without importing sklearn or unpickling. Convert
+a training-time meta pickle once with:
+
+    python model_store.py export-scaler [--meta ml/dog_aggression_model_meta.pkl]
+"""
+import argparse
+import os
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from config import ML_META_PATH as META_PATH, ML_SCALER_PATH as SCALER_PATH
+
+
+class ScalerArrays(NamedTuple):
+    mean: np.ndarray
+    scale: np.ndarray
+    feature_names: List[str]
+    aggression_levels: Dict[int, str]
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        # Same as StandardScaler.transform; scale_ already has zeros replaced by 1
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+
+def from_meta(meta: dict) -> ScalerArrays:
+    scaler = meta["scaler"]
+    n = len(meta["feature_names"])
+    return ScalerArrays(
+        mean=np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(n), dtype=np.float64),
+        scale=np.asarray(scaler.scale_ if scaler.with_std else np.ones(n), dtype=np.float64),
+        feature_names=list(meta["feature_names"]),
+        aggression_levels={int(code): str(name) for code, name in meta["aggression_levels"].items()}
+    )
+
+
+def save_scaler(arrays: ScalerArrays, path: str = SCALER_PATH):
+    codes = sorted(arrays.aggression_levels)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        mean=arrays.mean,
+        scale=arrays.scale,
+        feature_names=np.array(arrays.feature_names, dtype=str),
+        level_codes=np.array(codes, dtype=np.int64),
+        level_names=np.array([arrays.aggression_levels[code] for code in codes], dtype=str)
+    )
+    os.replace(tmp_path, path)
+
+
+def load_scaler(path: str = SCALER_PATH, meta_path: str = META_PATH) -> ScalerArrays:
+    if not os.path.exists(path) and os.path.exists(meta_path):
+        # Older deployments only have the pickle; this pulls in joblib and sklearn
+        import joblib
+        print(f"Warning: {path} not found, loading {meta_path}; run `python model_store.py export-scaler`")
+        return from_meta(joblib.load(meta_path))
+
+    with np.load(path, allow_pickle=False) as data:
+        return ScalerArrays(
+            mean=data["mean"],
+            scale=data["scale"],
+            feature_names=[str(name) for name in data["feature_names"]],
+            aggression_levels=dict(zip(data["level_codes"].tolist(), data["level_names"].tolist()))
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage model artifacts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export-scaler", help="convert the pickled scaler to NumPy arrays")
+    export_parser.add_argument("--meta", default=META_PATH)
+    export_parser.add_argument("--output", default=SCALER_PATH)
+    args = parser.parse_args()
+
+    import joblib
+
+    arrays = from_meta(joblib.load(args.meta))
+    save_scaler(arrays, args.output)
+    print(f"Wrote {args.output} ({len(arrays.feature_names)} features)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Text, ForeignKey, Enum
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, Boolean, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
 
-Base = declarative_base()
+from database import Base
 
 class AggressionLevel(enum.Enum):
     CALM = 0
@@ -125,6 +124,9 @@ class Collar(Base):
 
 class SensorData(Base):
     __tablename__ = "sensor_data"
+    __table_args__ = (
+        Index("ix_sensor_data_dog_recorded_at", "dog_id", "recorded_at"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     dog_id = Column(String, ForeignKey("dogs.id"), nullable=False)
@@ -165,8 +167,33 @@ class SensorData(Base):
     dog = relationship("Dog", back_populates="sensor_data")
     collar = relationship("Collar", back_populates="sensor_data")
 
+class SensorDataMinute(Base):
+    """Per-minute rollup of archived sensor_data, one row per dog, minute and aggression level."""
+    __tablename__ = "sensor_data_minute"
+
+    dog_id = Column(String, ForeignKey("dogs.id"), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    aggression_level = Column(Enum(AggressionLevel), primary_key=True)
+
+    # Sums and counts rather than averages so buckets can be merged
+    reading_count = Column(Integer, nullable=False)
+    intervention_count = Column(Integer, nullable=False, default=0)
+    sum_heart_rate = Column(Float, nullable=False)
+    min_heart_rate = Column(Float)
+    max_heart_rate = Column(Float)
+    sum_temperature = Column(Float, nullable=False)
+    max_temperature = Column(Float)
+    sum_hrv = Column(Float)
+    hrv_count = Column(Integer, default=0)
+    sum_stress = Column(Float)
+    stress_count = Column(Integer, default=0)
+    sum_probability = Column(Float)
+
 class Intervention(Base):
     __tablename__ = "interventions"
+    __table_args__ = (
+        Index("ix_interventions_dog_triggered_at", "dog_id", "triggered_at"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     dog_id = Column(String, ForeignKey("dogs.id"), nullable=False)
@@ -195,3 +222,46 @@ class Intervention(Base):
     # Relationships
     dog = relationship("Dog", back_populates="interventions")
     collar = relationship("Collar", back_populates="interventions")
+
+class BulkLoadJob(Base):
+    """Progress of a bulk telemetry import, committed in the same transaction as each chunk."""
+    __tablename__ = "bulk_load_jobs"
+
+    id = Column(String, primary_key=True)
+    source = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="running")  # running, completed, failed
+    rows_read = Column(Integer, nullable=False, default=0)  # source rows consumed; the restart offset
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    rows_rejected = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+class ExportJob(Base):
+    """A report export; the id is derived from (kind, dog, range, format), so repeats reuse the file."""
+    __tablename__ = "export_jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)  # dog-data, interventions
+    dog_id = Column(String)
+    format = Column(String, nullable=False)  # csv, pdf, xlsx
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed
+    rows = Column(Integer, nullable=False, default=0)
+    path = Column(String)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+class ChangeLog(Base):
+    """One row per change to a dog, collar or intervention; seq is the /sync cursor (see change_log.py)."""
+    __tablename__ = "change_log"
+
+    # BIGINT on PostgreSQL; SQLite only autoincrements INTEGER primary keys
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)  # dog, collar, intervention
+    entity_id = Column(String, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # naive UTC, set by the writer
@@ -0,0 +1,208 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, Union
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from config import DB_PARTITIONING, DB_PARTITIONS_AHEAD
+from models import Base
+
+# Range-partitioned tables and their partition key
+PARTITIONED_TABLES = {
+    "sensor_data": "recorded_at",
+    "interventions": "triggered_at",
+}
+
+GRANULARITIES = ("daily", "monthly")
+
+
+def is_postgres(bind: Union[Engine, Connection]) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def partition_bounds(granularity: str, when: datetime) -> Tuple[datetime, datetime, str]:
+    """Return (start, end, suffix) of the partition holding `when`."""
+    if granularity == "daily":
+        start = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start, start + timedelta(days=1), f"{start:%Y%m%d}"
+    start = when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end, f"{start:%Y%m}"
+
+
+def _upper_bound(suffix: str) -> Optional[datetime]:
+    if len(suffix) == 8:
+        return datetime.strptime(suffix, "%Y%m%d") + timedelta(days=1)
+    if len(suffix) == 6:
+        return (datetime.strptime(suffix, "%Y%m") + timedelta(days=32)).replace(day=1)
+    return None
+
+
+def _is_partitioned(bind: Union[Engine, Connection], name: str) -> bool:
+    query = text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table t JOIN pg_class c ON c.oid = t.partrelid "
+        "WHERE c.relname = :name)"
+    )
+    if isinstance(bind, Connection):
+        return bind.execute(query, {"name": name}).scalar()
+    with bind.connect() as conn:
+        return conn.execute(query, {"name": name}).scalar()
+
+
+def create_partitioned_tables(bind: Union[Engine, Connection]):
+    """Create sensor_data and interventions as range-partitioned parents.
+
+    Must run before Base.metadata.create_all, which then skips them. The
+    partition key has to be part of the primary key, so the parents get
+    (id, <key>); the ORM keeps mapping `id` alone. Given a Connection (as in
+    an alembic migration) everything runs in its open transaction.
+
+    Tables that already exist are left as they are: an unpartitioned
+    sensor_data or interventions is never converted, and has to be migrated
+    by hand (create the partitioned table, copy the rows, swap the names).
+    """
+    if not is_postgres(bind):
+        return
+
+    existing = set(inspect(bind).get_table_names())
+    for name in PARTITIONED_TABLES:
+        if name in existing and not _is_partitioned(bind, name):
+            print(f"Warning: {name} already exists unpartitioned; it is not converted")
+    if all(name in existing for name in PARTITIONED_TABLES):
+        return
+
+    # Referenced tables first, since the copies below keep their foreign keys
+    Base.metadata.create_all(bind=bind, tables=[
+        table for table in Base.metadata.sorted_tables if table.name not in PARTITIONED_TABLES
+    ])
+
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+
+    for name, column in PARTITIONED_TABLES.items():
+        if name in existing:
+            continue
+        table = metadata.tables[name]
+        table.c[column].primary_key = True
+        table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c[column]))
+        table.dialect_kwargs["postgresql_partition_by"] = f"RANGE ({column})"
+        table.create(bind)
+
+        # Catches readings outside the pre-created ranges (e.g. bad collar clocks)
+        default = text(f"CREATE TABLE IF NOT EXISTS {name}_default PARTITION OF {name} DEFAULT")
+        if isinstance(bind, Connection):
+            bind.execute(default)
+        else:
+            with bind.begin() as conn:
+                conn.execute(default)
+        print(f"Created partitioned table {name} by RANGE ({column})")
+
+
+def _create_partition(conn: Connection, name: str, partition: str, lower: datetime, upper: datetime):
+    column = PARTITIONED_TABLES[name]
+    bounds = f"FROM ('{lower.isoformat()}+00') TO ('{upper.isoformat()}+00')"
+    default = f"{name}_default"
+    in_range = f"{column} >= '{lower.isoformat()}+00' AND {column} < '{upper.isoformat()}+00'"
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is not None
+    if not has_default or not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")).scalar():
+        conn.execute(text(f"CREATE TABLE {partition} PARTITION OF {name} FOR VALUES {bounds}"))
+        return
+
+    # Postgres refuses a new range while DEFAULT holds rows in it, so move them across first
+    conn.execute(text(f"ALTER TABLE {name} DETACH PARTITION {default}"))
+    conn.execute(text(f"CREATE TABLE {partition} PARTITION OF {name} FOR VALUES {bounds}"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+        f"INSERT INTO {partition} SELECT * FROM moved"
+    ))
+    conn.execute(text(f"ALTER TABLE {name} ATTACH PARTITION {default} DEFAULT"))
+    print(f"Moved rows for {partition} out of {default}")
+
+
+def ensure_partitions(
+    engine: Engine,
+    granularity: str = DB_PARTITIONING,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    ahead: int = DB_PARTITIONS_AHEAD
+) -> List[str]:
+    """Create any missing partitions covering [start, end], by default today plus `ahead` periods.
+
+    Each partition gets its own transaction, so one that fails (e.g. a row
+    racing into DEFAULT) is retried next time without undoing the others.
+    """
+    if not is_postgres(engine) or granularity not in GRANULARITIES:
+        return []
+
+    start = start or datetime.utcnow()
+    created = []
+    for name in PARTITIONED_TABLES:
+        current = start
+        periods = 0
+        while True:
+            lower, upper, suffix = partition_bounds(granularity, current)
+            if end is not None and lower > end:
+                break
+            if end is None and periods > ahead:
+                break
+            partition = f"{name}_p{suffix}"
+            try:
+                with engine.begin() as conn:
+                    exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": partition}).scalar()
+                    if exists is None:
+                        _create_partition(conn, name, partition, lower, upper)
+                        created.append(partition)
+            except Exception as e:
+                print(f"Error creating partition {partition}: {e}")
+            current = upper
+            periods += 1
+    return created
+
+
+def old_partitions(conn: Connection, parent: str, older_than: datetime) -> List[Tuple[str, datetime]]:
+    """(partition, upper bound) of the parent's range partitions entirely before `older_than`, oldest first."""
+    children = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent"
+    ), {"parent": parent}).scalars().all()
+    old = []
+    for child in children:
+        upper = _upper_bound(child.rsplit("_p", 1)[-1])
+        if upper is not None and upper <= older_than:
+            old.append((child, upper))
+    return sorted(old, key=lambda partition: partition[1])
+
+
+def drop_partition(conn: Connection, parent: str, child: str):
+    """Detach and drop a partition, in the caller's transaction (retention.py, once it is archived)."""
+    conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {child}"))
+    conn.execute(text(f"DROP TABLE {child}"))
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Maintain range partitions of sensor_data and interventions")
+    parser.add_argument("command", choices=["setup", "maintain"])
+    parser.add_argument("--granularity", choices=GRANULARITIES, default=DB_PARTITIONING or "daily")
+    parser.add_argument("--ahead", type=int, default=DB_PARTITIONS_AHEAD, help="future partitions to keep created")
+    args = parser.parse_args()
+
+    if not is_postgres(engine):
+        parser.error("partitioning needs PostgreSQL")
+
+    if args.command == "setup":
+        create_partitioned_tables(engine)
+        Base.metadata.create_all(bind=engine)
+
+    # Partitions past the retention window are archived and dropped by retention.py
+    created = ensure_partitions(engine, args.granularity, ahead=args.ahead)
+    print(f"Created partitions: {created or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
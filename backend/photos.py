@@ -0,0 +1,138 @@
+"""Dog photo uploads, stored content-addressed as WebP variants.
+
+An upload is copied to PHOTO_DIR in chunks while it is hashed, so a large
+original is never held in memory. Its SHA-256 names the variants
+({digest}-{variant}.webp, sized by PHOTO_VARIANTS); if they already exist
+the upload is a duplicate and nothing is decoded. Otherwise a process pool
+decodes the original and writes the variants, keeping image work off the
+API workers. Variant files never change, so they are served with a year's
+Cache-Control and their name as ETag, and Dog.photo_url points at the small
+"card" variant rather than the original.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from config import PHOTO_DIR, PHOTO_MAX_MB, PHOTO_MAX_PIXELS, PHOTO_VARIANTS, PHOTO_WEBP_QUALITY, PHOTO_WORKERS
+
+CHUNK_BYTES = 1024 * 1024
+URL_PREFIX = "/photos/"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+NAME_PATTERN = re.compile(r"^([0-9a-f]{64})-([a-z]+)\.webp$")
+
+
+def variant_name(digest: str, variant: str) -> str:
+    return f"{digest}-{variant}.webp"
+
+
+def variant_path(name: str, root: str = PHOTO_DIR) -> str:
+    return os.path.join(root, name[:2], name)
+
+
+def variant_url(photo_url: Optional[str], variant: str) -> Optional[str]:
+    """URL of another variant of an uploaded photo (None for photos stored elsewhere)."""
+    match = NAME_PATTERN.match(photo_url[len(URL_PREFIX):]) if photo_url and photo_url.startswith(URL_PREFIX) else None
+    if match is None or variant not in PHOTO_VARIANTS:
+        return None
+    return URL_PREFIX + variant_name(match.group(1), variant)
+
+
+def spool_upload(source: BinaryIO, root: str = PHOTO_DIR, max_mb: int = PHOTO_MAX_MB) -> Tuple[str, str]:
+    """Copy an upload to a temporary file under root, hashing it; returns (digest, path)."""
+    os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+    path = os.path.join(root, "tmp", uuid.uuid4().hex)
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_mb * 1024 * 1024:
+                    raise ValueError(f"Photo is larger than {max_mb} MB")
+                sha.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    if size == 0:
+        os.remove(path)
+        raise ValueError("Photo is empty")
+    return sha.hexdigest(), path
+
+
+def render_variants(source_path: str, digest: str, root: str = PHOTO_DIR) -> Dict[str, int]:
+    """Decode an original and write its WebP variants (process pool entry point); returns bytes per variant."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(source_path)
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Photo is not a supported image")
+    with image:
+        width, height = image.size
+        if width * height > PHOTO_MAX_PIXELS:
+            raise ValueError(f"Photo is larger than {PHOTO_MAX_PIXELS} pixels")
+        # JPEGs decode at a reduced scale when the largest variant allows it
+        largest = max(PHOTO_VARIANTS.values())
+        image.draft("RGB", (largest, largest))
+        try:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        except (OSError, SyntaxError) as e:
+            raise ValueError(f"Photo could not be decoded: {e}")
+
+    os.makedirs(os.path.join(root, digest[:2]), exist_ok=True)
+    written = {}
+    # Largest first, each resized from the previous one
+    for variant, size in sorted(PHOTO_VARIANTS.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        path = variant_path(variant_name(digest, variant), root)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        image.save(tmp_path, "WEBP", quality=PHOTO_WEBP_QUALITY, method=4)
+        os.replace(tmp_path, path)
+        written[variant] = os.path.getsize(path)
+    return written
+
+
+class PhotoService:
+    def __init__(self, workers: int = PHOTO_WORKERS, root: str = PHOTO_DIR):
+        self.workers = workers
+        self.root = root
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _stored(self, digest: str) -> bool:
+        return all(os.path.exists(variant_path(variant_name(digest, variant), self.root)) for variant in PHOTO_VARIANTS)
+
+    async def store(self, source: BinaryIO) -> str:
+        """Store an uploaded photo; returns its card variant URL. Raises ValueError for bad images."""
+        digest, tmp_path = await asyncio.to_thread(spool_upload, source, self.root)
+        try:
+            if not self._stored(digest):
+                if self._pool is None:
+                    # Spawned, not forked: the API process has threads and an event loop running
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                await asyncio.wrap_future(self._pool.submit(render_variants, tmp_path, digest, self.root))
+        finally:
+            os.remove(tmp_path)
+        return URL_PREFIX + variant_name(digest, "card")
+
+    def path_for(self, name: str) -> Optional[str]:
+        """File for a /photos/{name} request, or None if the name is not a stored variant."""
+        match = NAME_PATTERN.match(name)
+        if match is None or match.group(2) not in PHOTO_VARIANTS:
+            return None
+        path = variant_path(name, self.root)
+        return path if os.path.exists(path) else None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
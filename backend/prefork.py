@@ -0,0 +1,145 @@
+"""Pre-forking server: load read-only artifacts once, then fork workers that share them.
+
+    python prefork.py --workers 4 [--host 0.0.0.0] [--port 8000]
+
+`uvicorn --workers N` spawns fresh interpreters, so every worker imports
+the app and loads its own model and collar registry. Here the parent does
+that once: it imports main, loads the model into a single-threaded ONNX
+session (fork-safe), loads the collar registry into NumPy-backed tables and
+freezes the GC before forking. Workers then only write to their own request
+state, and the loaded pages stay shared copy-on-write. Dead workers are
+replaced; SIGTERM/SIGINT stop them all. Per-worker RSS and PSS (the
+worker's share of shared pages) are logged every --report-memory seconds.
+"""
+import argparse
+import gc
+import os
+import signal
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+
+def memory_mb(pid: int) -> Dict[str, Optional[float]]:
+    """RSS and PSS of a process in MB (Linux only; None elsewhere)."""
+    usage = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    usage["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("Pss:"):
+                    usage["pss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return usage
+
+
+def preload(intra_op_threads: int = 1):
+    """Import the app and load everything workers share; returns the ASGI app."""
+    import main
+    from database import SessionLocal, engine
+
+    main.ml_service.load(intra_op_threads=intra_op_threads)
+    db = SessionLocal()
+    try:
+        main.collar_registry.load(db)
+    finally:
+        db.close()
+    # Workers open their own connections
+    engine.dispose()
+    return main.app
+
+
+class Prefork:
+    def __init__(self, config: uvicorn.Config, workers: int, report_memory: float):
+        self.config = config
+        self.workers = workers
+        self.report_memory = report_memory
+        self.sock = None
+        self.children: Dict[int, int] = {}
+        self.should_exit = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return
+        # Worker: restore default signal handling; uvicorn installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        from database import engine
+        engine.dispose(close=False)
+        code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"Worker {index} crashed: {e}")
+            code = 1
+        os._exit(code)
+
+    def stop(self, signum, frame):
+        self.should_exit = True
+
+    def log_memory(self):
+        total = 0.0
+        for pid, index in sorted(self.children.items(), key=lambda item: item[1]):
+            usage = memory_mb(pid)
+            total += usage["pss_mb"] or 0.0
+            print(f"Worker {index} [{pid}]: RSS {usage['rss_mb']} MB, PSS {usage['pss_mb']} MB")
+        parent = memory_mb(os.getpid())
+        print(f"Parent [{os.getpid()}]: RSS {parent['rss_mb']} MB, PSS {parent['pss_mb']} MB; "
+              f"workers' PSS total {total:.1f} MB")
+
+    def run(self):
+        self.sock = self.config.bind_socket()
+        # Objects loaded so far are never collected, so GC passes don't touch (and copy) their pages
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        print(f"Started {self.workers} workers on {self.config.host}:{self.config.port} [parent {os.getpid()}]")
+
+        next_report = time.monotonic() + min(self.report_memory, 10) if self.report_memory else None
+        while not self.should_exit:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.children:
+                index = self.children.pop(pid)
+                print(f"Worker {index} [{pid}] exited with status {status}; restarting")
+                self.spawn(index)
+            if next_report and time.monotonic() >= next_report:
+                self.log_memory()
+                next_report = time.monotonic() + self.report_memory
+            time.sleep(0.2)
+
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in list(self.children):
+            os.waitpid(pid, 0)
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run API workers forked from one preloaded parent")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--report-memory", type=float, default=60.0,
+                        help="seconds between per-worker RSS/PSS log lines (0 = off)")
+    args = parser.parse_args()
+
+    app = preload()
+    config = uvicorn.Config(app, host=args.host, port=args.port, log_level=args.log_level)
+    Prefork(config, args.workers, args.report_memory).run()
+
+
+if __name__ == "__main__":
+    main()
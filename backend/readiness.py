@@ -0,0 +1,121 @@
+"""Readiness from cached dependency probes.
+
+Orchestrators poll /health and /ready often, so neither touches a
+dependency on request: /health only shows the event loop answers, and /ready
+returns the results of the last probe round. Readiness.run() probes every
+READY_PROBE_INTERVAL_SECONDS: a SELECT 1 through the primary and read
+connection pools (with pool occupancy), a Redis PING, whether the model is
+loaded, and event-loop lag as sampled by the admission controller. Each probe is bounded by
+READY_PROBE_TIMEOUT_SECONDS, and results older than three intervals count
+as failed, so a stuck probe loop shows up as not ready.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from config import READY_MAX_LOOP_LAG_MS, READY_PROBE_INTERVAL_SECONDS, READY_PROBE_TIMEOUT_SECONDS
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {}
+    # QueuePool reports occupancy; other pools (e.g. SQLite's) may not
+    for name in ("size", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            status[name] = method()
+    return status
+
+
+class Readiness:
+    def __init__(
+        self,
+        engine,
+        redis_client,
+        ml_service,
+        admission,
+        read_engine=None,
+        interval: float = READY_PROBE_INTERVAL_SECONDS,
+        timeout: float = READY_PROBE_TIMEOUT_SECONDS,
+        max_loop_lag_ms: float = READY_MAX_LOOP_LAG_MS
+    ):
+        self.engine = engine
+        self.read_engine = read_engine
+        self.redis = redis_client
+        self.ml_service = ml_service
+        self.admission = admission
+        self.interval = interval
+        self.timeout = timeout
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.checks: Dict[str, dict] = {}
+        self.checked_at: Optional[float] = None
+        # A DB probe stuck waiting on the pool keeps its thread; don't start another meanwhile
+        self._db_probes: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _select_one(engine):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def _timed(self, probe) -> dict:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(probe) if isinstance(probe, asyncio.Future) else probe, self.timeout)
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+        except asyncio.TimeoutError:
+            return {"ok": False, "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    async def probe_database(self, name: str, engine) -> dict:
+        probe = self._db_probes.get(name)
+        if probe is None or probe.done():
+            probe = self._db_probes[name] = asyncio.ensure_future(asyncio.to_thread(self._select_one, engine))
+        result = await self._timed(probe)
+        return {**result, "pool": pool_status(engine)}
+
+    async def probe_redis(self) -> dict:
+        return await self._timed(self.redis.ping())
+
+    def probe_model(self) -> dict:
+        loaded = self.ml_service.sess is not None
+        return {"ok": loaded} if loaded else {"ok": False, "error": "model not loaded"}
+
+    def probe_event_loop(self) -> dict:
+        lag_ms = round(self.admission.lag * 1000, 1)
+        return {"ok": lag_ms < self.max_loop_lag_ms, "lag_ms": lag_ms, "shed_level": self.admission.level}
+
+    async def refresh(self):
+        probes = {"database": self.probe_database("database", self.engine), "redis": self.probe_redis()}
+        if self.read_engine is not None:
+            probes["read_database"] = self.probe_database("read_database", self.read_engine)
+        results = await asyncio.gather(*probes.values())
+        self.checks = {
+            **dict(zip(probes, results)),
+            "model": self.probe_model(),
+            "event_loop": self.probe_event_loop()
+        }
+        self.checked_at = time.time()
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing readiness probes: {e}")
+            await asyncio.sleep(self.interval)
+
+    def report(self) -> dict:
+        """Last probe results; ready only if every check passed and they are recent."""
+        fresh = self.checked_at is not None and time.time() - self.checked_at <= 3 * self.interval
+        ready = fresh and all(check["ok"] for check in self.checks.values())
+        return {
+            "status": "ready" if ready else "not_ready",
+            "checked_at": (
+                datetime.fromtimestamp(self.checked_at, timezone.utc).isoformat() if self.checked_at else None
+            ),
+            "checks": self.checks
+        }
@@ -0,0 +1,433 @@
+import argparse
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import groupby
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from sqlalchemy import and_, func, delete, insert, text
+from sqlalchemy.orm import Session
+
+from config import RETENTION_RAW_DAYS, RETENTION_ARCHIVE_DIR, RETENTION_INTERVENTION_DAYS
+from models import SensorData, SensorDataMinute
+from partitions import drop_partition, is_postgres, old_partitions
+
+# pandas and pyarrow are imported where they are used, so the API doesn't load them at startup
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# Column layout of archived sensor_data partitions (pyarrow type aliases); enums are stored by name
+ARCHIVE_COLUMNS = (
+    ("id", "string"),
+    ("dog_id", "string"),
+    ("collar_id", "string"),
+    ("heart_rate_bpm", "float64"),
+    ("hrv_rmssd", "float64"),
+    ("body_temperature", "float64"),
+    ("stress_cortisol", "float64"),
+    ("body_posture", "string"),
+    ("tail_position", "string"),
+    ("ear_position", "string"),
+    ("vocalization_type", "string"),
+    ("time_of_day", "string"),
+    ("human_proximity_meters", "float64"),
+    ("other_dogs_nearby", "int32"),
+    ("aggression_level", "string"),
+    ("aggression_probability", "float64"),
+    ("intervention_required", "bool"),
+    ("gps_latitude", "float64"),
+    ("gps_longitude", "float64"),
+    ("gps_accuracy", "float64"),
+    ("recorded_at", "timestamp[us]"),
+    ("processed_at", "timestamp[us]"),
+)
+
+ENUM_COLUMNS = ("body_posture", "tail_position", "ear_position", "vocalization_type", "time_of_day", "aggression_level")
+TIMESTAMP_COLUMNS = ("recorded_at", "processed_at")
+
+# sqlite caps bound parameters per statement
+DELETE_CHUNK = 900
+
+
+@lru_cache(maxsize=None)
+def archive_schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in ARCHIVE_COLUMNS])
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # The archive stores naive UTC timestamps, like datetime.utcnow()
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _next_month(month_start: datetime) -> datetime:
+    return (month_start + timedelta(days=32)).replace(day=1)
+
+
+class ColdArchive:
+    """Compressed Parquet partitions of sensor_data on local disk.
+
+    Layout: <root>/dog_id=<dog>/month=<YYYY-MM>/part-<YYYYMMDD>-<hash>.parquet,
+    one part per archived dog-day. Reads prune by directory and file name
+    before memory-mapping only the columns asked for.
+    """
+
+    def __init__(self, root: str = RETENTION_ARCHIVE_DIR):
+        self.root = root
+
+    def _dog_dir(self, dog_id: str) -> str:
+        return os.path.join(self.root, f"dog_id={dog_id}")
+
+    def write_day(self, dog_id: str, day: datetime, table: "pa.Table") -> str:
+        import pyarrow.parquet as pq
+
+        month_dir = os.path.join(self._dog_dir(dog_id), f"month={day:%Y-%m}")
+        os.makedirs(month_dir, exist_ok=True)
+
+        # Named after the rows it holds, so re-archiving the same rows after a crash overwrites
+        digest = hashlib.sha1("".join(table.column("id").to_pylist()).encode()).hexdigest()[:12]
+        path = os.path.join(month_dir, f"part-{day:%Y%m%d}-{digest}.parquet")
+        tmp_path = path + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return path
+
+    def write_interventions(self, partition: str, table: "pa.Table") -> str:
+        """Archive a whole interventions partition; kept for reference, not read back by the API."""
+        import pyarrow.parquet as pq
+
+        interventions_dir = os.path.join(self.root, "interventions")
+        os.makedirs(interventions_dir, exist_ok=True)
+        path = os.path.join(interventions_dir, f"{partition}.parquet")
+        tmp_path = path + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return path
+
+    def has_dog(self, dog_id: str) -> bool:
+        return os.path.isdir(self._dog_dir(dog_id))
+
+    def _day_files(
+        self, dog_id: str, start_time: Optional[datetime], end_time: Optional[datetime]
+    ) -> List[Tuple[datetime, str]]:
+        """(day, path) of the dog's part files that can hold rows in the range, oldest day first."""
+        dog_dir = self._dog_dir(dog_id)
+        if not os.path.isdir(dog_dir):
+            return []
+
+        files = []
+        for month_name in sorted(os.listdir(dog_dir)):
+            month_start = datetime.strptime(month_name.split("=", 1)[1], "%Y-%m")
+            if start_time and _next_month(month_start) <= start_time:
+                continue
+            if end_time and month_start > end_time:
+                continue
+
+            month_dir = os.path.join(dog_dir, month_name)
+            for file_name in sorted(os.listdir(month_dir)):
+                if not file_name.endswith(".parquet"):
+                    continue
+                day = datetime.strptime(file_name.split("-")[1], "%Y%m%d")
+                if start_time and day + timedelta(days=1) <= start_time:
+                    continue
+                if end_time and day > end_time:
+                    continue
+                files.append((day, os.path.join(month_dir, file_name)))
+        return files
+
+    @staticmethod
+    def _filters(start_time: Optional[datetime], end_time: Optional[datetime]):
+        filters = []
+        if start_time:
+            filters.append(("recorded_at", ">=", start_time))
+        if end_time:
+            filters.append(("recorded_at", "<=", end_time))
+        return filters or None
+
+    def read(
+        self,
+        dog_id: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        columns: Optional[List[str]] = None
+    ) -> "pa.Table":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        start_time = to_naive_utc(start_time)
+        end_time = to_naive_utc(end_time)
+        schema = pa.schema([archive_schema().field(c) for c in columns]) if columns else archive_schema()
+        filters = self._filters(start_time, end_time)
+
+        tables = [
+            pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+            for _, path in self._day_files(dog_id, start_time, end_time)
+        ]
+        if not tables:
+            return schema.empty_table()
+        return pa.concat_tables(tables)
+
+    def newest(
+        self,
+        dog_id: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 1000,
+        columns: Optional[List[str]] = None
+    ) -> List[dict]:
+        """The newest `limit` archived rows, newest first.
+
+        Days are read from the newest back, only as far as it takes to collect
+        `limit` rows, and only the columns asked for (plus recorded_at).
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        start_time = to_naive_utc(start_time)
+        end_time = to_naive_utc(end_time)
+        if columns:
+            columns = [name for name in dict.fromkeys([*columns, "recorded_at"]) if name in archive_schema().names]
+        filters = self._filters(start_time, end_time)
+
+        rows: List[dict] = []
+        files = self._day_files(dog_id, start_time, end_time)
+        for _, day_files in groupby(reversed(files), key=lambda item: item[0]):
+            # A day can have several parts (late readings archived by a later run)
+            table = pa.concat_tables([
+                pq.read_table(path, columns=columns, filters=filters, memory_map=True) for _, path in day_files
+            ])
+            rows.extend(table.sort_by([("recorded_at", "descending")]).slice(0, limit - len(rows)).to_pylist())
+            if len(rows) >= limit:
+                break
+        return rows
+
+
+class RetentionService:
+    """Moves sensor_data older than the raw window into the cold archive.
+
+    Works one dog-day at a time: the raw rows are written to Parquet, rolled up
+    into sensor_data_minute (merging with any buckets already there, e.g. from
+    late-arriving readings) and then deleted from the hot table.
+
+    With range partitioning (partitions.py), partitions entirely before the
+    cutoff are archived the same way but in one transaction, under a lock that
+    keeps new rows out, and then dropped instead of deleted row by row.
+    Interventions partitions older than RETENTION_INTERVENTION_DAYS are
+    written to Parquet whole and dropped. Rows left after that (the DEFAULT
+    partition, unpartitioned tables) take the row-by-row path.
+    """
+
+    def __init__(
+        self,
+        archive: ColdArchive,
+        raw_days: int = RETENTION_RAW_DAYS,
+        intervention_days: int = RETENTION_INTERVENTION_DAYS
+    ):
+        self.archive = archive
+        self.raw_days = raw_days
+        self.intervention_days = intervention_days
+
+    def cutoff(self, now: Optional[datetime] = None, days: Optional[int] = None) -> datetime:
+        now = now or datetime.utcnow()
+        return (now - timedelta(days=self.raw_days if days is None else days)).replace(second=0, microsecond=0)
+
+    def run(self, db: Session, now: Optional[datetime] = None, dry_run: bool = False) -> dict:
+        cutoff = self.cutoff(now)
+        stats = {
+            "cutoff": cutoff.isoformat(), "dog_days": 0, "archived_rows": 0, "minute_buckets": 0,
+            "dropped_partitions": []
+        }
+
+        if is_postgres(db.get_bind()):
+            for partition, _ in old_partitions(db.connection(), "sensor_data", cutoff):
+                self._archive_partition(db, partition, stats, dry_run)
+            intervention_cutoff = self.cutoff(now, self.intervention_days)
+            for partition, _ in old_partitions(db.connection(), "interventions", intervention_cutoff):
+                self._archive_intervention_partition(db, partition, stats, dry_run)
+
+        oldest_by_dog = db.query(
+            SensorData.dog_id, func.min(SensorData.recorded_at)
+        ).filter(SensorData.recorded_at < cutoff).group_by(SensorData.dog_id).all()
+
+        for dog_id, oldest in oldest_by_dog:
+            day = to_naive_utc(oldest).replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < cutoff:
+                window_end = min(day + timedelta(days=1), cutoff)
+                archived, buckets = self._archive_window(db, dog_id, day, window_end, dry_run)
+                if archived:
+                    stats["dog_days"] += 1
+                    stats["archived_rows"] += archived
+                    stats["minute_buckets"] += buckets
+                day += timedelta(days=1)
+
+        return stats
+
+    def _archive_partition(self, db: Session, partition: str, stats: dict, dry_run: bool):
+        # SHARE blocks writes to the partition (late readings) but not reads, until the drop commits
+        db.execute(text(f"LOCK TABLE {partition} IN SHARE MODE"))
+        oldest_by_dog = db.execute(text(
+            f"SELECT dog_id, min(recorded_at), max(recorded_at) FROM {partition} GROUP BY dog_id"
+        )).all()
+        for dog_id, oldest, newest in oldest_by_dog:
+            day = to_naive_utc(oldest).replace(hour=0, minute=0, second=0, microsecond=0)
+            newest = to_naive_utc(newest)
+            while day <= newest:
+                archived, buckets = self._archive_window(
+                    db, dog_id, day, day + timedelta(days=1), dry_run, delete_rows=False
+                )
+                if archived:
+                    stats["dog_days"] += 1
+                    stats["archived_rows"] += archived
+                    stats["minute_buckets"] += buckets
+                day += timedelta(days=1)
+        if dry_run:
+            db.rollback()
+            return
+        drop_partition(db.connection(), "sensor_data", partition)
+        db.commit()
+        stats["dropped_partitions"].append(partition)
+
+    def _archive_intervention_partition(self, db: Session, partition: str, stats: dict, dry_run: bool):
+        import pandas as pd
+        import pyarrow as pa
+
+        db.execute(text(f"LOCK TABLE {partition} IN SHARE MODE"))
+        rows = db.execute(text(f"SELECT * FROM {partition} ORDER BY triggered_at")).mappings().all()
+        if dry_run:
+            db.rollback()
+            return
+        if rows:
+            df = pd.DataFrame([dict(row) for row in rows])
+            self.archive.write_interventions(partition, pa.Table.from_pandas(df, preserve_index=False))
+        drop_partition(db.connection(), "interventions", partition)
+        db.commit()
+        stats["dropped_partitions"].append(partition)
+
+    def _archive_window(
+        self, db: Session, dog_id: str, start: datetime, end: datetime, dry_run: bool, delete_rows: bool = True
+    ):
+        import pandas as pd
+        import pyarrow as pa
+
+        columns = [SensorData.__table__.c[name] for name, _ in ARCHIVE_COLUMNS]
+        rows = db.query(*columns).filter(
+            and_(
+                SensorData.dog_id == dog_id,
+                SensorData.recorded_at >= start,
+                SensorData.recorded_at < end
+            )
+        ).order_by(SensorData.recorded_at).all()
+        if not rows:
+            return 0, 0
+
+        df = pd.DataFrame(rows, columns=[name for name, _ in ARCHIVE_COLUMNS])
+        for name in ENUM_COLUMNS:
+            df[name] = df[name].map(lambda value: value.name if value is not None else None)
+        for name in TIMESTAMP_COLUMNS:
+            df[name] = pd.to_datetime(df[name], utc=True).dt.tz_localize(None)
+        df["intervention_required"] = df["intervention_required"].fillna(False).astype(bool)
+
+        buckets = self._minute_buckets(db, dog_id, df, start, end)
+        if dry_run:
+            return len(df), len(buckets)
+
+        self.archive.write_day(dog_id, start, pa.Table.from_pandas(df, schema=archive_schema(), preserve_index=False))
+
+        # Replace the window's rollups with the merged ones and drop the archived raw rows.
+        # Deleting by id leaves readings that arrived after the select for the next run.
+        db.execute(delete(SensorDataMinute).where(
+            and_(
+                SensorDataMinute.dog_id == dog_id,
+                SensorDataMinute.bucket_start >= start,
+                SensorDataMinute.bucket_start < end
+            )
+        ))
+        db.execute(insert(SensorDataMinute), buckets)
+        if not delete_rows:
+            # The caller drops the whole partition in the same transaction
+            return len(df), len(buckets)
+        ids = df["id"].tolist()
+        for i in range(0, len(ids), DELETE_CHUNK):
+            db.execute(delete(SensorData).where(SensorData.id.in_(ids[i:i + DELETE_CHUNK])))
+        db.commit()
+        return len(df), len(buckets)
+
+    def _minute_buckets(self, db: Session, dog_id: str, df: "pd.DataFrame", start: datetime, end: datetime) -> List[dict]:
+        import pandas as pd
+
+        df = df.assign(
+            bucket_start=df["recorded_at"].dt.floor("min"),
+            aggression_level=df["aggression_level"].fillna("CALM"),
+            intervention_required=df["intervention_required"].astype(int)
+        )
+        new = df.groupby(["bucket_start", "aggression_level"]).agg(
+            reading_count=("id", "size"),
+            intervention_count=("intervention_required", "sum"),
+            sum_heart_rate=("heart_rate_bpm", "sum"),
+            min_heart_rate=("heart_rate_bpm", "min"),
+            max_heart_rate=("heart_rate_bpm", "max"),
+            sum_temperature=("body_temperature", "sum"),
+            max_temperature=("body_temperature", "max"),
+            sum_hrv=("hrv_rmssd", "sum"),
+            hrv_count=("hrv_rmssd", "count"),
+            sum_stress=("stress_cortisol", "sum"),
+            stress_count=("stress_cortisol", "count"),
+            sum_probability=("aggression_probability", "sum")
+        ).reset_index()
+
+        existing = db.query(SensorDataMinute).filter(
+            and_(
+                SensorDataMinute.dog_id == dog_id,
+                SensorDataMinute.bucket_start >= start,
+                SensorDataMinute.bucket_start < end
+            )
+        ).all()
+        if existing:
+            old = pd.DataFrame([
+                {
+                    **{name: getattr(bucket, name) for name in new.columns},
+                    "bucket_start": to_naive_utc(bucket.bucket_start),
+                    "aggression_level": bucket.aggression_level.name
+                }
+                for bucket in existing
+            ])
+            new = pd.concat([new, old]).groupby(["bucket_start", "aggression_level"]).agg({
+                "reading_count": "sum", "intervention_count": "sum",
+                "sum_heart_rate": "sum", "min_heart_rate": "min", "max_heart_rate": "max",
+                "sum_temperature": "sum", "max_temperature": "max",
+                "sum_hrv": "sum", "hrv_count": "sum",
+                "sum_stress": "sum", "stress_count": "sum",
+                "sum_probability": "sum"
+            }).reset_index()
+
+        new["dog_id"] = dog_id
+        buckets = new.astype(object).where(new.notna(), None).to_dict("records")
+        for bucket in buckets:
+            bucket["bucket_start"] = bucket["bucket_start"].to_pydatetime()
+        return buckets
+
+
+def main():
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archive and downsample sensor_data older than the raw window")
+    parser.add_argument("--days", type=int, default=RETENTION_RAW_DAYS, help="days of raw readings to keep")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="report what would be archived without writing")
+    args = parser.parse_args()
+
+    service = RetentionService(ColdArchive(args.archive_dir), raw_days=args.days)
+    db = SessionLocal()
+    try:
+        print(service.run(db, dry_run=args.dry_run))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, computed_field, field_validator
+from typing import Any, Optional, List
 from datetime import datetime
 from enum import Enum
 
+from photos import variant_url
+
 # Enums
 class AggressionLevel(str, Enum):
     CALM = "CALM"
@@ -56,6 +58,15 @@ class TimeOfDay(str, Enum):
     EVENING = "EVENING"
     NIGHT = "NIGHT"
 
+class ORMEnumNames(BaseModel):
+    # ORM rows hold the integer-coded enums from models.py; responses use their names
+    @field_validator("*", mode="before")
+    @classmethod
+    def enum_by_name(cls, value):
+        if isinstance(value, Enum) and not isinstance(value, str):
+            return value.name
+        return value
+
 # User schemas
 class UserBase(BaseModel):
     email: EmailStr
@@ -91,13 +102,19 @@ class DogBase(BaseModel):
 class DogCreate(DogBase):
     pass
 
-class DogResponse(DogBase):
+class DogResponse(DogBase, ORMEnumNames):
     id: str
-    owner_id: str
+    owner_id: Optional[str] = None
     is_active: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
     
+    # Small variant of an uploaded photo for lists and avatars
+    @computed_field
+    @property
+    def photo_thumbnail_url(self) -> Optional[str]:
+        return variant_url(self.photo_url, "thumb")
+    
     class Config:
         from_attributes = True
 
@@ -147,7 +164,7 @@ class SensorDataBase(BaseModel):
 class SensorDataCreate(SensorDataBase):
     pass
 
-class SensorDataResponse(SensorDataBase):
+class SensorDataResponse(SensorDataBase, ORMEnumNames):
     id: str
     aggression_level: Optional[AggressionLevel] = None
     aggression_probability: Optional[float] = None
@@ -172,7 +189,7 @@ class InterventionBase(BaseModel):
 class InterventionCreate(InterventionBase):
     pass
 
-class InterventionResponse(InterventionBase):
+class InterventionResponse(InterventionBase, ORMEnumNames):
     id: str
     is_acknowledged: bool
     is_successful: Optional[bool] = None
@@ -184,6 +201,55 @@ class InterventionResponse(InterventionBase):
     class Config:
         from_attributes = True
 
+# Collar command schemas
+class CollarCommand(BaseModel):
+    id: str  # intervention id
+    intervention_type: str
+    ultrasonic_frequency: int
+    duration_seconds: int
+    issued_at: float  # epoch seconds
+    expires_at: float
+
+class CollarCommandAck(BaseModel):
+    id: str
+    success: bool
+    completed_at: Optional[datetime] = None  # defaults to when the ack arrives
+
+class CollarCommandAckBatch(BaseModel):
+    acks: List[CollarCommandAck] = Field(..., max_length=100)
+
+# List endpoints: an array of objects, or {"columns": [...], "rows": [[...]]}
+class ResponseLayout(str, Enum):
+    OBJECTS = "objects"
+    COLUMNAR = "columnar"
+
+class ColumnarRows(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+
+# Export schemas
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    PDF = "pdf"
+    XLSX = "xlsx"
+
+class ExportJobResponse(BaseModel):
+    id: str
+    kind: str
+    dog_id: Optional[str] = None
+    format: str
+    start_time: datetime
+    end_time: datetime
+    status: str
+    rows: int
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
 # Authentication schemas
 class LoginRequest(BaseModel):
     username: str
@@ -212,7 +278,7 @@ class DashboardAnalytics(BaseModel):
     interventions_today: int
     avg_aggression_level: float
     recent_interventions: List[InterventionResponse]
-    health_alerts: List[str]
+    health_alerts: List[dict]
 
 # ML Prediction schemas
 class MLPrediction(BaseModel):
@@ -223,3 +289,28 @@ class MLPrediction(BaseModel):
     intervention: str
     ultrasonic_frequency: int
     duration_seconds: int
+
+# Bulk load schemas
+class BulkLoadRequest(BaseModel):
+    path: str  # relative to BULK_LOAD_DIR
+    job_id: Optional[str] = None
+    dog_id: Optional[str] = None  # defaults for files without dog_id/collar_id columns
+    collar_id: Optional[str] = None
+    start_time: Optional[datetime] = None  # required for files without a recorded_at column
+    interval_seconds: float = Field(60.0, gt=0)
+    from_scratch: bool = False
+
+class BulkLoadJobResponse(BaseModel):
+    id: str
+    source: str
+    status: str
+    rows_read: int
+    rows_loaded: int
+    rows_rejected: int
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
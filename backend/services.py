@@ -1,20 +1,32 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_
-from typing import List, Optional
+from sqlalchemy import desc, func, and_, insert
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+import csv
+import io
 import uuid
 import hashlib
 import secrets
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-import pandas as pd
 import numpy as np
-import joblib
-import onnxruntime as rt
 import os
 from dotenv import load_dotenv
 
-from models import Dog, Collar, SensorData, Intervention, User
+from models import Dog, Collar, SensorData, SensorDataMinute, Intervention, User, AggressionLevel
+from collar_registry import DogProfile, enum_code
+from wire_format import ENUM_FIELDS, MISSING_CODE, enum_names
+from retention import ColdArchive
+from serialization import RowSet, schema_columns, select_columns
+from change_log import record_changes
+from photos import variant_url
+from model_store import SCALER_PATH, load_scaler
+from metrics import MODEL_BATCH_SIZE, MODEL_ERRORS, MODEL_INFERENCES, MODEL_ROWS_SCORED, stage_timer
+from config import ML_MODEL_PATH, SENSOR_QUERY_DEFAULT_DAYS, AUTH_HASH_WORKERS, AUTH_HASH_MAX_PENDING, AUTH_TOKEN_CACHE_SIZE
 from schemas import (
     DogCreate, DogResponse, CollarCreate, CollarResponse,
     SensorDataCreate, SensorDataResponse, InterventionCreate,
@@ -31,6 +43,118 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Reading fields the model consumes as integer codes (see models.py)
+READING_ENUM_FEATURES = ENUM_FIELDS
+
+# Enum code -> name lookups for batch inserts
+ENUM_NAME_TABLES = {field: enum_names(enum_cls) for field, enum_cls in ENUM_FIELDS.items()}
+AGGRESSION_LEVEL_NAMES = enum_names(AggressionLevel)
+
+# Vitals outside these bounds (same as SensorDataBase) are rejected by batch and bulk ingest
+VITAL_RANGES = {
+    "heart_rate_bpm": (30, 200),
+    "body_temperature": (35.0, 42.0),
+}
+
+# Normal canine body temperature (Celsius); the model and health monitor use the deviation from it
+NORMAL_BODY_TEMPERATURE = 38.8
+
+def temp_deviation(body_temperature: np.ndarray) -> np.ndarray:
+    return np.abs(body_temperature - NORMAL_BODY_TEMPERATURE)
+
+def vitals_in_range(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    valid = np.ones(len(columns["heart_rate_bpm"]), dtype=bool)
+    for name, (low, high) in VITAL_RANGES.items():
+        valid &= (columns[name] >= low) & (columns[name] <= high)
+    return valid
+
+def nullable(values: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    # Python scalars with None where missing, ready for the DB driver
+    values = values.astype(object)
+    values[missing] = None
+    return values
+
+def sensor_data_columns(
+    columns: Dict[str, np.ndarray],
+    dog_ids: np.ndarray,
+    collar_ids: np.ndarray,
+    prediction: dict,
+    recorded_at: np.ndarray,
+    processed_at: datetime
+) -> Dict[str, np.ndarray]:
+    """sensor_data column values for scored readings given as float columns (NaN for missing)."""
+    row_columns = {"dog_id": dog_ids, "collar_id": collar_ids}
+    for name, values in columns.items():
+        missing = np.isnan(values)
+        if name in ENUM_FIELDS:
+            codes = np.clip(np.where(missing, MISSING_CODE, values), 0, MISSING_CODE).astype(np.intp)
+            row_columns[name] = ENUM_NAME_TABLES[name][codes]
+        elif name == "other_dogs_nearby":
+            row_columns[name] = nullable(np.where(missing, 0, values).astype(np.int64), missing)
+        else:
+            row_columns[name] = nullable(values, missing)
+    row_columns.update({
+        "aggression_level": AGGRESSION_LEVEL_NAMES[prediction["aggression_level"]],
+        "aggression_probability": prediction["probability"],
+        "intervention_required": prediction["intervention"] != "LOW",
+        "recorded_at": recorded_at,
+        "processed_at": np.full(len(dog_ids), processed_at, dtype=object)
+    })
+    return row_columns
+
+def with_ids(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # Rows get a fresh id unless the caller supplies an "id" column
+    if "id" in columns:
+        return columns
+    return {"id": [str(uuid.uuid4()) for _ in range(len(columns["dog_id"]))], **columns}
+
+def rows_from_columns(columns: Dict[str, np.ndarray]) -> List[dict]:
+    # Row dicts for an executemany insert
+    columns = with_ids(columns)
+    keys = list(columns)
+    values = [
+        column.tolist() if isinstance(column, np.ndarray) else column
+        for column in columns.values()
+    ]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+def copy_rows(db: Session, model, columns: Dict[str, np.ndarray]) -> int:
+    """Insert equal-length columns into a table without committing.
+
+    Uses COPY ... FROM STDIN on PostgreSQL and an executemany insert elsewhere
+    (SQLite). Each row gets a fresh id unless an "id" column is given.
+    """
+    n = len(columns["dog_id"])
+    if n == 0:
+        return 0
+    if db.get_bind().dialect.name != "postgresql":
+        db.execute(insert(model), rows_from_columns(columns))
+        return n
+    
+    # Naive timestamps are UTC; unquoted empty fields load as NULL
+    columns = with_ids(columns)
+    buffer = io.StringIO()
+    values = [
+        column.tolist() if isinstance(column, np.ndarray) else column
+        for column in columns.values()
+    ]
+    csv.writer(buffer).writerows(zip(*values))
+    buffer.seek(0)
+    
+    table = model.__table__
+    column_names = ", ".join(columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+        cursor.copy_expert(f"COPY {table.name} ({column_names}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return n
+
+def date_key(value) -> str:
+    # func.date() yields a date on PostgreSQL and an ISO string on SQLite
+    return value if isinstance(value, str) else value.isoformat()
+
 class DogService:
     async def create_dog(self, db: Session, dog_data: DogCreate) -> DogResponse:
         db_dog = Dog(
@@ -42,9 +166,18 @@ class DogService:
         db.refresh(db_dog)
         return DogResponse.from_orm(db_dog)
     
-    async def get_dogs(self, db: Session, skip: int = 0, limit: int = 100) -> List[DogResponse]:
-        dogs = db.query(Dog).offset(skip).limit(limit).all()
-        return [DogResponse.from_orm(dog) for dog in dogs]
+    async def get_dogs(self, db: Session, skip: int = 0, limit: int = 100, ids: Optional[List[str]] = None) -> RowSet:
+        columns = schema_columns(DogResponse)
+        photo = columns.index("photo_url")
+        query = db.query(*select_columns(Dog, columns))
+        if ids is not None:
+            query = query.filter(Dog.id.in_(ids))
+        rows = query.offset(skip).limit(limit).all()
+        # DogResponse.photo_thumbnail_url, computed here since there is no model instance
+        return RowSet(
+            [*columns, "photo_thumbnail_url"],
+            [(*row, variant_url(row[photo], "thumb")) for row in rows]
+        )
     
     async def get_dog(self, db: Session, dog_id: str) -> Optional[DogResponse]:
         dog = db.query(Dog).filter(Dog.id == dog_id).first()
@@ -79,25 +212,48 @@ class CollarService:
         db.refresh(db_collar)
         return CollarResponse.from_orm(db_collar)
     
-    async def get_collars(self, db: Session, skip: int = 0, limit: int = 100) -> List[CollarResponse]:
-        collars = db.query(Collar).offset(skip).limit(limit).all()
-        return [CollarResponse.from_orm(collar) for collar in collars]
+    async def get_collars(self, db: Session, skip: int = 0, limit: int = 100, ids: Optional[List[str]] = None) -> RowSet:
+        columns = schema_columns(CollarResponse)
+        query = db.query(*select_columns(Collar, columns))
+        if ids is not None:
+            query = query.filter(Collar.id.in_(ids))
+        rows = query.offset(skip).limit(limit).all()
+        return RowSet(columns, [tuple(row) for row in rows])
     
     async def get_collar(self, db: Session, collar_id: str) -> Optional[CollarResponse]:
         collar = db.query(Collar).filter(Collar.id == collar_id).first()
         return CollarResponse.from_orm(collar) if collar else None
 
 class SensorDataService:
-    async def create_sensor_data(self, db: Session, sensor_data: SensorDataCreate) -> SensorData:
+    def __init__(self, archive: Optional[ColdArchive] = None):
+        self.archive = archive
+    
+    async def create_sensor_data(
+        self,
+        db: Session,
+        sensor_data: SensorDataCreate,
+        prediction: Optional[dict] = None
+    ) -> SensorData:
         db_sensor_data = SensorData(
             id=str(uuid.uuid4()),
             **sensor_data.dict()
         )
+        if prediction:
+            db_sensor_data.aggression_level = AggressionLevel(prediction["aggression_level"])
+            db_sensor_data.aggression_probability = prediction["probability"]
+            db_sensor_data.intervention_required = prediction["intervention"] != "LOW"
+            db_sensor_data.processed_at = datetime.utcnow()
         db.add(db_sensor_data)
         db.commit()
         db.refresh(db_sensor_data)
         return db_sensor_data
     
+    async def create_sensor_data_batch(self, db: Session, columns: Dict[str, np.ndarray]) -> int:
+        """Bulk insert readings given as equal-length columns of sensor_data values."""
+        count = copy_rows(db, SensorData, columns)
+        db.commit()
+        return count
+    
     async def get_sensor_data_by_dog(
         self, 
         db: Session, 
@@ -105,16 +261,28 @@ class SensorDataService:
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None,
         limit: int = 1000
-    ) -> List[SensorDataResponse]:
-        query = db.query(SensorData).filter(SensorData.dog_id == dog_id)
-        
-        if start_time:
-            query = query.filter(SensorData.recorded_at >= start_time)
+    ) -> RowSet:
+        columns = schema_columns(SensorDataResponse)
+        # Always bound the query in time so partitions can be pruned; start_time widens it
+        start_time = start_time or (end_time or datetime.utcnow()) - timedelta(days=SENSOR_QUERY_DEFAULT_DAYS)
+        query = db.query(*select_columns(SensorData, columns)).filter(
+            SensorData.dog_id == dog_id,
+            SensorData.recorded_at >= start_time
+        )
         if end_time:
             query = query.filter(SensorData.recorded_at <= end_time)
         
-        sensor_data = query.order_by(desc(SensorData.recorded_at)).limit(limit).all()
-        return [SensorDataResponse.from_orm(data) for data in sensor_data]
+        rows = [tuple(row) for row in query.order_by(desc(SensorData.recorded_at)).limit(limit).all()]
+        
+        # Older readings live in the cold archive once retention has moved them
+        if self.archive and len(rows) < limit and self.archive.has_dog(dog_id):
+            id_index, recorded_index = columns.index("id"), columns.index("recorded_at")
+            archive_end = rows[-1][recorded_index] if rows else end_time
+            seen = {row[id_index] for row in rows}
+            for row in self.archive.newest(dog_id, start_time, archive_end, limit, columns=columns):
+                if row["id"] not in seen and len(rows) < limit:
+                    rows.append(tuple(row.get(name) for name in columns))
+        return RowSet(columns, rows)
     
     async def get_aggression_trends(self, db: Session, dog_id: str, days: int = 7) -> List[dict]:
         end_date = datetime.utcnow()
@@ -136,14 +304,43 @@ class SensorDataService:
             SensorData.aggression_level
         ).all()
         
+        # Days past the raw retention window come from the per-minute rollups
+        rollups = db.query(
+            func.date(SensorDataMinute.bucket_start).label('date'),
+            SensorDataMinute.aggression_level,
+            func.sum(SensorDataMinute.reading_count).label('count'),
+            func.sum(SensorDataMinute.sum_probability).label('sum_probability')
+        ).filter(
+            and_(
+                SensorDataMinute.dog_id == dog_id,
+                SensorDataMinute.bucket_start >= start_date,
+                SensorDataMinute.bucket_start <= end_date
+            )
+        ).group_by(
+            func.date(SensorDataMinute.bucket_start),
+            SensorDataMinute.aggression_level
+        ).all()
+        
+        totals = {}
+        for trend in trends:
+            key = (date_key(trend.date), trend.aggression_level.value if trend.aggression_level else 0)
+            entry = totals.setdefault(key, [0, 0.0])
+            entry[0] += trend.count
+            entry[1] += float(trend.avg_probability or 0) * trend.count
+        for rollup in rollups:
+            key = (date_key(rollup.date), rollup.aggression_level.value)
+            entry = totals.setdefault(key, [0, 0.0])
+            entry[0] += int(rollup.count)
+            entry[1] += float(rollup.sum_probability or 0)
+        
         return [
             {
-                "date": trend.date.isoformat(),
-                "aggression_level": trend.aggression_level.value if trend.aggression_level else 0,
-                "count": trend.count,
-                "avg_probability": float(trend.avg_probability or 0)
+                "date": date,
+                "aggression_level": level,
+                "count": count,
+                "avg_probability": probability / count if count else 0.0
             }
-            for trend in trends
+            for (date, level), (count, probability) in sorted(totals.items())
         ]
     
     async def get_health_metrics(self, db: Session, dog_id: str, days: int = 7) -> List[dict]:
@@ -152,9 +349,11 @@ class SensorDataService:
         
         metrics = db.query(
             func.date(SensorData.recorded_at).label('date'),
-            func.avg(SensorData.heart_rate_bpm).label('avg_heart_rate'),
-            func.avg(SensorData.body_temperature).label('avg_temperature'),
-            func.avg(SensorData.stress_cortisol).label('avg_stress_level')
+            func.count(SensorData.id).label('count'),
+            func.sum(SensorData.heart_rate_bpm).label('sum_heart_rate'),
+            func.sum(SensorData.body_temperature).label('sum_temperature'),
+            func.sum(SensorData.stress_cortisol).label('sum_stress'),
+            func.count(SensorData.stress_cortisol).label('stress_count')
         ).filter(
             and_(
                 SensorData.dog_id == dog_id,
@@ -165,27 +364,55 @@ class SensorDataService:
             func.date(SensorData.recorded_at)
         ).all()
         
+        rollups = db.query(
+            func.date(SensorDataMinute.bucket_start).label('date'),
+            func.sum(SensorDataMinute.reading_count).label('count'),
+            func.sum(SensorDataMinute.sum_heart_rate).label('sum_heart_rate'),
+            func.sum(SensorDataMinute.sum_temperature).label('sum_temperature'),
+            func.sum(SensorDataMinute.sum_stress).label('sum_stress'),
+            func.sum(SensorDataMinute.stress_count).label('stress_count')
+        ).filter(
+            and_(
+                SensorDataMinute.dog_id == dog_id,
+                SensorDataMinute.bucket_start >= start_date,
+                SensorDataMinute.bucket_start <= end_date
+            )
+        ).group_by(
+            func.date(SensorDataMinute.bucket_start)
+        ).all()
+        
+        totals = {}
+        for metric in (*metrics, *rollups):
+            entry = totals.setdefault(date_key(metric.date), [0, 0.0, 0.0, 0.0, 0])
+            entry[0] += int(metric.count or 0)
+            entry[1] += float(metric.sum_heart_rate or 0)
+            entry[2] += float(metric.sum_temperature or 0)
+            entry[3] += float(metric.sum_stress or 0)
+            entry[4] += int(metric.stress_count or 0)
+        
         return [
             {
-                "date": metric.date.isoformat(),
-                "avg_heart_rate": float(metric.avg_heart_rate or 0),
-                "avg_temperature": float(metric.avg_temperature or 0),
-                "avg_stress_level": float(metric.avg_stress_level or 0)
+                "date": date,
+                "avg_heart_rate": heart_rate / count if count else 0.0,
+                "avg_temperature": temperature / count if count else 0.0,
+                "avg_stress_level": stress / stress_count if stress_count else 0.0
             }
-            for metric in metrics
+            for date, (count, heart_rate, temperature, stress, stress_count) in sorted(totals.items())
         ]
     
-    async def get_dashboard_analytics(self, db: Session) -> dict:
+    async def get_dashboard_analytics(self, db: Session, health_alerts: Optional[List[dict]] = None) -> dict:
         total_dogs = db.query(Dog).filter(Dog.is_active == True).count()
         active_collars = db.query(Collar).filter(Collar.is_online == True).count()
         
-        today = datetime.utcnow().date()
+        now = datetime.utcnow()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         interventions_today = db.query(Intervention).filter(
-            func.date(Intervention.triggered_at) == today
+            Intervention.triggered_at >= today,
+            Intervention.triggered_at < today + timedelta(days=1)
         ).count()
         
         avg_aggression = db.query(func.avg(SensorData.aggression_level)).filter(
-            SensorData.recorded_at >= datetime.utcnow() - timedelta(hours=24)
+            SensorData.recorded_at >= now - timedelta(hours=24)
         ).scalar() or 0
         
         recent_interventions = db.query(Intervention).order_by(
@@ -198,7 +425,7 @@ class SensorDataService:
             "interventions_today": interventions_today,
             "avg_aggression_level": float(avg_aggression),
             "recent_interventions": [InterventionResponse.from_orm(i) for i in recent_interventions],
-            "health_alerts": []  # Implement health alert logic
+            "health_alerts": health_alerts or []
         }
 
 class InterventionService:
@@ -212,19 +439,37 @@ class InterventionService:
         db.refresh(db_intervention)
         return InterventionResponse.from_orm(db_intervention)
     
+    async def create_interventions_batch(self, db: Session, columns: Dict[str, np.ndarray]) -> int:
+        columns = with_ids(columns)
+        count = copy_rows(db, Intervention, columns)
+        record_changes(db, "intervention", columns["id"])
+        db.commit()
+        return count
+    
     async def get_interventions(
         self, 
         db: Session, 
         dog_id: Optional[str] = None,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[InterventionResponse]:
-        query = db.query(Intervention)
+        limit: int = 100,
+        ids: Optional[List[str]] = None,
+        start_time: Optional[datetime] = None
+    ) -> RowSet:
+        columns = schema_columns(InterventionResponse)
+        query = db.query(*select_columns(Intervention, columns))
         if dog_id:
             query = query.filter(Intervention.dog_id == dog_id)
+        if ids is not None:
+            # Changed rows for /sync, whatever their age
+            query = query.filter(Intervention.id.in_(ids))
+        else:
+            # Bounded in time like sensor history, so partitions can be pruned; start_time widens it
+            query = query.filter(Intervention.triggered_at >= (
+                start_time or datetime.utcnow() - timedelta(days=SENSOR_QUERY_DEFAULT_DAYS)
+            ))
         
-        interventions = query.order_by(desc(Intervention.triggered_at)).offset(skip).limit(limit).all()
-        return [InterventionResponse.from_orm(intervention) for intervention in interventions]
+        rows = query.order_by(desc(Intervention.triggered_at)).offset(skip).limit(limit).all()
+        return RowSet(columns, [tuple(row) for row in rows])
     
     async def acknowledge_intervention(self, db: Session, intervention_id: str) -> InterventionResponse:
         intervention = db.query(Intervention).filter(Intervention.id == intervention_id).first()
@@ -237,13 +482,59 @@ class InterventionService:
         db.refresh(intervention)
         return InterventionResponse.from_orm(intervention)
 
+class AuthBusyError(Exception):
+    """Raised when too many password hashes are already queued."""
+
+class TokenCache:
+    """Small LRU of decoded JWT claims keyed by a hash of the token, valid until the token's exp."""
+    
+    def __init__(self, max_size: int = AUTH_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._claims: "OrderedDict[bytes, dict]" = OrderedDict()
+    
+    def get(self, key: bytes) -> Optional[dict]:
+        claims = self._claims.get(key)
+        if claims is None:
+            return None
+        if claims.get("exp", 0) <= time.time():
+            del self._claims[key]
+            return None
+        self._claims.move_to_end(key)
+        return claims
+    
+    def put(self, key: bytes, claims: dict):
+        self._claims[key] = claims
+        self._claims.move_to_end(key)
+        while len(self._claims) > self.max_size:
+            self._claims.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._claims)
+
 class AuthService:
+    def __init__(self, hash_workers: int = AUTH_HASH_WORKERS, max_pending: int = AUTH_HASH_MAX_PENDING):
+        # bcrypt releases the GIL while hashing, so a small thread pool keeps it off the event loop
+        self._hash_pool = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="bcrypt")
+        self._max_pending = max_pending
+        self._pending = 0
+        self.token_cache = TokenCache()
+    
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         return pwd_context.verify(plain_password, hashed_password)
     
     def get_password_hash(self, password: str) -> str:
         return pwd_context.hash(password)
     
+    async def _run_hash(self, fn, *args):
+        # Shed logins beyond the admission limit instead of queueing them without bound
+        if self._pending >= self._max_pending:
+            raise AuthBusyError("Too many concurrent logins, retry shortly")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._hash_pool, fn, *args)
+        finally:
+            self._pending -= 1
+    
     def create_access_token(self, data: dict) -> str:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -251,8 +542,24 @@ class AuthService:
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
     
+    def verify_token(self, token: str) -> dict:
+        """Return the token's claims, raising ValueError if it is invalid or expired."""
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.token_cache.get(key)
+        if claims is not None:
+            return claims
+        
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise ValueError("Invalid or expired token")
+        if "exp" not in claims:
+            raise ValueError("Token has no expiry")
+        self.token_cache.put(key, claims)
+        return claims
+    
     async def create_user(self, db: Session, user_data: UserCreate) -> UserResponse:
-        hashed_password = self.get_password_hash(user_data.password)
+        hashed_password = await self._run_hash(self.get_password_hash, user_data.password)
         db_user = User(
             id=str(uuid.uuid4()),
             email=user_data.email,
@@ -267,45 +574,144 @@ class AuthService:
     
     async def authenticate_user(self, db: Session, login_data: LoginRequest) -> dict:
         user = db.query(User).filter(User.username == login_data.username).first()
-        if not user or not self.verify_password(login_data.password, user.hashed_password):
+        if not user or not await self._run_hash(self.verify_password, login_data.password, user.hashed_password):
             raise ValueError("Invalid credentials")
         
-        access_token = self.create_access_token(data={"sub": user.username})
+        access_token = self.create_access_token(data={"sub": user.username, "admin": bool(user.is_admin)})
         return {
             "access_token": access_token,
             "token_type": "bearer"
         }
 
 class MLService:
-    def __init__(self):
-        # Load ML model and scaler
+    """Aggression model. Construction is cheap; call load() (the API does so in its lifespan handler)."""
+
+    def __init__(self, model_path: str = ML_MODEL_PATH, scaler_path: str = SCALER_PATH):
+        self.model_name = "dog_aggression_model"
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.sess = None
+        # Set by the API once the model is loaded (drift_monitor.DriftMonitor)
+        self.drift_monitor = None
+    
+    def load(self, intra_op_threads: int = 0) -> "MLService":
+        # onnxruntime is imported here so importing this module stays cheap.
+        # intra_op_threads=1 runs inference on the calling thread only, which
+        # keeps the session usable in processes forked after loading.
         try:
-            self.meta = joblib.load("ml/dog_aggression_model_meta.pkl")
-            self.scaler = self.meta["scaler"]
-            self.feature_names = self.meta["feature_names"]
-            self.aggression_levels = self.meta["aggression_levels"]
+            import onnxruntime as rt
+
+            self.scaler = load_scaler(self.scaler_path)
+            self.feature_names = self.scaler.feature_names
+            self.aggression_levels = self.scaler.aggression_levels
             
+            options = rt.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            if intra_op_threads == 1:
+                options.inter_op_num_threads = 1
+                options.execution_mode = rt.ExecutionMode.ORT_SEQUENTIAL
             self.sess = rt.InferenceSession(
-                "ml/dog_aggression_model.onnx", 
+                self.model_path, 
+                sess_options=options,
                 providers=["CPUExecutionProvider"]
             )
             self.input_name = self.sess.get_inputs()[0].name
         except Exception as e:
             print(f"Warning: Could not load ML model: {e}")
             self.sess = None
+        return self
+    
+    def build_feature_row(self, sensor_data: SensorDataCreate, dog_profile: Optional[DogProfile] = None) -> dict:
+        row = sensor_data.dict(exclude={"dog_id", "collar_id"})
+        for field, enum_cls in READING_ENUM_FEATURES.items():
+            row[field] = enum_code(enum_cls, row.get(field))
+        if dog_profile:
+            row.update(dog_profile._asdict())
+        return row
     
-    def engineer_features_df(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        df['hr_stress_indicator'] = (df['heart_rate_bpm'] - 85) / 85
-        df['night_risk'] = (df['time_of_day'] == 3).astype(int) * 3
-        df['close_human_stress'] = (df['human_proximity_meters'] < 5).astype(int)
-        df['pack_isolation'] = (df['other_dogs_nearby'] == 0).astype(int)
-        df['young_male_risk'] = ((df['age_years'] < 3) & (df['sex'] == 1) & (df['sterilization_status'] == 0)).astype(int)
-        df['behavioral_composite'] = (df['body_posture'] + df['tail_position'] + df['ear_position'] + df['vocalization_type']) / 4
-        df['temp_deviation'] = abs(df['body_temperature'] - 38.8)
-        return df
-    
-    async def predict_aggression(self, sensor_data: SensorDataCreate) -> dict:
+    def engineer_features_columns(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # Derived model features, computed on NumPy columns (one element per row)
+        columns = dict(columns)
+        columns['hr_stress_indicator'] = (columns['heart_rate_bpm'] - 85) / 85
+        columns['night_risk'] = (columns['time_of_day'] == 3).astype(np.float32) * 3
+        columns['close_human_stress'] = (columns['human_proximity_meters'] < 5).astype(np.float32)
+        columns['pack_isolation'] = (columns['other_dogs_nearby'] == 0).astype(np.float32)
+        columns['young_male_risk'] = (
+            (columns['age_years'] < 3) & (columns['sex'] == 1) & (columns['sterilization_status'] == 0)
+        ).astype(np.float32)
+        columns['behavioral_composite'] = (
+            columns['body_posture'] + columns['tail_position'] + columns['ear_position'] + columns['vocalization_type']
+        ) / 4
+        columns['temp_deviation'] = temp_deviation(columns['body_temperature'])
+        return columns
+    
+    def _score(self, X: np.ndarray, path: str, observe: bool = True) -> dict:
+        MODEL_INFERENCES.labels(self.model_name, path).inc()
+        MODEL_ROWS_SCORED.labels(self.model_name, path).inc(len(X))
+        MODEL_BATCH_SIZE.labels(self.model_name).observe(len(X))
+        
+        with stage_timer(path, "onnx_inference"):
+            X_scaled = self.scaler.transform(X)
+            try:
+                out = self.sess.run(None, {self.input_name: X_scaled})
+            except Exception:
+                MODEL_ERRORS.labels(self.model_name).inc()
+                raise
+        if len(out) == 1:
+            probs = out[0]
+        else:
+            probs = out[1]
+        
+        probs = np.asarray(probs)
+        pred = np.argmax(probs, axis=1)
+        max_prob = np.max(probs, axis=1)
+        if observe and self.drift_monitor is not None:
+            self.drift_monitor.observe(X, pred)
+        
+        # Determine intervention
+        critical = max_prob > 0.8
+        high = ~critical & (max_prob > 0.6)
+        medium = ~critical & ~high & (pred >= 2)
+        conditions = [critical, high, medium]
+        
+        return {
+            "aggression_level": pred,
+            "probability": max_prob,
+            "intervention": np.select(conditions, ["CRITICAL", "HIGH", "MEDIUM"], "LOW"),
+            "ultrasonic_frequency": np.select(conditions, [22000, 20000, 18000], 0),
+            "duration_seconds": np.select(conditions, [5, 3, 2], 0)
+        }
+    
+    def predict_batch(self, columns: Dict[str, np.ndarray], observe: bool = True) -> dict:
+        """Score a batch given float columns (NaN for missing), returning one array per prediction field.
+
+        observe=False keeps the rows out of the drift monitor (e.g. historical imports).
+        """
+        n = len(columns['heart_rate_bpm'])
+        # Same default as predict_aggression, so readings are still stored when scoring fails
+        default = {
+            "aggression_level": np.zeros(n, dtype=np.int64),
+            "probability": np.full(n, 0.1),
+            "intervention": np.full(n, "LOW", dtype=object),
+            "ultrasonic_frequency": np.zeros(n, dtype=np.int64),
+            "duration_seconds": np.zeros(n, dtype=np.int64)
+        }
+        if not self.sess or n == 0:
+            return default
+        try:
+            with stage_timer("batch", "feature_engineering"):
+                columns = self.engineer_features_columns(columns)
+                X = np.column_stack([columns[name] for name in self.feature_names]).astype(np.float32)
+            return self._score(X, "batch", observe)
+        except Exception as e:
+            print(f"Error in batch ML prediction: {e}")
+            return default
+    
+    async def predict_aggression(
+        self,
+        sensor_data: SensorDataCreate,
+        dog_profile: Optional[DogProfile] = None
+    ) -> dict:
         if not self.sess:
             # Return default prediction if model not loaded
             return {
@@ -318,50 +724,23 @@ class MLService:
             }
         
         try:
-            # Convert sensor data to DataFrame
-            df = pd.DataFrame([sensor_data.dict()])
-            df = self.engineer_features_df(df)
-            
-            # Ensure correct column order
-            X = df[self.feature_names].astype(np.float32).values
-            X_scaled = self.scaler.transform(X)
-            
-            # Make prediction
-            out = self.sess.run(None, {self.input_name: X_scaled})
-            if len(out) == 1:
-                probs = out[0]
-            else:
-                probs = out[1]
-            
-            probs = np.asarray(probs)
-            pred = int(np.argmax(probs, axis=1)[0])
-            max_prob = float(np.max(probs))
-            
-            # Determine intervention
-            intervention = "LOW"
-            freq = 0
-            dur = 0
-            
-            if max_prob > 0.8:
-                intervention = "CRITICAL"
-                freq = 22000
-                dur = 5
-            elif max_prob > 0.6:
-                intervention = "HIGH"
-                freq = 20000
-                dur = 3
-            elif pred >= 2:
-                intervention = "MEDIUM"
-                freq = 18000
-                dur = 2
+            with stage_timer("single", "feature_engineering"):
+                # One-row columns, so single readings share the batch feature code
+                row = self.build_feature_row(sensor_data, dog_profile)
+                columns = self.engineer_features_columns({name: np.array([value], dtype=float) for name, value in row.items()})
+                
+                # Ensure correct column order
+                X = np.column_stack([columns[name] for name in self.feature_names]).astype(np.float32)
+            scores = self._score(X, "single")
+            pred = int(scores["aggression_level"][0])
             
             return {
                 "aggression_level": pred,
                 "aggression_label": self.aggression_levels.get(pred, str(pred)),
-                "probability": max_prob,
-                "intervention": intervention,
-                "ultrasonic_frequency": freq,
-                "duration_seconds": dur
+                "probability": float(scores["probability"][0]),
+                "intervention": str(scores["intervention"][0]),
+                "ultrasonic_frequency": int(scores["ultrasonic_frequency"][0]),
+                "duration_seconds": int(scores["duration_seconds"][0])
             }
         except Exception as e:
             print(f"Error in ML prediction: {e}")
@@ -0,0 +1,548 @@
+"""Synthetic collar fleet and load generator.
+
+    python simulator.py setup --collars 20000 --fleet fleet.json
+    python simulator.py run --fleet fleet.json --duration 600 --dashboards 500
+
+Each virtual dog follows a per-level random walk fitted to
+ml/indian_street_dog_aggression_dataset.csv. Calm stretches are interrupted
+by behavior episodes that move the dog to a higher aggression level for a few
+minutes. Collars sample every --sample-interval seconds and upload every
+--upload-interval seconds, using the binary batch endpoint when the server
+has it and one POST /sensor-data per reading otherwise. Collars drop offline
+at random and during periodic reconnect storms, then flush their backlog in
+one burst when they come back. Dashboard websocket clients connect alongside.
+State is vectorized with NumPy, so one process can drive tens of thousands
+of collars.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+import numpy as np
+import pandas as pd
+import websockets
+
+from models import BodyPosture, TailPosition, EarPosition, VocalizationType, Sex, SterilizationStatus
+from wire_format import HEADER, MAGIC, MISSING_CODE, READING_DTYPE_V1, WIRE_VERSION
+
+ML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml")
+FLEET_CSV = os.path.join(ML_DIR, "indian_street_dog_aggression_dataset.csv")
+
+CONTINUOUS = ("heart_rate_bpm", "hrv_rmssd", "body_temperature", "stress_cortisol", "human_proximity_meters")
+CATEGORICAL = {
+    "body_posture": BodyPosture,
+    "tail_position": TailPosition,
+    "ear_position": EarPosition,
+    "vocalization_type": VocalizationType,
+    "other_dogs_nearby": None,
+}
+
+
+class FeatureModel:
+    """Per-aggression-level feature distributions fitted to the fleet dataset."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.levels = np.sort(df["aggression_level"].unique())
+        counts = df["aggression_level"].value_counts().reindex(self.levels, fill_value=0)
+        self.level_weights = (counts / counts.sum()).to_numpy()
+
+        by_level = [df[df["aggression_level"] == level] for level in self.levels]
+        self.mean = np.array([[part[c].mean() for c in CONTINUOUS] for part in by_level])
+        self.std = np.array([[part[c].std() for c in CONTINUOUS] for part in by_level])
+        self.low = df[list(CONTINUOUS)].min().to_numpy()
+        self.high = df[list(CONTINUOUS)].max().to_numpy()
+
+        # Cumulative probabilities over integer values, one row per level
+        self.cdf = {}
+        for name, enum_cls in CATEGORICAL.items():
+            top = len(enum_cls) - 1 if enum_cls else min(int(df[name].max()), MISSING_CODE - 1)
+            values = df[name].clip(0, top).astype(int)
+            table = np.array([
+                np.bincount(values[df["aggression_level"] == level], minlength=top + 1)
+                for level in self.levels
+            ], dtype=np.float64)
+            table = (table + 1e-9) / (table + 1e-9).sum(axis=1, keepdims=True)
+            self.cdf[name] = np.cumsum(table, axis=1)
+
+        self.profiles = df[["age_years", "sex", "sterilization_status"]].to_numpy()
+
+    def sample_categorical(self, name: str, level_index: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        u = rng.random(len(level_index))
+        return (u[:, None] > self.cdf[name][level_index]).sum(axis=1).astype(np.uint8)
+
+
+def time_of_day_code(moment: datetime) -> int:
+    if 6 <= moment.hour < 12:
+        return 0
+    if 12 <= moment.hour < 17:
+        return 1
+    if 17 <= moment.hour < 21:
+        return 2
+    return 3
+
+
+class Fleet:
+    """Vectorized physiological and behavioral state of every virtual dog."""
+
+    def __init__(self, model: FeatureModel, collars: List[dict], args, rng: np.random.Generator):
+        self.model = model
+        self.rng = rng
+        self.args = args
+        n = len(collars)
+        self.n = n
+        self.collar_ids = [collar["collar_id"] for collar in collars]
+        self.dog_ids = [collar["dog_id"] for collar in collars]
+        self.collar_bytes = np.array([uuid.UUID(c).bytes for c in self.collar_ids], dtype="S16")
+
+        self.level = np.zeros(n, dtype=np.intp)
+        self.episode_left = np.zeros(n, dtype=np.int64)
+        self.continuous = model.mean[self.level] + rng.standard_normal((n, len(CONTINUOUS))) * model.std[self.level]
+        self.categorical = np.column_stack([
+            model.sample_categorical(name, self.level, rng) for name in CATEGORICAL
+        ])
+
+        # Readings since each collar's last upload, newest last
+        self.per_upload = max(1, int(round(args.upload_interval / args.sample_interval)))
+        self.history_continuous = np.zeros((self.per_upload, n, len(CONTINUOUS)), dtype=np.float32)
+        self.history_categorical = np.zeros((self.per_upload, n, len(CATEGORICAL)), dtype=np.uint8)
+        self.history_time = np.zeros(self.per_upload, dtype=np.uint32)
+        self.phase = rng.integers(0, self.per_upload, n)
+
+        # Connectivity: ticks left offline and readings missed while offline
+        self.offline_left = np.zeros(n, dtype=np.int64)
+        self.missed = np.zeros(n, dtype=np.int64)
+
+    def step(self, tick: int, now: float):
+        args, model, rng = self.args, self.model, self.rng
+        ticks_per_episode = args.episode_minutes * 60 / args.sample_interval
+
+        # Behavior episodes: calm dogs occasionally escalate, then settle back down
+        calm = self.level == 0
+        start = calm & (rng.random(self.n) < args.sample_interval / args.episode_every)
+        if start.any():
+            weights = model.level_weights[1:] / model.level_weights[1:].sum()
+            self.level[start] = rng.choice(np.arange(1, len(model.levels)), size=int(start.sum()), p=weights)
+            self.episode_left[start] = np.maximum(1, rng.exponential(ticks_per_episode, int(start.sum()))).astype(np.int64)
+        self.episode_left[~calm] -= 1
+        self.level[(self.level > 0) & (self.episode_left <= 0)] = 0
+
+        # Mean-reverting walk toward the current level's distribution
+        alpha = 0.2
+        noise = rng.standard_normal(self.continuous.shape) * model.std[self.level] * np.sqrt(1 - (1 - alpha) ** 2)
+        self.continuous += alpha * (model.mean[self.level] - self.continuous) + noise
+        np.clip(self.continuous, model.low, model.high, out=self.continuous)
+
+        # Behavior changes less often than vitals
+        change = rng.random(self.n) < 0.3
+        if change.any():
+            for j, name in enumerate(CATEGORICAL):
+                self.categorical[change, j] = model.sample_categorical(name, self.level[change], rng)
+
+        slot = tick % self.per_upload
+        self.history_continuous[slot] = self.continuous
+        self.history_categorical[slot] = self.categorical
+        self.history_time[slot] = int(now)
+
+        # Random outages plus the readings they cost
+        online = self.offline_left == 0
+        drop = online & (rng.random(self.n) < args.sample_interval / args.outage_every)
+        self.offline_left[drop] = np.maximum(1, rng.exponential(args.outage_seconds / args.sample_interval, int(drop.sum())))
+        offline = self.offline_left > 0
+        self.missed[offline] = np.minimum(self.missed[offline] + 1, args.max_backlog)
+        self.offline_left[offline] -= 1
+
+    def storm(self, fraction: float, seconds: float) -> int:
+        hit = self.rng.random(self.n) < fraction
+        self.offline_left[hit] = max(1, int(seconds / self.args.sample_interval))
+        return int(hit.sum())
+
+    def due(self, tick: int) -> np.ndarray:
+        """Collars uploading this tick: online collars on their phase, plus any just back online with a backlog."""
+        online = self.offline_left == 0
+        on_phase = (tick + self.phase) % self.per_upload == 0
+        return np.flatnonzero(online & (on_phase | (self.missed > 0)))
+
+    def records(self, index: np.ndarray, time_of_day: int) -> np.ndarray:
+        """Wire records for the last upload interval of each collar in index, collar-major."""
+        order = np.argsort(self.history_time)
+        order = order[self.history_time[order] > 0]  # slots not yet filled after startup
+        k = len(order)
+        records = np.zeros(len(index) * k, dtype=READING_DTYPE_V1)
+        records["collar_id"] = np.repeat(self.collar_bytes[index], k)
+        records["recorded_at"] = np.tile(self.history_time[order], len(index))
+        continuous = self.history_continuous[order][:, index].transpose(1, 0, 2).reshape(-1, len(CONTINUOUS))
+        categorical = self.history_categorical[order][:, index].transpose(1, 0, 2).reshape(-1, len(CATEGORICAL))
+        for j, name in enumerate(CONTINUOUS):
+            records[name] = continuous[:, j]
+        for j, name in enumerate(CATEGORICAL):
+            records[name] = categorical[:, j]
+        records["time_of_day"] = time_of_day
+        for name in ("gps_latitude", "gps_longitude", "gps_accuracy"):
+            records[name] = np.nan
+        return records
+
+    def backlog(self, i: int, now: float, time_of_day: int) -> np.ndarray:
+        """Readings a collar buffered while offline, approximated around its current state."""
+        m = int(self.missed[i])
+        records = np.zeros(m, dtype=READING_DTYPE_V1)
+        records["collar_id"] = self.collar_bytes[i]
+        # Older than the readings still in the upload window, which are sent right after
+        records["recorded_at"] = (now - self.args.sample_interval * (self.per_upload + np.arange(m, 0, -1))).astype(np.uint32)
+        noise = self.rng.standard_normal((m, len(CONTINUOUS))) * self.model.std[self.level[i]] * 0.2
+        values = np.clip(self.continuous[i] + noise, self.model.low, self.model.high)
+        for j, name in enumerate(CONTINUOUS):
+            records[name] = values[:, j]
+        for j, name in enumerate(CATEGORICAL):
+            records[name] = self.categorical[i, j]
+        records["time_of_day"] = time_of_day
+        for name in ("gps_latitude", "gps_longitude", "gps_accuracy"):
+            records[name] = np.nan
+        self.missed[i] = 0
+        return records
+
+
+def payload(records: np.ndarray) -> bytes:
+    return HEADER.pack(MAGIC, WIRE_VERSION, 0, len(records)) + records.tobytes()
+
+
+def json_readings(records: np.ndarray, dog_id: str, collar_id: str) -> List[dict]:
+    readings = []
+    for record in records:
+        reading = {"dog_id": dog_id, "collar_id": collar_id}
+        for name in CONTINUOUS:
+            reading[name] = float(record[name])
+        for name, enum_cls in CATEGORICAL.items():
+            code = int(record[name])
+            reading[name] = code if enum_cls is None else enum_cls(code).name
+        reading["time_of_day"] = ("MORNING", "AFTERNOON", "EVENING", "NIGHT")[int(record["time_of_day"])]
+        readings.append(reading)
+    return readings
+
+
+class Stats:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = {}
+        self.status: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.readings_sent = 0
+        self.readings_accepted = 0
+        self.readings_rejected = 0
+        self.interventions = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.tick_lag: List[float] = []
+        self.ws_connect: List[float] = []
+        self.ws_message_lag: List[float] = []
+        self.ws_messages = 0
+        self.ws_errors: Dict[str, int] = {}
+        self.ws_open = 0
+
+    def error(self, table: Dict[str, int], e: Exception):
+        key = type(e).__name__
+        table[key] = table.get(key, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        def percentiles(samples: List[float]) -> dict:
+            if not samples:
+                return {}
+            ms = np.asarray(samples) * 1000
+            return {f"p{q}_ms": round(float(np.percentile(ms, q)), 2) for q in (50, 90, 99)} | {"max_ms": round(float(ms.max()), 2)}
+
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "readings_sent": self.readings_sent,
+            "readings_per_second": round(self.readings_sent / elapsed, 1) if elapsed else 0,
+            "readings_accepted": self.readings_accepted,
+            "readings_rejected": self.readings_rejected,
+            "interventions": self.interventions,
+            "requests": {
+                endpoint: {"count": len(samples), **percentiles(samples)}
+                for endpoint, samples in self.latency.items()
+            },
+            "status": self.status,
+            "errors": self.errors,
+            "max_in_flight": self.max_in_flight,
+            "tick_lag": percentiles(self.tick_lag),
+            "websocket": {
+                "open": self.ws_open,
+                "messages": self.ws_messages,
+                "connect": percentiles(self.ws_connect),
+                "message_lag": percentiles(self.ws_message_lag),
+                "errors": self.ws_errors,
+            },
+        }
+
+
+class LoadGenerator:
+    def __init__(self, args, fleet: Fleet, stats: Stats):
+        self.args = args
+        self.fleet = fleet
+        self.stats = stats
+        self.semaphore = asyncio.Semaphore(args.max_in_flight)
+        self.client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+        )
+        self.tasks = set()
+        self.storm_generation = 0
+
+    async def detect_mode(self) -> str:
+        if self.args.mode != "auto":
+            return self.args.mode
+        try:
+            response = await self.client.post("/sensor-data/batch", content=payload(np.zeros(0, dtype=READING_DTYPE_V1)))
+            return "batch" if response.status_code == 200 else "single"
+        except httpx.HTTPError:
+            return "single"
+
+    async def send(self, endpoint: str, count: int, **kwargs):
+        stats = self.stats
+        async with self.semaphore:
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            started = time.perf_counter()
+            try:
+                response = await self.client.post(endpoint, **kwargs)
+                stats.latency.setdefault(endpoint, []).append(time.perf_counter() - started)
+                stats.status[str(response.status_code)] = stats.status.get(str(response.status_code), 0) + 1
+                stats.readings_sent += count
+                if response.status_code == 200:
+                    if endpoint.endswith("/batch"):
+                        body = response.json()
+                        stats.readings_accepted += body["accepted"]
+                        stats.readings_rejected += body["rejected"]
+                        stats.interventions += len(body["interventions"])
+                    else:
+                        stats.readings_accepted += count
+            except Exception as e:
+                stats.error(stats.errors, e)
+            finally:
+                stats.in_flight -= 1
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def drive_collars(self, mode: str, stop: asyncio.Event):
+        args, fleet, stats = self.args, self.fleet, self.stats
+        tick = 0
+        started = time.monotonic()
+        next_storm = started + args.storm_every if args.storm_every else None
+        while not stop.is_set():
+            scheduled = started + tick * args.sample_interval
+            stats.tick_lag.append(max(0.0, time.monotonic() - scheduled))
+            now = time.time()
+            fleet.step(tick, now)
+            if next_storm and time.monotonic() >= next_storm:
+                hit = fleet.storm(args.storm_fraction, args.storm_seconds)
+                self.storm_generation += 1
+                print(f"Reconnect storm: {hit} collars offline for {args.storm_seconds}s")
+                next_storm += args.storm_every
+
+            time_of_day = time_of_day_code(datetime.now())
+            due = fleet.due(tick)
+            backlogged = due[fleet.missed[due] > 0]
+            regular = due[fleet.missed[due] == 0]
+            if mode == "batch":
+                records = fleet.records(regular, time_of_day)
+                k = len(records) // len(regular) if len(regular) else 0
+                for j in range(len(regular)):
+                    self.spawn(self.send("/sensor-data/batch", k, content=payload(records[j * k:(j + 1) * k])))
+                for i in backlogged:
+                    buffered = np.concatenate([fleet.backlog(i, now, time_of_day), fleet.records(np.array([i]), time_of_day)])
+                    for start in range(0, len(buffered), args.wire_max_batch):
+                        chunk = buffered[start:start + args.wire_max_batch]
+                        self.spawn(self.send("/sensor-data/batch", len(chunk), content=payload(chunk)))
+            else:
+                for i in due:
+                    records = fleet.records(np.array([i]), time_of_day)
+                    if fleet.missed[i]:
+                        records = np.concatenate([fleet.backlog(i, now, time_of_day), records])
+                    for reading in json_readings(records, fleet.dog_ids[i], fleet.collar_ids[i]):
+                        self.spawn(self.send("/sensor-data", 1, json=reading))
+
+            tick += 1
+            delay = started + tick * args.sample_interval - time.monotonic()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def dashboard(self, index: int, stop: asyncio.Event):
+        args, stats = self.args, self.stats
+        ws_url = args.url.replace("http", "ws", 1) + f"/ws/sim-{index}-{uuid.uuid4().hex[:8]}"
+        # Spread the initial connects so startup isn't itself a storm
+        await asyncio.sleep(random.random() * args.ramp_seconds)
+        while not stop.is_set():
+            generation = self.storm_generation
+            reconnect = False
+            started = time.perf_counter()
+            try:
+                async with websockets.connect(ws_url, open_timeout=args.timeout) as ws:
+                    stats.ws_connect.append(time.perf_counter() - started)
+                    stats.ws_open += 1
+                    try:
+                        while not stop.is_set():
+                            try:
+                                message = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                            except asyncio.TimeoutError:
+                                message = None
+                            if message is not None:
+                                stats.ws_messages += 1
+                                self.record_message_lag(message)
+                            # Storms also drop a matching share of dashboards, which reconnect together
+                            if self.storm_generation != generation:
+                                generation = self.storm_generation
+                                if random.random() < args.storm_fraction:
+                                    reconnect = True
+                                    break
+                    finally:
+                        stats.ws_open -= 1
+            except Exception as e:
+                stats.error(stats.ws_errors, e)
+                await asyncio.sleep(1 + random.random() * 4)
+                continue
+            if reconnect:
+                await asyncio.sleep(random.random())
+
+    def record_message_lag(self, message):
+        if not isinstance(message, str) or not message.startswith("{"):
+            return
+        try:
+            timestamp = json.loads(message).get("timestamp")
+            sent = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        except (ValueError, TypeError, AttributeError):
+            return
+        if sent.tzinfo is None:
+            lag = datetime.utcnow() - sent
+        else:
+            lag = datetime.now(sent.tzinfo) - sent
+        self.stats.ws_message_lag.append(max(0.0, lag.total_seconds()))
+
+    async def close(self):
+        if self.tasks:
+            _, pending = await asyncio.wait(self.tasks, timeout=self.args.timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self.client.aclose()
+
+
+async def run(args):
+    with open(args.fleet) as f:
+        collars = json.load(f)[:args.collars or None]
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    fleet = Fleet(FeatureModel(pd.read_csv(FLEET_CSV)), collars, args, rng)
+    stats = Stats()
+    generator = LoadGenerator(args, fleet, stats)
+    mode = await generator.detect_mode()
+    print(f"Driving {fleet.n} collars ({mode} mode), {args.dashboards} dashboards for {args.duration}s")
+
+    stop = asyncio.Event()
+    started = time.monotonic()
+    workers = [asyncio.create_task(generator.drive_collars(mode, stop))]
+    workers += [asyncio.create_task(generator.dashboard(i, stop)) for i in range(args.dashboards)]
+
+    deadline = started + args.duration
+    while time.monotonic() < deadline:
+        await asyncio.sleep(min(args.report_every, max(0.0, deadline - time.monotonic())))
+        report = stats.report(time.monotonic() - started)
+        print(
+            f"[{report['elapsed_seconds']}s] {report['readings_per_second']} readings/s, "
+            f"in flight {stats.in_flight}, status {report['status']}, errors {report['errors']}, "
+            f"ws open {stats.ws_open}"
+        )
+
+    stop.set()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await generator.close()
+    report = {"mode": mode, "collars": fleet.n, "dashboards": args.dashboards, **stats.report(time.monotonic() - started)}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+async def setup(args):
+    """Register dogs and collars through the API and save them as a fleet file."""
+    model = FeatureModel(pd.read_csv(FLEET_CSV))
+    rng = np.random.default_rng(args.seed)
+    semaphore = asyncio.Semaphore(args.max_in_flight)
+    fleet = []
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        async def register(i: int):
+            age, sex, sterilized = model.profiles[rng.integers(0, len(model.profiles))]
+            async with semaphore:
+                dog = await client.post("/dogs", json={
+                    "name": f"sim-{i}",
+                    "age_years": int(round(age)),
+                    "sex": Sex(int(sex)).name,
+                    "sterilization_status": SterilizationStatus(int(sterilized)).name
+                })
+                dog.raise_for_status()
+                dog_id = dog.json()["id"]
+                collar = await client.post("/collars", json={"device_id": f"sim-{uuid.uuid4().hex}", "dog_id": dog_id})
+                collar.raise_for_status()
+            fleet.append({"dog_id": dog_id, "collar_id": collar.json()["id"]})
+
+        await asyncio.gather(*(register(i) for i in range(args.collars)))
+
+    with open(args.fleet, "w") as f:
+        json.dump(fleet, f)
+    print(f"Registered {len(fleet)} collars in {args.fleet}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic collar fleet and load generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--url", default="http://localhost:8000")
+    common.add_argument("--fleet", default="fleet.json", help="dog/collar ids written by setup")
+    common.add_argument("--collars", type=int, default=0, help="number of collars (run: 0 = whole fleet file)")
+    common.add_argument("--max-in-flight", type=int, default=256)
+    common.add_argument("--timeout", type=float, default=30.0)
+    common.add_argument("--seed", type=int, default=42)
+
+    commands.add_parser("setup", parents=[common], help="register a fleet through the API")
+
+    run_parser = commands.add_parser("run", parents=[common], help="drive the fleet against the API")
+    run_parser.add_argument("--mode", choices=["auto", "batch", "single"], default="auto")
+    run_parser.add_argument("--duration", type=float, default=300.0, help="seconds to run")
+    run_parser.add_argument("--sample-interval", type=float, default=5.0, help="seconds between readings per collar")
+    run_parser.add_argument("--upload-interval", type=float, default=30.0, help="seconds between uploads per collar")
+    run_parser.add_argument("--episode-every", type=float, default=1800.0, help="mean seconds between behavior episodes")
+    run_parser.add_argument("--episode-minutes", type=float, default=3.0, help="mean episode length")
+    run_parser.add_argument("--outage-every", type=float, default=3600.0, help="mean seconds between outages per collar")
+    run_parser.add_argument("--outage-seconds", type=float, default=120.0, help="mean outage length")
+    run_parser.add_argument("--max-backlog", type=int, default=720, help="readings a collar buffers while offline")
+    run_parser.add_argument("--storm-every", type=float, default=0.0, help="seconds between reconnect storms (0 = none)")
+    run_parser.add_argument("--storm-fraction", type=float, default=0.3, help="share of collars and dashboards dropped per storm")
+    run_parser.add_argument("--storm-seconds", type=float, default=60.0, help="how long storm-dropped collars stay offline")
+    run_parser.add_argument("--wire-max-batch", type=int, default=5000, help="server WIRE_MAX_BATCH")
+    run_parser.add_argument("--dashboards", type=int, default=0, help="websocket dashboard clients")
+    run_parser.add_argument("--ramp-seconds", type=float, default=10.0, help="spread dashboard connects over this long")
+    run_parser.add_argument("--report-every", type=float, default=10.0)
+    run_parser.add_argument("--output", help="write the final report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "setup":
+        args.collars = args.collars or 1000
+        asyncio.run(setup(args))
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
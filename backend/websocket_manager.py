@@ -1,8 +1,10 @@
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import List, Dict, Optional
 import json
 import asyncio
 
+from metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_SEND_QUEUE
+
 class ConnectionManager:
     def __init__(self):
         # Store active connections by client_id
@@ -12,28 +14,46 @@ class ConnectionManager:
     
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
+        previous = self.active_connections.get(client_id)
         self.active_connections[client_id] = websocket
+        if previous is None:
+            WEBSOCKET_CONNECTIONS.inc()
+        else:
+            # A reconnect replaces the client's old socket rather than adding one
+            try:
+                await previous.close()
+            except Exception as e:
+                print(f"Error closing replaced connection for {client_id}: {e}")
         print(f"Client {client_id} connected. Total connections: {len(self.active_connections)}")
     
-    def disconnect(self, client_id: str):
+    def is_current(self, client_id: str, websocket: WebSocket) -> bool:
+        return self.active_connections.get(client_id) is websocket
+    
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        """Forget a client; given its socket, only if that socket hasn't been replaced by a reconnect."""
+        if websocket is not None and not self.is_current(client_id, websocket):
+            return
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+            WEBSOCKET_CONNECTIONS.dec()
             # Remove from dog connections
             for dog_id, clients in self.dog_connections.items():
                 if client_id in clients:
                     clients.remove(client_id)
             print(f"Client {client_id} disconnected. Total connections: {len(self.active_connections)}")
     
+    async def _send(self, websocket: WebSocket, text: str):
+        with WEBSOCKET_SEND_QUEUE.track_inprogress():
+            await websocket.send_text(text)
+    
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            print(f"Error sending personal message: {e}")
+        # Send errors reach the caller: they are how a socket's handler finds out it closed
+        await self._send(websocket, message)
     
     async def send_to_client(self, client_id: str, message: dict):
         if client_id in self.active_connections:
             try:
-                await self.active_connections[client_id].send_text(json.dumps(message))
+                await self._send(self.active_connections[client_id], json.dumps(message))
             except Exception as e:
                 print(f"Error sending to client {client_id}: {e}")
                 # Remove disconnected client
@@ -41,9 +61,10 @@ class ConnectionManager:
     
     async def broadcast_to_all(self, message: dict):
         disconnected_clients = []
-        for client_id, connection in self.active_connections.items():
+        # A snapshot: clients can connect or disconnect while a send is awaited
+        for client_id, connection in list(self.active_connections.items()):
             try:
-                await connection.send_text(json.dumps(message))
+                await self._send(connection, json.dumps(message))
             except Exception as e:
                 print(f"Error broadcasting to client {client_id}: {e}")
                 disconnected_clients.append(client_id)
@@ -55,10 +76,10 @@ class ConnectionManager:
     async def send_to_dog_subscribers(self, dog_id: str, message: dict):
         if dog_id in self.dog_connections:
             disconnected_clients = []
-            for client_id in self.dog_connections[dog_id]:
+            for client_id in list(self.dog_connections[dog_id]):
                 if client_id in self.active_connections:
                     try:
-                        await self.active_connections[client_id].send_text(json.dumps(message))
+                        await self._send(self.active_connections[client_id], json.dumps(message))
                     except Exception as e:
                         print(f"Error sending to dog subscriber {client_id}: {e}")
                         disconnected_clients.append(client_id)
@@ -107,7 +128,8 @@ class ConnectionManager:
             "data": alert_data,
             "timestamp": alert_data.get("timestamp")
         }
-        await self.send_to_dog_subscribers(dog_id, message)
+        # Health alerts feed the dashboard, which doesn't subscribe per dog
+        await self.broadcast_to_all(message)
     
     def get_connection_count(self) -> int:
         return len(self.active_connections)
@@ -0,0 +1,155 @@
+"""Compact binary wire format for collar telemetry.
+
+A payload is an 8-byte header followed by ``count`` fixed-size records:
+
+    header  <2sBBI   magic b"SC", version, reserved, record count
+    record  see READING_DTYPE_V1 (66 bytes, little-endian, unpadded)
+
+Enum fields carry the integer codes from models.py and 255 means "not
+reported"; any other code outside the enum is treated the same, so it is
+neither scored nor stored. Optional floats use NaN. The dog is not on the wire - it is
+resolved from the collar through the CollarRegistry.
+"""
+import enum
+import struct
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from models import BodyPosture, TailPosition, EarPosition, VocalizationType, TimeOfDay
+
+MAGIC = b"SC"
+WIRE_VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+MISSING_CODE = 255
+
+READING_DTYPE_V1 = np.dtype([
+    ("collar_id", "S16"),             # raw UUID bytes
+    ("recorded_at", "<u4"),           # unix seconds, 0 = use server receive time
+    ("heart_rate_bpm", "<f4"),
+    ("hrv_rmssd", "<f4"),
+    ("body_temperature", "<f4"),
+    ("stress_cortisol", "<f4"),
+    ("body_posture", "u1"),
+    ("tail_position", "u1"),
+    ("ear_position", "u1"),
+    ("vocalization_type", "u1"),
+    ("time_of_day", "u1"),
+    ("other_dogs_nearby", "u1"),
+    ("human_proximity_meters", "<f4"),
+    ("gps_latitude", "<f8"),
+    ("gps_longitude", "<f8"),
+    ("gps_accuracy", "<f4"),
+])
+
+DTYPES = {1: READING_DTYPE_V1}
+
+ENUM_FIELDS = {
+    "body_posture": BodyPosture,
+    "tail_position": TailPosition,
+    "ear_position": EarPosition,
+    "vocalization_type": VocalizationType,
+    "time_of_day": TimeOfDay,
+}
+
+# uint8 code -> whether it is a member of the field's enum
+VALID_CODES = {}
+for _name, _enum_cls in ENUM_FIELDS.items():
+    VALID_CODES[_name] = np.zeros(256, dtype=bool)
+    VALID_CODES[_name][[member.value for member in _enum_cls]] = True
+
+FLOAT_FIELDS = (
+    "heart_rate_bpm", "hrv_rmssd", "body_temperature", "stress_cortisol",
+    "human_proximity_meters", "gps_latitude", "gps_longitude", "gps_accuracy",
+)
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def decode_batch(payload: bytes, max_records: Optional[int] = None) -> np.ndarray:
+    """Decode a payload into a structured array without copying the records."""
+    if len(payload) < HEADER.size:
+        raise WireFormatError("Payload shorter than header")
+
+    magic, version, _, count = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise WireFormatError("Bad magic")
+    dtype = DTYPES.get(version)
+    if dtype is None:
+        raise WireFormatError(f"Unsupported wire version {version}")
+    if max_records is not None and count > max_records:
+        raise WireFormatError(f"Batch of {count} readings exceeds limit of {max_records}")
+    if len(payload) != HEADER.size + count * dtype.itemsize:
+        raise WireFormatError(
+            f"Expected {HEADER.size + count * dtype.itemsize} bytes for {count} readings, got {len(payload)}"
+        )
+
+    return np.frombuffer(payload, dtype=dtype, count=count, offset=HEADER.size)
+
+
+def to_columns(records: np.ndarray) -> Dict[str, np.ndarray]:
+    """Float columns keyed by reading field, with missing or unknown enum codes and missing counts as NaN."""
+    columns = {name: records[name].astype(np.float64) for name in FLOAT_FIELDS}
+    for name in ENUM_FIELDS:
+        codes = records[name].astype(np.float64)
+        codes[~VALID_CODES[name][records[name]]] = np.nan
+        columns[name] = codes
+    others = records["other_dogs_nearby"].astype(np.float64)
+    others[records["other_dogs_nearby"] == MISSING_CODE] = np.nan
+    columns["other_dogs_nearby"] = others
+    return columns
+
+
+def enum_names(enum_cls) -> np.ndarray:
+    """Lookup table mapping every uint8 code to its enum name (None when unmapped)."""
+    table = np.full(256, None, dtype=object)
+    for member in enum_cls:
+        table[member.value] = member.name
+    return table
+
+
+def _enum_code(enum_cls, value) -> int:
+    if isinstance(value, enum_cls):
+        return value.value
+    if isinstance(value, int):
+        return value
+    # Names are shared by the models.py and schemas.py enums
+    return enum_cls[value.name if isinstance(value, enum.Enum) else value].value
+
+
+def encode_batch(readings: Iterable[dict], version: int = WIRE_VERSION) -> bytes:
+    """Encode reading dicts (schema field names, enum names or codes) into a payload.
+
+    Mostly useful for collar firmware reference, the simulator and benchmarks.
+    """
+    readings = list(readings)
+    dtype = DTYPES[version]
+    records = np.zeros(len(readings), dtype=dtype)
+
+    for i, reading in enumerate(readings):
+        record = records[i]
+        record["collar_id"] = uuid.UUID(reading["collar_id"]).bytes
+        recorded_at = reading.get("recorded_at")
+        if isinstance(recorded_at, datetime):
+            # Naive datetimes are UTC here, as everywhere else
+            if recorded_at.tzinfo is None:
+                recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+            recorded_at = recorded_at.timestamp()
+        record["recorded_at"] = int(recorded_at or 0)
+        for name in FLOAT_FIELDS:
+            value = reading.get(name)
+            record[name] = np.nan if value is None else value
+        for name, enum_cls in ENUM_FIELDS.items():
+            value = reading.get(name)
+            if value is None:
+                record[name] = MISSING_CODE
+            else:
+                record[name] = _enum_code(enum_cls, value)
+        others = reading.get("other_dogs_nearby")
+        record["other_dogs_nearby"] = MISSING_CODE if others is None else min(int(others), MISSING_CODE - 1)
+
+    return HEADER.pack(MAGIC, version, 0, len(readings)) + records.tobytes()
@@ -14,9 +14,30 @@ import {
   HealthMetricsData,
   DogFilters,
   SensorDataFilters,
-  InterventionFilters
+  InterventionFilters,
+  ExportFormat,
+  ExportJob,
+  SyncResponse,
+  CohortAnalytics,
+  CohortDimension
 } from '@/types';
 
+// Response of list endpoints called with layout=columnar
+interface ColumnarRows {
+  columns: string[];
+  rows: unknown[][];
+}
+
+function fromColumnar<T>({ columns, rows }: ColumnarRows): T[] {
+  return rows.map((row) => {
+    const item: Record<string, unknown> = {};
+    columns.forEach((column, i) => {
+      item[column] = row[i];
+    });
+    return item as T;
+  });
+}
+
 class ApiService {
   private api: AxiosInstance;
 
@@ -115,8 +136,11 @@ class ApiService {
 
   // Sensor data endpoints
   async getSensorData(dogId: string, filters?: SensorDataFilters): Promise<SensorData[]> {
-    const response = await this.api.get(`/sensor-data/${dogId}`, { params: filters });
-    return response.data;
+    // Columnar pages are about half the bytes; expand them back into objects here
+    const response = await this.api.get(`/sensor-data/${dogId}`, {
+      params: { ...filters, layout: 'columnar' },
+    });
+    return fromColumnar<SensorData>(response.data);
   }
 
   async getLatestSensorData(dogId: string): Promise<SensorData> {
@@ -140,6 +164,12 @@ class ApiService {
     return response.data;
   }
 
+  // Delta sync: pass the last cursor, repeat while has_more
+  async sync(since?: number, limit?: number): Promise<SyncResponse> {
+    const response = await this.api.get('/sync', { params: { since, limit } });
+    return response.data;
+  }
+
   // Analytics endpoints
   async getDashboardAnalytics(): Promise<DashboardAnalytics> {
     const response = await this.api.get('/analytics/dashboard');
@@ -160,8 +190,24 @@ class ApiService {
     return response.data;
   }
 
+  // where: e.g. { time_of_day: 'NIGHT', pack_isolation: true }
+  async getCohortAnalytics(
+    groupBy: CohortDimension[] = [],
+    where: Partial<Record<CohortDimension, string | boolean>> = {},
+    hours?: number
+  ): Promise<CohortAnalytics> {
+    const response = await this.api.get('/analytics/cohorts', {
+      params: {
+        group_by: groupBy.join(',') || undefined,
+        where: Object.entries(where).map(([name, value]) => `${name}:${value}`).join(',') || undefined,
+        hours
+      }
+    });
+    return response.data;
+  }
+
   // File upload endpoints
-  async uploadDogPhoto(dogId: string, file: File): Promise<{ photo_url: string }> {
+  async uploadDogPhoto(dogId: string, file: File): Promise<{ photo_url: string; thumbnail_url: string }> {
     const formData = new FormData();
     formData.append('photo', file);
     
@@ -173,21 +219,42 @@ class ApiService {
     return response.data;
   }
 
-  // Export endpoints
-  async exportDogData(dogId: string, format: 'csv' | 'pdf' = 'csv'): Promise<Blob> {
-    const response = await this.api.get(`/export/dog-data/${dogId}`, {
-      params: { format },
+  // Export endpoints: reports render in the background; poll the job, then download it
+  private async waitForExport(job: ExportJob, pollMs: number = 1000): Promise<Blob> {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, pollMs));
+      const response = await this.api.get(`/export/jobs/${job.id}`);
+      job = response.data;
+    }
+    if (job.status !== 'completed' || !job.download_url) {
+      throw new Error(job.error || 'Export failed');
+    }
+    const response = await this.api.get(job.download_url, {
       responseType: 'blob',
+      timeout: 0,
     });
     return response.data;
   }
 
-  async exportInterventions(format: 'csv' | 'pdf' = 'csv'): Promise<Blob> {
+  async exportDogData(
+    dogId: string,
+    format: ExportFormat = 'csv',
+    range: { start_time?: string; end_time?: string } = {}
+  ): Promise<Blob> {
+    const response = await this.api.get(`/export/dog-data/${dogId}`, {
+      params: { format, ...range },
+    });
+    return this.waitForExport(response.data);
+  }
+
+  async exportInterventions(
+    format: ExportFormat = 'csv',
+    filters: { dog_id?: string; start_time?: string; end_time?: string } = {}
+  ): Promise<Blob> {
     const response = await this.api.get('/export/interventions', {
-      params: { format },
-      responseType: 'blob',
+      params: { format, ...filters },
     });
-    return response.data;
+    return this.waitForExport(response.data);
   }
 
   // Health check
@@ -83,6 +83,7 @@ export interface Dog {
   medical_history?: string;
   vaccination_records?: string;
   photo_url?: string;
+  photo_thumbnail_url?: string;
   microchip_id?: string;
   owner_id: string;
   is_active: boolean;
@@ -214,13 +215,90 @@ export interface HealthMetricsData {
   avg_stress_level: number;
 }
 
+export interface HealthAlert {
+  id: string;
+  dog_id: string;
+  alert_type: 'heart_rate' | 'hrv' | 'temp_deviation' | 'cortisol';
+  message: string;
+  severity: 'low' | 'medium' | 'high' | 'critical';
+  value: number;
+  baseline: number;
+  z_score: number;
+  timestamp: string;
+  last_seen: string;
+}
+
+export type ExportFormat = 'csv' | 'pdf' | 'xlsx';
+
+export interface ExportJob {
+  id: string;
+  kind: 'dog-data' | 'interventions';
+  dog_id?: string;
+  format: ExportFormat;
+  start_time: string;
+  end_time: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  rows?: number;
+  error?: string;
+  created_at: string;
+  finished_at?: string;
+  download_url?: string;
+}
+
+// GET /sync: rows changed since the cursor; reset means reload the lists instead
+export interface SyncResponse {
+  reset: boolean;
+  cursor: number;
+  has_more: boolean;
+  dogs: Dog[];
+  collars: Collar[];
+  interventions: Intervention[];
+}
+
+// GET /analytics/cohorts: one entry per cohort, keyed by the group_by dimensions (null = unknown)
+export type CohortDimension =
+  | 'sex'
+  | 'sterilization_status'
+  | 'age_band'
+  | 'young_male_risk'
+  | 'time_of_day'
+  | 'aggression_level'
+  | 'pack_isolation'
+  | 'close_human';
+
+export interface CohortGroup {
+  [dimension: string]: string | boolean | number | null;
+  readings: number;
+  dogs: number;
+  avg_probability: number | null;
+  high_risk_rate: number;
+  interventions: number;
+  intervention_rate: number;
+}
+
+export interface CohortAnalytics {
+  group_by: CohortDimension[];
+  filters: Partial<Record<CohortDimension, string | boolean>>;
+  hours: number | null;
+  readings: number;
+  groups: CohortGroup[];
+  snapshot: {
+    readings: number;
+    dogs: number;
+    window_hours: number;
+    built_at: string;
+    refreshed_at: string;
+  };
+  query_ms: number;
+}
+
 export interface DashboardAnalytics {
   total_dogs: number;
   active_collars: number;
   interventions_today: number;
   avg_aggression_level: number;
   recent_interventions: Intervention[];
-  health_alerts: string[];
+  health_alerts: HealthAlert[];
 }
 
 // WebSocket message interfaces
@@ -246,11 +324,7 @@ export interface InterventionAlertMessage extends WebSocketMessage {
 export interface HealthAlertMessage extends WebSocketMessage {
   type: 'health_alert';
   dog_id: string;
-  data: {
-    alert_type: string;
-    message: string;
-    severity: 'low' | 'medium' | 'high' | 'critical';
-  };
+  data: HealthAlert;
 }
 
 // Chart data interfaces